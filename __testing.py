@@ -1,4 +1,5 @@
 import datetime
+import math
 import time
 
 import pandas
@@ -10,8 +11,14 @@ from helpers import solar_irradiance_estimator, astronomical_calculations
 from helpers import reflection_estimator
 from helpers import panel_temperature_estimator
 from helpers import output_estimator
+from helpers import fused_pipeline
+from helpers import uncertainty
+from helpers import shared_arrays
 
+import numpy
 import pandas as pd
+import pvlib.irradiance
+import pvlib.temperature
 
 from main import get_fmi_data
 
@@ -56,8 +63,8 @@ def __timed_combined_processing_of_data():
 
         print("-----Columns explained-----")
         print(
-            "[index(Time)]: Meteorological time. In meteorology, timestamp for 13:00 represents the time 12:00-13:00.")
-        print("[time]: This is time index shifted by 30min. More useful than the meteorological time for physics.")
+            "[index(Time)]: Meteorological time. In meteorology, timestamp for 13:00 represents the time 12:00-13:00."
+            " Interval centers are computed from the index when needed, see helpers/time_index.py")
         print("[dni, dhi, ghi]: Irradiance types, these can be used for estimating radiation from direct radiation,"
               " atmosphere scattered radiation and ground reflected radiation.")
         print("[albedo]: Ground reflectivity near installation. This is retrieved from fmi open data service. Should be"
@@ -199,7 +206,6 @@ def __debug_measure_function_speeds(day_range = 3, data_fmi = None):
     return data_pvlib
 
 
-__debug_measure_function_speeds(1)
 
 def __process_irradiance_data(meps_data: pandas.DataFrame):
     """
@@ -230,3 +236,600 @@ def __process_irradiance_data(meps_data: pandas.DataFrame):
     return data
 
 
+
+class __MockInfluxClient:
+    """
+    Answers InfluxDB queries of get_forecast.py from in-memory points. aggregateWindow() is emulated with windows
+    [start, stop) stamped with stop, same as InfluxDB. Points of a measurement are a series or a dict {site tag value:
+    series}, queries without a site filter get the points of all sites.
+    """
+
+    def __init__(self, points: dict):
+        self.points = points
+
+    def query_api(self):
+        return self
+
+    def query_data_frame(self, query, *args, **kwargs):
+        measurement = query.split('r._measurement == "')[1].split('"')[0]
+        series = self.points[measurement]
+        if isinstance(series, dict):
+            site = query.split('r.site == "')[1].split('"')[0] if 'r.site == "' in query else None
+            series = pd.concat(list(series.values())).sort_index() if site is None else series[site]
+        if "aggregateWindow(every: 1h" in query:
+            series = series.resample("1h", closed="left", label="right").mean().dropna()
+        return pd.DataFrame({"_time": series.index, "_value": series.to_numpy()})
+
+    def close(self):
+        pass
+
+
+def __debug_influx_hour_alignment():
+    """
+    Checks that forecasts and measurements read from InfluxDB are paired by hour. Forecast points are stamped with the
+    end of their interval exactly on the hour, measured samples are averaged by aggregateWindow(), both must give the
+    same hourly series when the forecast equals the measured hourly means. Daily errors of evaluate_forecast() are
+    grouped by hour start. Measurements of other sites are left out of calibration. Also checks calibration without
+    measurements.
+    """
+
+    import tempfile
+    import get_forecast
+    from helpers import bias_calibration, record_replay
+
+    start = pandas.Timestamp("2026-10-10", tz="UTC")
+    stop = start + pandas.Timedelta(days=2)
+    samples = pandas.date_range(start, stop, freq="10min", inclusive="left")
+    measured = pandas.Series(numpy.sin(numpy.arange(len(samples)) / 20.0) + 2.0, index=samples)
+
+    # hourly forecast stamped with hour end, 15 minute forecast repeats each hourly value four times
+    hourly = measured.resample("1h", closed="left", label="right").mean()
+    quarter_hourly = hourly.reindex(pandas.date_range(start + pandas.Timedelta(minutes=15), stop, freq="15min"),
+                                    method="bfill")
+
+    influx_client = record_replay.influx_client
+    try:
+        for forecast in [hourly, quarter_hourly]:
+            record_replay.influx_client = lambda *args, **kwargs: __MockInfluxClient(
+                {"pv_forecast": forecast, "pv_measured": measured})
+            forecast_read = get_forecast.read_from_influx("pv_forecast", "output", start, stop, interval_end=True)
+            measured_read = get_forecast.read_from_influx("pv_measured", "power", start, stop)
+            errors = (forecast_read - measured_read).dropna()
+            print("#---%s forecast points, %s common hours, largest error %s ---" %
+                  (len(forecast), len(errors), errors.abs().max()))
+            assert len(errors) == 48 and errors.index[0] == start + pandas.Timedelta(hours=1)
+            assert numpy.allclose(errors, 0.0)
+
+        # forecast one higher than measured, the first hour 00:00-01:00 belongs to the first day
+        record_replay.influx_client = lambda *args, **kwargs: __MockInfluxClient(
+            {"pv_forecast": hourly + 1.0, get_forecast.MEASURED_MEASUREMENT: {config.site_name: measured,
+                                                                              "other site": measured * 10.0}})
+        evaluation = get_forecast.evaluate_forecast(day_count=(pandas.Timestamp.now(tz="UTC").floor("D") - start).days)
+        print(evaluation)
+        assert list(evaluation.loc[[start.date(), (start + pandas.Timedelta(days=1)).date()], "hours"]) == [24, 24]
+        assert numpy.allclose(evaluation[["mae", "rmse", "bias"]].astype(float), 1.0)
+
+        # the measurement has points of another site ten times larger, forecast equal to measured keeps the defaults
+        record_replay.influx_client = lambda *args, **kwargs: __MockInfluxClient(
+            {"pv_forecast": hourly, get_forecast.MEASURED_MEASUREMENT: {config.site_name: measured,
+                                                                        "other site": measured * 10.0}})
+        with tempfile.TemporaryDirectory() as directory:
+            cache_file, config.calibration_cache_file = config.calibration_cache_file, directory + "/calibration.json"
+            try:
+                get_forecast.update_calibration()
+                factors = bias_calibration.get_site_factors()
+            finally:
+                config.calibration_cache_file = cache_file
+        assert numpy.allclose(factors, bias_calibration.DEFAULT_FACTORS, atol=1e-6)
+    finally:
+        record_replay.influx_client = influx_client
+
+    statistics = bias_calibration.daily_statistics(hourly.to_frame("site"), pandas.DataFrame({"site": []}),
+                                                   pandas.Series({"site": 1.0}))
+    assert statistics == {}
+
+
+def __debug_compare_fused_pipeline(day_range=3, backend="numpy"):
+    """
+    Equivalence test for helpers/fused_pipeline.py. Runs both the step by step pipeline and the fused pipeline with the
+    same clear sky input and checks that the outputs match.
+    """
+
+    date_start = datetime.datetime(2024, 6, 12)
+    data = solar_irradiance_estimator.get_solar_irradiance(date_start, day_count=day_range, model="pvlib")
+    data = helpers.panel_temperature_estimator.add_dummy_wind_and_temp(data, config.wind_speed, config.air_temp)
+
+    time_1 = time.time()
+    data_fused = fused_pipeline.process_irradiance_df(data.copy(), backend=backend)
+    time_2 = time.time()
+    data_steps = __process_irradiance_data(data.copy())
+    time_3 = time.time()
+
+    difference = (data_fused["output"] - data_steps["output"]).abs().max()
+    print("#---fused pipeline %s seconds ---" % round((time_2 - time_1), 3))
+    print("#---step by step pipeline %s seconds ---" % round((time_3 - time_2), 3))
+    print("#---largest output difference %s W ---" % difference)
+
+    assert numpy.allclose(data_fused["output"], data_steps["output"], rtol=1e-9, atol=1e-6)
+
+    return difference
+
+
+def __debug_uncertainty(day_range=3, count=200):
+    """
+    Checks helpers/uncertainty.py. Without parameter spread every sample equals the deterministic fused output, with
+    the configured spread the timing of count samples is compared to a single fused run.
+    """
+
+    date_start = datetime.datetime(2024, 6, 12)
+    data = solar_irradiance_estimator.get_solar_irradiance(date_start, day_count=day_range, model="pvlib")
+    data = helpers.panel_temperature_estimator.add_dummy_wind_and_temp(data, config.wind_speed, config.air_temp)
+
+    time_1 = time.time()
+    data_fused = fused_pipeline.process_irradiance_df(data.copy())
+    time_2 = time.time()
+    data_samples = uncertainty.add_output_quantiles_to_df(data.copy(), count=count)
+    time_3 = time.time()
+
+    no_spread = {name: 0.0 for name in config.uncertainty_std}
+    data_no_spread = uncertainty.add_output_quantiles_to_df(data.copy(), count=3, std=no_spread)
+
+    print("#---single fused run %s seconds ---" % round((time_2 - time_1), 3))
+    print("#---%s samples %s seconds ---" % (count, round((time_3 - time_2), 3)))
+    print(data_samples[["output_q10", "output_q50", "output_q90"]].describe())
+
+    for quantile in config.uncertainty_quantiles:
+        column = uncertainty.get_quantile_column(quantile)
+        assert numpy.allclose(data_no_spread[column], data_fused["output"], rtol=1e-9, atol=1e-6)
+
+    # site override of a single standard deviation, other values come from config.uncertainty_std
+    config.set_params_site({"site_name": "measured_tilt", "uncertainty_std": {"tilt": 0.0}})
+    try:
+        samples = uncertainty.sample_parameters(count=100)
+    finally:
+        config.set_params_site({})
+    assert numpy.all(samples["tilt"] == config.tilt) and numpy.std(samples["azimuth"]) > 0
+    assert config.uncertainty_std["tilt"] > 0
+
+
+def __debug_shared_fleet(site_count=100, workers=4, transport="shm"):
+    """
+    Checks helpers/shared_arrays.py. Outputs of random sites computed in worker processes from shared memory are
+    compared to the fused pipeline run in this process.
+    """
+
+    generator = numpy.random.default_rng(0)
+    sites = [{"site_name": "site" + str(number), "latitude": 60 + 8 * generator.random(),
+              "longitude": 21 + 8 * generator.random(), "tilt": 10 + 40 * generator.random(),
+              "azimuth": 90 + 180 * generator.random()} for number in range(site_count)]
+    weather = solar_irradiance_estimator.get_clear_sky_irradiance_for_sites(sites, datetime.datetime(2024, 6, 12), 3)
+
+    time_1 = time.time()
+    outputs = {}
+    for site in sites:
+        config.set_params_site(site)
+        outputs[site["site_name"]] = fused_pipeline.process_irradiance_df(weather[site["site_name"]].copy())["output"]
+    config.set_params_site({})
+    time_2 = time.time()
+    outputs_shared = shared_arrays.compute_fleet_output(sites, weather, workers, transport)
+    time_3 = time.time()
+
+    print("#---single process %s seconds ---" % round((time_2 - time_1), 3))
+    print("#---%s workers with %s transport %s seconds ---" % (workers, transport, round((time_3 - time_2), 3)))
+
+    for site_name, output in outputs.items():
+        assert numpy.allclose(outputs_shared[site_name], output.to_numpy(), rtol=1e-9, atol=1e-6)
+
+
+def __debug_compare_perez(day_range=30):
+    """
+    Checks that irradiance_transpositions.get_perez_sky_diffuse() matches pvlib.irradiance.perez for a grid of
+    panel orientations and compares the runtimes.
+    """
+
+    date_start = datetime.datetime(2024, 3, 1)
+    data = solar_irradiance_estimator.get_solar_irradiance(date_start, day_count=day_range, model="pvlib")
+    geometry = astronomical_calculations.get_solar_geometry(data.index)
+
+    tilts, azimuths = numpy.meshgrid(numpy.arange(0, 91, 15), numpy.arange(90, 271, 30), indexing="ij")
+
+    time_1 = time.time()
+    native = helpers.irradiance_transpositions.get_perez_sky_diffuse(data["dhi"].to_numpy(), data["dni"].to_numpy(),
+                                                                     geometry, tilts, azimuths)
+    time_2 = time.time()
+    reference = numpy.empty_like(native)
+    for i in numpy.ndindex(tilts.shape):
+        reference[i] = pvlib.irradiance.perez(tilts[i], azimuths[i], data["dhi"].to_numpy(), data["dni"].to_numpy(),
+                                              geometry["dni_extra"], geometry["apparent_zenith"], geometry["azimuth"],
+                                              geometry["airmass"])
+    time_3 = time.time()
+
+    print("#---native perez for %s orientations %s seconds ---" % (tilts.size, round((time_2 - time_1), 3)))
+    print("#---pvlib perez for %s orientations %s seconds ---" % (tilts.size, round((time_3 - time_2), 3)))
+    print("#---largest difference %s W ---" % numpy.nanmax(numpy.abs(native - reference)))
+
+    assert numpy.allclose(native, reference, rtol=1e-9, atol=1e-9, equal_nan=True)
+
+
+def __debug_scenario_alignment(day_range=2):
+    """
+    Checks helpers/scenario_pipeline.py with an FMI open data shaped scenario: naive UTC timestamps and hourly means
+    labeled with the interval end. Clear sky rows are moved to half past each hour and copied as FMI rows, evaluated on
+    a grid of the half hour instants both scenarios must give the same output.
+    """
+
+    from helpers import scenario_pipeline, time_index
+
+    date_start = datetime.datetime(2024, 6, 12)
+    data_centers = solar_irradiance_estimator.get_solar_irradiance(date_start, day_count=day_range, model="pvlib")
+    grid = data_centers.index + pandas.Timedelta(minutes=30)
+    data_centers.index = grid
+
+    # fmi shaped frame, row 12:00 holds the values of 11:30
+    data_fmi = data_centers[["dni", "dhi", "ghi"]].copy()
+    data_fmi.index = (grid + pandas.Timedelta(minutes=30)).tz_convert(None)
+    data_fmi.attrs = {time_index.LABEL_KEY: "end", time_index.RESOLUTION_KEY: 60}
+
+    results = scenario_pipeline.evaluate_scenarios({"clear_sky": data_centers, "fmi": data_fmi}, times=grid)
+    difference = (results["output_fmi"] - results["output_clear_sky"]).abs().max()
+    print("#---largest output difference %s W ---" % difference)
+    assert results["output_fmi"].notna().all()
+    assert numpy.allclose(results["output_fmi"], results["output_clear_sky"], rtol=1e-9, atol=1e-6)
+
+
+def __debug_scheduler_with_mock_wfs(polls=10):
+    """
+    Runs scheduler.py against a local mock WFS server. The mock publishes a model run and a newer one on the sixth poll,
+    the scheduler should process both exactly once after the debounce period. Sites are only collected, no forecasts
+    are generated.
+    """
+
+    import http.server
+    import os
+    import tempfile
+    import threading
+    import scheduler
+
+    origin_times = ["2024-06-12T06:00:00Z"] * 5 + ["2024-06-12T09:00:00Z"]
+    requests = []
+
+    class MockWFSHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests.append(self.path)
+            origin = origin_times[min(len(requests), len(origin_times)) - 1]
+            body = ('<wfs:FeatureCollection xmlns:wfs="http://www.opengis.net/wfs/2.0" '
+                    'xmlns:om="http://www.opengis.net/om/2.0" xmlns:gml="http://www.opengis.net/gml/3.2">'
+                    '<wfs:member><om:resultTime><gml:TimeInstant><gml:timePosition>' + origin +
+                    '</gml:timePosition></gml:TimeInstant></om:resultTime></wfs:member>'
+                    '</wfs:FeatureCollection>').encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/xml")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.HTTPServer(("127.0.0.1", 0), MockWFSHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    processed_sites = []
+    sites = [{"site_name": "low", "priority": 2}, {"site_name": "none"}, {"site_name": "high", "priority": 1}]
+
+    with tempfile.TemporaryDirectory() as directory:
+        state_file = os.path.join(directory, "scheduler_state.json")
+        processed = scheduler.run_scheduler(poll_interval=0.05, debounce=0.08, sites=sites, max_polls=polls,
+                                            base_url="http://127.0.0.1:" + str(server.server_port) + "/wfs",
+                                            action=lambda ordered: processed_sites.append(
+                                                [site["site_name"] for site in ordered]),
+                                            state_file=state_file)
+    server.shutdown()
+
+    print("#---processed model runs %s ---" % processed)
+    print("#---site order %s ---" % processed_sites)
+
+    assert [str(origin) for origin in processed] == ["2024-06-12 06:00:00+00:00", "2024-06-12 09:00:00+00:00"]
+    assert processed_sites[0] == ["high", "low", "none"]
+
+
+def __debug_fleet_state_update():
+    """
+    Checks helpers/fleet_aggregation.py with two model runs about a day apart. Hours before the second run keep the values
+    of the first run, aggregates equal a full aggregation of the merged forecasts and only the hours of the second run
+    are listed as changed. Moving a site to another group and removing a site change both groups at all hours.
+    """
+
+    from helpers import fleet_aggregation
+
+    site_params = [{"site_name": "a", "region": "r1"}, {"site_name": "b", "region": "r1"},
+                   {"site_name": "c", "region": "r2"}]
+
+    def forecasts(first_time, values):
+        times = pandas.date_range(first_time, periods=48, freq="1h", tz="UTC")
+        return {site: pandas.DataFrame({"endTime": times, "output": value}) for site, value in values.items()}
+
+    first_run = forecasts("2026-10-18 00:00", {"a": 1.0, "b": 2.0, "c": 4.0})
+    second_run = forecasts("2026-10-19 05:00", {"a": 10.0, "b": 20.0})
+
+    state = fleet_aggregation.create_fleet_state(first_run, levels=["region"], site_params=site_params)
+    state = fleet_aggregation.update_fleet_state(state, second_run, site_params=site_params)
+    region = state["aggregates"]["region"]
+
+    merged = {site: pandas.concat([first_run[site], second_run.get(site, first_run[site].iloc[0:0])])
+              for site in first_run}
+    expected = fleet_aggregation.create_fleet_state(merged, levels=["region"], site_params=site_params)
+    changed = fleet_aggregation.get_changed_aggregates(state)["region"]
+
+    print(region.loc[["2026-10-18 05:00", "2026-10-19 05:00", "2026-10-20 05:00"]])
+    assert region.loc[pandas.Timestamp("2026-10-18 05:00", tz="UTC"), "r1"] == 3.0
+    assert region.loc[pandas.Timestamp("2026-10-20 05:00", tz="UTC"), "r1"] == 30.0
+    assert numpy.allclose(region[expected["aggregates"]["region"].columns], expected["aggregates"]["region"])
+    assert len(changed.index) == 48 and changed.index[0] == pandas.Timestamp("2026-10-19 05:00", tz="UTC")
+    assert state["changed"]["region"] == ["r1"]
+    days = fleet_aggregation.get_changed_aggregates(state, whole_days=True)["region"]
+    assert len(days.index) == 53 and days.index[0] == pandas.Timestamp("2026-10-19 00:00", tz="UTC")
+
+    # site b moves to region r2 and site a leaves the fleet, both regions are summed again from the matrix
+    moved_params = [{"site_name": "b", "region": "r2"}, {"site_name": "c", "region": "r2"}]
+    state = fleet_aggregation.update_fleet_state(state, forecasts("2026-10-19 05:00", {"c": 4.0}), moved_params)
+    region = state["aggregates"]["region"]
+    assert state["sites"] == ["b", "c"] and numpy.allclose(region["r1"], 0.0)
+    assert region.loc[pandas.Timestamp("2026-10-18 05:00", tz="UTC"), "r2"] == 6.0
+    assert region.loc[pandas.Timestamp("2026-10-20 05:00", tz="UTC"), "r2"] == 24.0
+    assert sorted(state["changed"]["region"]) == ["r1", "r2"] and len(state["changed_times"]) == len(state["times"])
+
+    # rolling window, a run a month later drops the old hours
+    state = fleet_aggregation.update_fleet_state(state, forecasts("2026-11-19 00:00", {"c": 5.0}), site_params)
+    assert state["times"][0] >= pandas.Timestamp("2026-11-19", tz="UTC") - pandas.Timedelta(days=config.fleet_state_days)
+    assert state["matrix"].shape[1] == len(state["times"]) == len(state["aggregates"]["region"].index)
+
+
+def __debug_compare_temperature_models(row_count=1000000, day_range=3):
+    """
+    Benchmark and check of the temperature models of helpers/panel_temperature_estimator.py. Times each vectorized
+    model and all models in one pass against a row by row loop of the King model, compares the models with their pvlib
+    implementations and checks that both fused pipeline backends give the same output with each model.
+    """
+    generator = numpy.random.default_rng(0)
+    absorbed = generator.uniform(0, 1000, row_count)
+    wind = generator.uniform(0, 15, row_count)
+    air_temp = generator.uniform(-20, 35, row_count)
+    wind_speed = panel_temperature_estimator.get_wind_at_module_height(wind, config.module_elevation)
+
+    # row by row loop over a subset, scaled to the full row count
+    loop_count = min(row_count, 10000)
+    time_1 = time.time()
+    [absorbed[i] * math.exp(panel_temperature_estimator.KING_A + panel_temperature_estimator.KING_B * wind_speed[i])
+     + air_temp[i] for i in range(loop_count)]
+    loop_time = (time.time() - time_1) * row_count / loop_count
+    print("#---row by row king %s seconds ---" % round(loop_time, 3))
+
+    for model in panel_temperature_estimator.TEMPERATURE_MODELS:
+        time_1 = time.time()
+        panel_temperature_estimator.temperature_of_module(absorbed, wind, config.module_elevation, air_temp, model)
+        print("#---%s %s seconds ---" % (model, round(time.time() - time_1, 3)))
+
+    time_1 = time.time()
+    temperatures = panel_temperature_estimator.get_module_temperatures(absorbed, wind, config.module_elevation,
+                                                                        air_temp)
+    print("#---all models in one pass %s seconds ---" % round(time.time() - time_1, 3))
+
+    references = {"king": pvlib.temperature.sapm_module(absorbed, air_temp, wind_speed,
+                                                        panel_temperature_estimator.KING_A,
+                                                        panel_temperature_estimator.KING_B),
+                  "sapm": pvlib.temperature.sapm_cell(absorbed, air_temp, wind_speed, panel_temperature_estimator.KING_A,
+                                                      panel_temperature_estimator.KING_B,
+                                                      panel_temperature_estimator.SAPM_DELTA_T),
+                  "faiman": pvlib.temperature.faiman(absorbed, air_temp, wind_speed,
+                                                     panel_temperature_estimator.FAIMAN_U0,
+                                                     panel_temperature_estimator.FAIMAN_U1),
+                  "pvsyst": pvlib.temperature.pvsyst_cell(absorbed, air_temp, wind_speed,
+                                                          panel_temperature_estimator.PVSYST_U_C,
+                                                          panel_temperature_estimator.PVSYST_U_V,
+                                                          panel_temperature_estimator.PVSYST_MODULE_EFFICIENCY,
+                                                          panel_temperature_estimator.PVSYST_ALPHA_ABSORPTION)}
+    for model, reference in references.items():
+        print("#---%s mean %s C, largest difference to pvlib %s C ---" %
+              (model, round(temperatures[model].mean(), 2), numpy.abs(temperatures[model] - reference).max()))
+        assert numpy.allclose(temperatures[model], reference, rtol=1e-9, atol=1e-9)
+
+    date_start = datetime.datetime(2024, 6, 12)
+    data = solar_irradiance_estimator.get_solar_irradiance(date_start, day_count=day_range, model="pvlib")
+    geometry = astronomical_calculations.get_solar_geometry(data.index)
+    inputs = [data["dni"].to_numpy(), data["dhi"].to_numpy(), data["ghi"].to_numpy(),
+              numpy.full(len(data.index), config.albedo), numpy.full(len(data.index), config.air_temp),
+              numpy.full(len(data.index), config.wind_speed)]
+    for model in panel_temperature_estimator.TEMPERATURE_MODELS:
+        output_numpy = fused_pipeline.compute_output(*inputs, geometry, temperature_model=model)
+        output_numba = fused_pipeline.compute_output(*inputs, geometry, backend="numba", temperature_model=model)
+        print("#---%s energy %s kWh ---" % (model, round(output_numpy.sum() * config.data_resolution / 60000, 2)))
+        assert numpy.allclose(output_numpy, output_numba, rtol=1e-9, atol=1e-6)
+
+
+
+def __debug_horizon_shading(day_range=3, profile=None):
+    """
+    Checks helpers/horizon_shading.py. The step by step pipeline and both fused backends are run with a horizon
+    profile and compared, shading can only lower the output of an unobstructed horizon.
+    """
+
+    if profile is None:
+        profile = {0: 5, 45: 20, 90: 25, 135: 10, 180: 5, 225: 15, 270: 30, 315: 10}
+
+    date_start = datetime.datetime(2024, 3, 20)
+    data = solar_irradiance_estimator.get_solar_irradiance(date_start, day_count=day_range, model="pvlib")
+    data = helpers.panel_temperature_estimator.add_dummy_wind_and_temp(data, config.wind_speed, config.air_temp)
+
+    horizon_profile = config.horizon_profile
+    try:
+        config.horizon_profile = None
+        data_open = fused_pipeline.process_irradiance_df(data.copy())
+        config.horizon_profile = profile
+        time_1 = time.time()
+        data_fused = fused_pipeline.process_irradiance_df(data.copy())
+        time_2 = time.time()
+        data_numba = fused_pipeline.process_irradiance_df(data.copy(), backend="numba")
+        data_steps = __process_irradiance_data(data.copy())
+    finally:
+        config.horizon_profile = horizon_profile
+
+    resolution_hours = config.data_resolution / 60000
+    print("#---fused pipeline with horizon %s seconds ---" % round((time_2 - time_1), 3))
+    print("#---energy %s kWh unobstructed, %s kWh with horizon ---" %
+          (round(data_open["output"].sum() * resolution_hours, 2),
+           round(data_fused["output"].sum() * resolution_hours, 2)))
+
+    assert numpy.allclose(data_fused["output"], data_steps["output"], rtol=1e-9, atol=1e-6)
+    assert numpy.allclose(data_fused["output"], data_numba["output"], rtol=1e-9, atol=1e-6)
+    assert (data_fused["output"] <= data_open["output"] + 1e-6).all()
+    assert data_fused["output"].sum() < data_open["output"].sum()
+
+
+def __debug_batch_plot_memory(render_count=30):
+    """
+    Checks that repeated renderings of the batch plot template do not accumulate artists, bar containers or other
+    objects.
+    """
+
+    import gc
+    import tempfile
+
+    # plots mark the current time, data starts from today so that the time axis stays short
+    today = datetime.date.today()
+    date_start = datetime.datetime(today.year, today.month, today.day)
+    data_pvlib = solar_irradiance_estimator.get_solar_irradiance(date_start, day_count=3, model="pvlib")
+    data_pvlib = fused_pipeline.process_irradiance_df(data_pvlib)
+    data_fmi = data_pvlib[data_pvlib.index.minute == 0].copy()
+
+    save_directory = config.save_directory
+    counts = []
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            config.save_directory = directory + "/"
+            for number in range(render_count):
+                plotter.__render_batch_chunk([("site" + str(number % 3), data_fmi, data_pvlib, config.data_resolution)])
+                a1 = plotter.__batch_template["a1"]
+                gc.collect()
+                counts.append((len(a1.containers), len(a1.patches), len(a1.texts), len(gc.get_objects())))
+    finally:
+        config.save_directory = save_directory
+
+    print("#---containers, patches, texts and objects after first and last rendering %s %s ---" %
+          (counts[1], counts[-1]))
+    assert counts[1][:3] == counts[-1][:3] and counts[-1][0] == 2
+    assert counts[-1][3] <= counts[1][3] * 1.01
+
+
+def __debug_fmi_archive_origin_time():
+    """
+    Checks that helpers/fmi_archive.py stores the om:resultTime origin time of FMI open data responses. A replayed
+    response gets a parsed XML root with a late model run, which an estimate from the fetch time would miss. Without the
+    root the origin time is estimated. Needs config.record_replay_mode = "replay" and a fixture of the configured point.
+    """
+
+    import tempfile
+    import xml.etree.ElementTree
+    from helpers import _meps_data_loader, fmi_archive, record_replay
+
+    origin = "2024-06-12T03:00:00Z"
+    root = xml.etree.ElementTree.fromstring(
+        '<wfs:FeatureCollection xmlns:wfs="http://www.opengis.net/wfs/2.0" xmlns:om="http://www.opengis.net/om/2.0" '
+        'xmlns:gml="http://www.opengis.net/gml/3.2"><wfs:member><om:resultTime><gml:TimeInstant><gml:timePosition>' +
+        origin + '</gml:timePosition></gml:TimeInstant></om:resultTime></wfs:member></wfs:FeatureCollection>')
+
+    latlon = str(config.latitude) + "," + str(config.longitude)
+    start = datetime.datetime.now(datetime.timezone.utc).replace(minute=0, second=0, microsecond=0)
+    download_stored_query = record_replay.download_stored_query
+    archive_mode, archive_directory = config.fmi_archive_mode, config.fmi_archive_directory
+
+    def with_root(query_id, args=None):
+        result = download_stored_query(query_id, args=args)
+        result._xml = root
+        return result
+
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            config.fmi_archive_mode, config.fmi_archive_directory = "append", directory
+            record_replay.download_stored_query = with_root
+            _meps_data_loader.collect_fmi_opendata(latlon, start, start + datetime.timedelta(days=1))
+            record_replay.download_stored_query = download_stored_query
+            _meps_data_loader.collect_fmi_opendata(latlon, start, start + datetime.timedelta(days=1))
+            runs = fmi_archive.list_runs(latlon)
+    finally:
+        record_replay.download_stored_query = download_stored_query
+        config.fmi_archive_mode, config.fmi_archive_directory = archive_mode, archive_directory
+
+    print(runs[["origin_time", "fetch_time"]])
+    assert runs["origin_time"].iloc[0] == pandas.Timestamp(origin)
+    assert runs["origin_time"].iloc[1] == fmi_archive.estimate_origin_time(runs["fetch_time"].iloc[1])
+
+
+def __debug_nowcast(site_count=100):
+    """
+    Checks nowcast.py with forecast csv files and a measurement file in config.nowcast_measurement_file. Measured output
+    equal to the forecast leaves the forecast unchanged, and nowcast intervals end at multiples of
+    config.nowcast_resolution with the clear sky instants at their centers. Parameters of the last site are not left
+    active.
+    """
+
+    import tempfile
+    import nowcast
+
+    generator = numpy.random.default_rng(0)
+    sites = [{"site_name": "site" + str(number), "latitude": config.latitude + generator.random() - 0.5,
+              "longitude": config.longitude + generator.random() - 0.5, "tilt": 10 + 40 * generator.random(),
+              "azimuth": 150 + 60 * generator.random()} for number in range(site_count)]
+    # midday of the configured point, clear sky output is well above the thresholds of nowcast.blend()
+    today = pandas.Timestamp(datetime.date.today(), tz="UTC")
+    now = today + pandas.Timedelta(hours=12 - config.longitude / 15, minutes=3)
+
+    save_directory, measurement_file = config.save_directory, config.nowcast_measurement_file
+    tilt, azimuth = config.tilt, config.azimuth
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            config.save_directory = directory + "/"
+            config.nowcast_measurement_file = directory + "/measured.csv"
+            state = nowcast.create_nowcast_state(sites)
+            nowcast.nowcast_cycle(state, now, measurements=pandas.DataFrame(columns=["time", "power"]))
+            # latest clear sky instant, the interpolation of the forecast is exact there
+            measured_time = state["times"][state["times"] <= now][-1]
+
+            # hourly forecasts at 60 % of clear sky output, measured output equals the forecast at the measurement time
+            end_times = pandas.date_range(today, periods=48, freq="1h") + pandas.Timedelta(hours=1)
+            centers = (end_times - pandas.Timedelta(minutes=30)).as_unit("s").asi8.astype(float)
+            measured = []
+            for number, site in enumerate(sites):
+                output = 0.6 * numpy.interp(centers, state["seconds"], state["clear_sky"][number])
+                pandas.DataFrame({"endTime": end_times, "output": output}).to_csv(
+                    config.save_directory + site["site_name"] + "-forecast.csv", index=False)
+                power = numpy.interp(measured_time.timestamp(), centers, output) / 1000.0
+                measured.append({"time": measured_time, "site": site["site_name"], "power": power})
+            pandas.DataFrame(measured).to_csv(config.nowcast_measurement_file, index=False)
+
+            time_1 = time.time()
+            nowcasts = nowcast.nowcast_cycle(state, now)
+            time_2 = time.time()
+            nowcast.nowcast_cycle(state, now)
+            time_3 = time.time()
+    finally:
+        config.save_directory, config.nowcast_measurement_file = save_directory, measurement_file
+
+    print("#---first cycle with forecast files %s seconds, cached cycle %s seconds ---" %
+          (round(time_2 - time_1, 3), round(time_3 - time_2, 3)))
+    # site parameters are reset after the clear sky output of the sites
+    assert (config.tilt, config.azimuth) == (tilt, azimuth)
+    horizon_end = now + pandas.Timedelta(hours=config.nowcast_hours)
+    steps = (state["interval_ends"] > now) & (state["interval_ends"] <= horizon_end)
+    for number, site in enumerate(sites):
+        result = nowcasts[site["site_name"]]
+        assert numpy.allclose(result["output"], state["forecast"][number, steps], rtol=1e-9, atol=1e-6)
+        assert result["clear_sky_index"].notna().all()
+    result = nowcasts[sites[0]["site_name"]]
+    resolution = pandas.Timedelta(minutes=config.nowcast_resolution)
+    assert (result["endTime"] - result["startTime"] == resolution).all()
+    assert (pandas.DatetimeIndex(result["endTime"]) == pandas.DatetimeIndex(result["endTime"]).floor(resolution)).all()
+    assert (pandas.DatetimeIndex(result["startTime"]) + resolution / 2 == state["times"][steps]).all()
+
+
+if __name__ == '__main__':
+    __debug_measure_function_speeds(1)
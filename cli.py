@@ -0,0 +1,264 @@
+"""
+Command line interface of the program. Each subcommand imports and runs only the modules it needs, for example
+clear-sky does not import InfluxDB or plotting code and bench does not fetch FMI open data unless the selected check
+needs it.
+
+Subcommands:
+forecast: Forecast of a single site as in get_forecast.py, --fleet runs the fleet forecast of scheduler.py once and
+--fleet --stream writes site x day chunks as soon as they are computed, see get_forecast.stream_forecasts().
+clear-sky: Clear sky output of the coming days, saved as csv.
+backfill: Clear sky output, or output from archived FMI open data, of a past date range computed in chunks with the
+fused pipeline, saved as csv.
+plot: Fmi open and clear sky plot as in main.py.
+bench: Runs checks and benchmarks from __testing.py.
+profile: Runs another subcommand under the profiler of helpers/profiling.py.
+evaluate: Compares stored forecasts with measured production in InfluxDB.
+
+Installation parameters are taken from config.set_params_custom(), --site NAME uses a site of config.sites instead.
+
+Usage:
+python cli.py forecast
+python cli.py clear-sky --days 3 --site kuopio
+python cli.py backfill --start 2024-05-01 --days 90
+python cli.py profile --mode cprofile forecast
+"""
+
+import argparse
+import datetime
+import os
+import sys
+
+import config
+
+
+# checks of __testing.py runnable with bench, names map to the __debug_ functions
+BENCH_CHECKS = {"speeds": "__debug_measure_function_speeds", "fused": "__debug_compare_fused_pipeline",
+                "uncertainty": "__debug_uncertainty", "shared-fleet": "__debug_shared_fleet",
+                "perez": "__debug_compare_perez", "scheduler": "__debug_scheduler_with_mock_wfs",
+                "influx-hours": "__debug_influx_hour_alignment", "scenarios": "__debug_scenario_alignment",
+                "fleet-state": "__debug_fleet_state_update", "temperature": "__debug_compare_temperature_models",
+                "horizon": "__debug_horizon_shading", "plot-memory": "__debug_batch_plot_memory",
+                "fmi-origin": "__debug_fmi_archive_origin_time", "nowcast": "__debug_nowcast"}
+
+
+def main(arguments=None):
+    """
+    Parses command line arguments and runs the selected subcommand.
+    :param arguments: List of arguments, sys.argv[1:] by default.
+    """
+    parser = __build_parser()
+    args = parser.parse_args(arguments)
+
+    os.makedirs(config.save_directory, exist_ok=True)
+    if not __set_site(getattr(args, "site", None)):
+        sys.exit(1)
+
+    args.function(args)
+
+
+def __build_parser() -> argparse.ArgumentParser:
+    """
+    :return: Parser with all subcommands, args.function of parsed arguments is the handler of the subcommand.
+    """
+    parser = argparse.ArgumentParser(description="FMI open PV forecast command line interface.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    site = argparse.ArgumentParser(add_help=False)
+    site.add_argument("--site", default=None, help="site_name of a site in config.sites, config.set_params_custom() "
+                                                   "parameters by default")
+
+    forecast = subparsers.add_parser("forecast", parents=[site], help="generate forecast and write it to csv and "
+                                                                      "InfluxDB")
+    forecast.add_argument("--fleet", action="store_true", help="forecast all sites of config.sites")
+    forecast.add_argument("--days", type=int, default=3, help="day count of fleet forecasts")
+    forecast.add_argument("--stream", action="store_true", help="with --fleet, write site x day chunks as soon as "
+                                                                "they are computed")
+    forecast.set_defaults(function=__forecast)
+
+    clear_sky = subparsers.add_parser("clear-sky", parents=[site], help="clear sky output of the coming days")
+    clear_sky.add_argument("--days", type=int, default=3, help="day count starting from today")
+    clear_sky.set_defaults(function=__clear_sky)
+
+    backfill = subparsers.add_parser("backfill", parents=[site], help="clear sky output of a past date range")
+    backfill.add_argument("--start", required=True, type=datetime.date.fromisoformat, help="first day, YYYY-MM-DD")
+    backfill.add_argument("--days", type=int, default=30, help="day count starting from --start")
+    backfill.add_argument("--chunk", type=int, default=30, help="days computed at once")
+    backfill.add_argument("--model", default="pvlib", choices=["pvlib", "fmiopen"],
+                          help="fmiopen reads weather from the FMI open data archive, see helpers/fmi_archive.py")
+    backfill.add_argument("--as-of", default=None, help="with fmiopen, use only model runs with origin time at or before "
+                                                        "this UTC time")
+    backfill.set_defaults(function=__backfill)
+
+    plot = subparsers.add_parser("plot", parents=[site], help="plot fmi open and clear sky output")
+    plot.add_argument("--scenarios", action="store_true", help="evaluate both as scenarios of a single pipeline run")
+    plot.add_argument("--days", type=int, default=3, help="day count of --scenarios")
+    plot.set_defaults(function=__plot)
+
+    bench = subparsers.add_parser("bench", help="run checks and benchmarks of __testing.py")
+    bench.add_argument("checks", nargs="*", default=["speeds"],
+                       help="checks to run, speeds by default: " + ", ".join(BENCH_CHECKS))
+    bench.set_defaults(function=__bench)
+
+    evaluate = subparsers.add_parser("evaluate", parents=[site], help="compare stored forecasts with measured "
+                                                                      "production")
+    evaluate.add_argument("--days", type=int, default=14, help="complete days before today")
+    evaluate.set_defaults(function=__evaluate)
+
+    profile = subparsers.add_parser("profile", help="run a subcommand under the profiler")
+    profile.add_argument("--mode", default="sampling", choices=["sampling", "cprofile"])
+    profile.add_argument("target", nargs=argparse.REMAINDER, help="subcommand and its arguments")
+    profile.set_defaults(function=__profile, parser=parser)
+
+    return parser
+
+
+def __set_site(site_name) -> bool:
+    """
+    Sets installation parameters of the named site of config.sites, config.set_params_custom() if None.
+    :return: False if the site was not found.
+    """
+    if site_name is None:
+        config.set_params_custom()
+        return True
+
+    for site in config.sites:
+        if site["site_name"] == site_name:
+            config.set_params_site(site)
+            return True
+
+    print("Site '" + site_name + "' not found in config.sites, sites: " +
+          ", ".join(site["site_name"] for site in config.sites))
+    return False
+
+
+def __forecast(args):
+    if args.fleet and args.stream:
+        __stream_fleet_forecast(args.days)
+        return
+
+    if args.fleet:
+        import scheduler
+        scheduler.process_model_run(config.sites, args.days)
+        return
+
+    import get_forecast
+    get_forecast.run_forecast()
+
+
+def __stream_fleet_forecast(day_range):
+    """
+    Writes streamed fleet forecasts to csv files of each site, and to InfluxDB when InfluxDB is in use. Fleet aggregates
+    are updated from the chunks when the stream ends, as after the fleet forecast of scheduler.py.
+    """
+    import pandas
+    import get_forecast
+    import scheduler
+
+    outputs = {}
+    stream = __save_stream_chunks(get_forecast.stream_forecasts(config.sites, day_range), outputs)
+    if get_forecast.INFLUX_IN_USE:
+        # upsert deletes the forecast window of each site with one request when its first chunk arrives
+        get_forecast.write_stream_to_influx(stream, window=get_forecast.get_forecast_window(day_range))
+    else:
+        for _ in stream:
+            pass
+
+    scheduler.update_fleet_aggregates({site_name: pandas.concat(chunks, ignore_index=True)
+                                       for site_name, chunks in outputs.items()})
+
+
+def __save_stream_chunks(stream, outputs: dict):
+    """
+    Appends streamed chunks to the forecast csv file of their site, which nowcast.py reads, and passes them on.
+    :param stream: Iterator of (site_name, date, forecast dataframe) tuples from get_forecast.stream_forecasts().
+    :param outputs: Dict filled with {site_name: list of dataframes with the endTime and output columns of the chunks}
+    """
+    for site_name, day, forecast in stream:
+        path = os.path.join(config.save_directory, site_name + "-forecast.csv")
+        forecast.to_csv(path, float_format="%.2f", index=False, mode="a" if site_name in outputs else "w",
+                        header=site_name not in outputs)
+        outputs.setdefault(site_name, []).append(forecast[["endTime", "output"]])
+        print("Saved forecast of '" + site_name + "' for " + str(day) + " to: " + path)
+        yield site_name, day, forecast
+
+
+def __clear_sky(args):
+    import main
+    data = main.get_pvlib_data(args.days)
+    __save_csv(data, config.site_name + "-clear-sky.csv")
+
+
+def __backfill(args):
+    from helpers import fused_pipeline, solar_irradiance_estimator
+
+    if args.model == "fmiopen":
+        config.fmi_archive_mode = "read"
+        config.fmi_archive_as_of = args.as_of
+
+    # long ranges are computed in chunks to keep the memory use of irradiance dataframes bounded
+    chunks = []
+    for offset in range(0, args.days, args.chunk):
+        day_count = min(args.chunk, args.days - offset)
+        date_start = datetime.datetime.combine(args.start + datetime.timedelta(days=offset), datetime.time())
+        data = solar_irradiance_estimator.get_solar_irradiance(date_start, day_count=day_count, model=args.model)
+        chunks.append(fused_pipeline.process_irradiance_df(data)[["dni", "dhi", "ghi", "output"]])
+
+    import pandas
+    data = pandas.concat(chunks)
+    __save_csv(data, config.site_name + "-backfill-" + args.model + "-" + str(args.start) + "-" + str(args.days) + "d.csv")
+
+
+def __plot(args):
+    import main
+    if args.scenarios:
+        main.combined_processing_of_scenarios(args.days)
+    else:
+        main.combined_processing_of_data()
+
+
+def __bench(args):
+    unknown = [check for check in args.checks if check not in BENCH_CHECKS]
+    if len(unknown) > 0:
+        print("Unknown checks: " + ", ".join(unknown) + ", available checks: " + ", ".join(BENCH_CHECKS))
+        return
+
+    import __testing
+    for check in args.checks:
+        print("Running " + BENCH_CHECKS[check] + "()")
+        getattr(__testing, BENCH_CHECKS[check])()
+
+
+def __evaluate(args):
+    import get_forecast
+    evaluation = get_forecast.evaluate_forecast(args.days)
+    if len(evaluation.index) == 0:
+        print("No hours with both forecasted and measured values")
+        return
+
+    print(evaluation.to_string(float_format="%.3f"))
+    __save_csv(evaluation, config.site_name + "-evaluation.csv")
+
+
+def __profile(args):
+    from helpers import profiling
+
+    if len(args.target) == 0 or args.target[0] == "profile":
+        print("Give the subcommand to profile, for example: python cli.py profile forecast")
+        return
+
+    target_args = args.parser.parse_args(args.target)
+    if not __set_site(getattr(target_args, "site", None)):
+        return
+
+    with profiling.profile(args.target[0], args.mode):
+        target_args.function(target_args)
+
+
+def __save_csv(data, filename: str):
+    path = os.path.join(config.save_directory, filename)
+    data.to_csv(path, float_format="%.2f")
+    print("Saved csv as: " + path)
+
+
+if __name__ == '__main__':
+    main()
@@ -37,6 +37,14 @@ wind_speed = 2
 # air temp in Celsius, this will be used if temp from fmi open is not used
 air_temp = 20
 
+# module temperature model, see TEMPERATURE_MODELS in helpers/panel_temperature_estimator.py
+temperature_model = "king" # value= ["king"], ["sapm"], ["faiman"] or ["pvsyst"]
+
+# horizon seen from the panels as {azimuth: elevation} in degrees or a csv file with azimuth and elevation columns,
+# direct radiation is shaded when the sun is below the horizon. None for an unobstructed horizon, sites can override
+# this in config.sites, see helpers/horizon_shading.py
+horizon_profile = None
+
 
 
 
@@ -47,10 +55,42 @@ air_temp = 20
 # timezone is currently not utilized as it should due to plotting issues
 timezone = "UTC"
 
+# local timezone, used for day boundaries of daily energy sums
+local_timezone = "Europe/Helsinki"
+
 # data resolution, how many minutes between measurements. Recommending values 60, 30, 15, 10, 5, 1
 # will interpolate if resolution is higher than 60(30 or 15 etc.) as 60 is what fmi open data is capable of.
 data_resolution = 60
 
+# cache file for site altitudes and monthly Linke turbidity values used by pvlib clear sky, see helpers/linke_turbidity.py
+linke_turbidity_cache_file = "output/linke_turbidity.json"
+
+# daylight only mode, pipeline steps are only run for rows where the panels can receive radiation. Rows where the sun
+# is below the horizon get zeros for all computed columns, see helpers/daylight_mask.py
+daylight_only = False
+
+
+#### PARAMETER UNCERTAINTY
+# Monte Carlo uncertainty mode, forecasts get output quantile columns computed from sampled installation parameters,
+# see helpers/uncertainty.py
+uncertainty_mode = False
+uncertainty_samples = 200 # sampled parameter sets per site
+uncertainty_quantiles = [0.1, 0.5, 0.9] # quantile columns output_q10, output_q50 and output_q90
+uncertainty_seed = 0
+# standard deviations of sampled parameters around their configured values. Sites can override single values with an
+# "uncertainty_std" dict in config.sites, for example {"tilt": 1.0} for a site with measured tilt
+uncertainty_std = {"tilt": 5.0, "azimuth": 15.0, "albedo": 0.05, "reflectance_constant": 0.02,
+                   "module_elevation": 3.0}
+
+
+#### BIAS CALIBRATION PARAMETERS
+# per-site correction factors fitted from measured production, see helpers/bias_calibration.py
+calibration_cache_file = "output/calibration.json"
+calibration_days = 14 # length of the fitting window in days
+calibration_min_samples = 24 # sites with fewer valid measurements than this keep uncorrected output
+calibration_regularization = 0.05 # pulls factors towards uncorrected output, 0 disables regularization
+calibration_gain_limits = (0.3, 1.5) # allowed range for the gain factor
+
 ########### PARAMETERS FOR FMI INSTALLATIONS BELOW:
 
 
@@ -105,3 +145,87 @@ def set_params_custom():
     timezone = "UTC"
 
 
+# record and replay of FMI open data and InfluxDB traffic, see helpers/record_replay.py
+record_replay_mode = None # value= [None], ["record"] or ["replay"]
+fixture_directory = "output/fixtures/"
+replay_latency = 0.0 # seconds added to each replayed call
+replay_latency_jitter = 0.0 # random extra seconds, up to this value
+replay_seed = 0
+
+# seconds between call stack samples of the --profile option, see helpers/profiling.py
+profile_sample_interval = 0.001
+
+# archive of raw FMI open data inputs, see helpers/fmi_archive.py. "append" archives every FMI open data response, "read"
+# reads forecasts from the archive instead of FMI open data, using model runs with origin time at or before
+# fmi_archive_as_of, all runs if None
+fmi_archive_mode = None # value= [None], ["append"] or ["read"]
+fmi_archive_directory = "output/fmi_archive/"
+fmi_archive_as_of = None
+fmi_run_interval = 3 # hours between HARMONIE model runs
+fmi_publication_delay = 3 # hours from model origin time to the run being available in FMI open data
+
+# short horizon nowcasts of nowcast.py, latest measurements are blended into cached forecasts
+nowcast_interval = 5 # minutes between nowcast cycles
+nowcast_resolution = 15 # minutes between nowcast timestamps
+nowcast_hours = 3 # nowcast horizon in hours
+nowcast_decay_hours = 1.5 # the measured deviation from the forecast decays with this time constant
+nowcast_max_age = 15 # minutes, older measurements are not used
+nowcast_min_clear_sky = 0.05 # clear sky output relative to rated power below which the forecast is used as is
+nowcast_index_limits = (0.0, 1.3) # allowed range of the clear sky index
+nowcast_measurement_file = None # csv file with time, site and power (kW) columns used instead of InfluxDB
+
+# points per InfluxDB write request, see get_forecast.write_to_influx()
+influx_batch_size = 5000
+
+# FMI open data WFS url polled by scheduler.py for new model runs
+fmi_wfs_url = "https://opendata.fmi.fi/wfs"
+
+# size of the grid cells in km used for grouping sites which share FMI open data, HARMONIE grid spacing is ~2.5km
+grid_cell_size = 2.5
+
+# worker processes of fleet forecasts, with more than 1 worker site outputs are computed in worker processes which read
+# weather and solar geometry from shared memory, see helpers/shared_arrays.py
+fleet_workers = 1
+shared_array_transport = "shm" # value= ["shm"] or ["memmap"]
+
+# site x day chunks of get_forecast.stream_forecasts() computed ahead of the consumer in a background thread, 0 computes
+# each chunk only when the consumer asks for it, see helpers/streaming.py
+stream_prefetch = 0
+
+# fleet of installations for multi-site runs. Each site is a dict of parameters which replace the values above when
+# the site is processed, see set_params_site(). Parameters which are not listed keep their values from above.
+sites = [
+    {"site_name": "helsinki", "latitude": latitude_helsinki, "longitude": longitude_helsinki, "tilt": tilt_helsinki,
+     "azimuth": azimuth_helsinki, "rated_power": rated_power_helsinki, "module_elevation": elevation_helsinki,
+     "region": "uusimaa", "portfolio": "fmi"},
+    {"site_name": "kuopio", "latitude": latitude_kuopio, "longitude": longitude_kuopio, "tilt": tilt_kuopio,
+     "azimuth": azimuth_kuopio, "rated_power": rated_power_kuopio, "module_elevation": elevation_kuopio,
+     "region": "pohjois-savo", "portfolio": "fmi"},
+]
+
+# hierarchy levels of fleet aggregates, each site dict above can have a group name for each level. Sites without a
+# group name are aggregated to group "unassigned", see helpers/fleet_aggregation.py
+aggregation_levels = ["feeder", "region", "portfolio"]
+fleet_state_days = 7 # days of fleet aggregates kept in the fleet state before the latest refreshed forecasts
+
+
+# values of parameters before the first set_params_site() call
+__site_defaults = {}
+
+# dict parameters which sites override entry by entry, other parameters are replaced as a whole
+__merged_site_params = ["uncertainty_std"]
+
+
+def set_params_site(site: dict):
+    """
+    Sets installation parameters of a site from config.sites as the active parameters. Parameters set by previously
+    processed sites are restored to their original values first.
+    """
+    for key in site:
+        __site_defaults.setdefault(key, globals().get(key))
+
+    for key, default in __site_defaults.items():
+        if key in __merged_site_params and key in site:
+            globals()[key] = {**default, **site[key]}
+        else:
+            globals()[key] = site.get(key, default)
@@ -1,9 +1,8 @@
+import argparse
 import os
-import sys
 from datetime import datetime, timezone
 from dotenv import load_dotenv
-from influxdb_client import InfluxDBClient
-from influxdb_client.client.delete_api import DeleteApi
+from helpers import record_replay
 
 load_dotenv()
 
@@ -12,32 +11,72 @@ INFLUX_TOKEN = os.getenv('INFLUX_TOKEN')
 INFLUX_ORG = os.getenv('INFLUX_ORG')
 INFLUX_BUCKET = os.getenv('INFLUX_BUCKET')
 
+# Time range covering all data of a measurement (start from epoch, end far in the future)
+ALL_START = "1970-01-01T00:00:00Z"
+ALL_STOP = "2100-12-31T23:59:59Z"
+
 
 def delete_measurement(measurement_name):
-    client = InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG)
-    delete_api = client.delete_api()
+    delete_range(measurement_name, ALL_START, ALL_STOP)
+
+
+def delete_range(measurements, start, stop, sites=None, client=None):
+    """
+    Deletes points of measurements within a time window, optionally only points with the given site tags. InfluxDB
+    delete predicates do not support OR, so one delete request is made for each measurement and site, all requests use
+    a single client.
+    :param measurements: Measurement name or list of measurement names.
+    :param start: Window start, tz-aware datetime or RFC3339 string. Inclusive.
+    :param stop: Window stop, tz-aware datetime or RFC3339 string. Inclusive.
+    :param sites: List of site tag values, None deletes points of all sites.
+    :param client: InfluxDB client, a new client is created and closed if not given.
+    :return: Number of failed delete requests.
+    """
+    if isinstance(measurements, str):
+        measurements = [measurements]
+    start = __to_rfc3339(start)
+    stop = __to_rfc3339(stop)
 
-    # Define time range to delete all data for the measurement (start from epoch, end far in the future)
-    start = "1970-01-01T00:00:00Z"
-    stop = "2100-12-31T23:59:59Z"
+    predicates = []
+    for measurement in measurements:
+        if sites is None:
+            predicates.append(f'_measurement="{measurement}"')
+        else:
+            predicates += [f'_measurement="{measurement}" AND site="{site}"' for site in dict.fromkeys(sites)]
 
-    # Build predicate to match the measurement
-    predicate = f'_measurement="{measurement_name}"'
+    own_client = client is None
+    if own_client:
+        client = record_replay.influx_client(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG)
+    delete_api = client.delete_api()
 
-    print(f"Deleting measurement '{measurement_name}' with predicate: {predicate}\nFrom {start} to {stop}")
+    print(f"Deleting {len(predicates)} series groups of {', '.join(measurements)} from {start} to {stop}")
+    failed = 0
     try:
-        delete_api.delete(start, stop, predicate, bucket=INFLUX_BUCKET, org=INFLUX_ORG)
-        print(f"Measurement '{measurement_name}' deleted from bucket '{INFLUX_BUCKET}'")
-    except Exception as e:
-        print(f"Error deleting measurement '{measurement_name}': {e}")
+        for predicate in predicates:
+            try:
+                delete_api.delete(start, stop, predicate, bucket=INFLUX_BUCKET, org=INFLUX_ORG)
+            except Exception as e:
+                print(f"Error deleting with predicate {predicate}: {e}")
+                failed += 1
     finally:
-        client.close()
+        if own_client:
+            client.close()
+
+    return failed
+
+
+def __to_rfc3339(time):
+    if isinstance(time, datetime):
+        return time.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+    return time
 
 
 if __name__ == '__main__':
-    if len(sys.argv) < 2:
-        print("Usage: python delete.py <measurement1> [<measurement2> ...]")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(description="Deletes points of InfluxDB measurements, by default all of them.")
+    parser.add_argument("measurements", nargs="+")
+    parser.add_argument("--start", default=ALL_START, help="window start as RFC3339, for example 2024-05-01T00:00:00Z")
+    parser.add_argument("--stop", default=ALL_STOP, help="window stop as RFC3339")
+    parser.add_argument("--site", action="append", dest="sites", help="site tag value, can be repeated")
+    args = parser.parse_args()
 
-    for meas in sys.argv[1:]:
-        delete_measurement(meas)
+    delete_range(args.measurements, args.start, args.stop, args.sites)
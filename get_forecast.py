@@ -1,11 +1,15 @@
+import argparse
 import datetime
 import pandas as pd
 import config
+import delete
 import os
 from dotenv import load_dotenv, find_dotenv
-from influxdb_client import InfluxDBClient, Point, WritePrecision
+from influxdb_client import Point, WritePrecision
 from influxdb_client.client.write_api import SYNCHRONOUS
 from helpers import solar_irradiance_estimator, irradiance_transpositions, reflection_estimator, panel_temperature_estimator, output_estimator
+from helpers import bias_calibration, energy_aggregation, site_index, daylight_mask, record_replay, profiling
+from helpers import uncertainty, time_index, shared_arrays, streaming
 
 # Load .env from project root
 load_dotenv(find_dotenv())
@@ -16,96 +20,495 @@ INFLUX_URL = os.getenv('INFLUX_URL')
 INFLUX_TOKEN = os.getenv('INFLUX_TOKEN')
 INFLUX_ORG = os.getenv('INFLUX_ORG')
 INFLUX_BUCKET = os.getenv('INFLUX_BUCKET')
+CALIBRATION_IN_USE = os.getenv('CALIBRATION_IN_USE', 'false').lower() == 'true'
+MEASURED_MEASUREMENT = os.getenv('MEASURED_MEASUREMENT', 'pv_measured')
+MEASURED_FIELD = os.getenv('MEASURED_FIELD', 'power')
+INFLUX_UPSERT = os.getenv('INFLUX_UPSERT', 'false').lower() == 'true'
 
-# Debug: print environment values
-print(f"Connecting to InfluxDB with URL={INFLUX_URL}, ORG={INFLUX_ORG}, BUCKET={INFLUX_BUCKET}")
-if not all([INFLUX_URL, INFLUX_TOKEN, INFLUX_ORG, INFLUX_BUCKET]):
-    raise EnvironmentError("Missing one or more InfluxDB env variables. Check .env file.")
+# Record or replay FMI open data and InfluxDB traffic, see helpers/record_replay.py
+if os.getenv('RECORD_REPLAY'):
+    config.record_replay_mode = os.getenv('RECORD_REPLAY').lower()
 
 
-def generate_forecast(day_range=3):
+def check_influx_settings():
+    """
+    Raises EnvironmentError if InfluxDB env variables are missing. Replayed runs do not need InfluxDB settings.
+    """
+    if config.record_replay_mode == 'replay':
+        return
+    # Debug: print environment values
+    print(f"Connecting to InfluxDB with URL={INFLUX_URL}, ORG={INFLUX_ORG}, BUCKET={INFLUX_BUCKET}")
+    if not all([INFLUX_URL, INFLUX_TOKEN, INFLUX_ORG, INFLUX_BUCKET]):
+        raise EnvironmentError("Missing one or more InfluxDB env variables. Check .env file.")
+
+
+def generate_forecast(day_range=3, data=None):
+    """
+    Generates PV output forecast for the active site in config.
+    :param day_range: Day count, 1 returns only this day, 3 returns this day and the 2 following days.
+    :param data: Already fetched FMI open data, fetched here if not given.
+    :return: Forecast dataframe with startTime and endTime columns.
+    """
     original_resolution = config.data_resolution
     config.data_resolution = 60
 
-    today = datetime.date.today()
-    date_start = datetime.datetime(today.year, today.month, today.day)
+    if data is None:
+        today = datetime.date.today()
+        date_start = datetime.datetime(today.year, today.month, today.day)
 
-    data = solar_irradiance_estimator.get_solar_irradiance(date_start, day_count=day_range, model="fmiopen")
-    data = irradiance_transpositions.irradiance_df_to_poa_df(data)
-    data = reflection_estimator.add_reflection_corrected_poa_components_to_df(data)
-    data = reflection_estimator.add_reflection_corrected_poa_to_df(data)
-    data = panel_temperature_estimator.add_estimated_panel_temperature(data)
-    data = output_estimator.add_output_to_df(data)
+        data = solar_irradiance_estimator.get_solar_irradiance(date_start, day_count=day_range, model="fmiopen")
+    if config.daylight_only:
+        data = daylight_mask.process_daylight_rows(data)
+    else:
+        with profiling.stage("transpose"):
+            data = irradiance_transpositions.irradiance_df_to_poa_df(data)
+        with profiling.stage("reflect"):
+            data = reflection_estimator.add_reflection_corrected_poa_components_to_df(data)
+            data = reflection_estimator.add_reflection_corrected_poa_to_df(data)
+        with profiling.stage("temperature"):
+            data = panel_temperature_estimator.add_estimated_panel_temperature(data)
+        with profiling.stage("output"):
+            data = output_estimator.add_output_to_df(data)
 
     config.data_resolution = original_resolution
 
-    # Adjust timestamps to exact hours
-    data['endTime'] = data['time'].dt.ceil('h')
+    return __finish_forecast(data)
+
+
+def __finish_forecast(data):
+    """
+    Adds quantiles and calibration to a dataframe with output column and forms the startTime and endTime columns.
+    """
+    if config.uncertainty_mode:
+        with profiling.stage("uncertainty"):
+            data = uncertainty.add_output_quantiles_to_df(data)
+
+    if CALIBRATION_IN_USE:
+        data = bias_calibration.apply_calibration(data, bias_calibration.get_site_factors())
+
+    # Adjust timestamps to exact hours, interval centers are rounded up to the end of the hour they belong to
+    data['endTime'] = time_index.get_times(data).ceil('h')
     data['startTime'] = data['endTime'] - pd.Timedelta(hours=1)
 
     # Rearrange columns
-    cols = ['startTime', 'endTime'] + [col for col in data.columns if col not in ['time', 'startTime', 'endTime']]
+    cols = ['startTime', 'endTime'] + [col for col in data.columns if col not in ['startTime', 'endTime']]
     data = data[cols]
 
     return data
 
 
-def write_to_influx(data, measurement):
-    print(f"Initializing write to measurement '{measurement}' with {len(data)} points")
+def generate_fleet_forecasts(sites, day_range=3, workers=None):
+    """
+    Generates forecasts for multiple sites. FMI open data is fetched once per grid cell, see helpers/site_index.py.
+    :param sites: List of site dicts, same format as config.sites.
+    :param day_range: Day count, same as in generate_forecast().
+    :param workers: Worker processes, config.fleet_workers by default. With more than 1 worker site outputs are computed
+    by the fused pipeline in worker processes, see helpers/shared_arrays.py, and forecasts contain the weather columns
+    and output without the intermediate pipeline columns.
+    :return: Dict {site_name: forecast dataframe}
+    """
+    today = datetime.date.today()
+    date_start = datetime.datetime(today.year, today.month, today.day)
+    date_end = date_start + datetime.timedelta(days=day_range, minutes=-1)
+
+    weather = site_index.fetch_weather_for_sites(sites, date_start, date_end)
+
+    if workers is None:
+        workers = config.fleet_workers
+    outputs = None
+    if workers > 1:
+        with profiling.stage("output"):
+            outputs = shared_arrays.compute_fleet_output(sites, weather, workers)
+
+    forecasts = {}
     try:
-        client = InfluxDBClient(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG)
+        for site in sites:
+            config.set_params_site(site)
+            if outputs is None:
+                forecasts[site["site_name"]] = generate_forecast(day_range, weather[site["site_name"]])
+            else:
+                data = weather[site["site_name"]]
+                data["output"] = outputs[site["site_name"]]
+                forecasts[site["site_name"]] = __finish_forecast(data)
+    finally:
+        config.set_params_site({})
+
+    return forecasts
+
+
+def get_forecast_window(day_range=3) -> (pd.Timestamp, pd.Timestamp):
+    """
+    :param day_range: Day count, same as in generate_forecast().
+    :return: UTC start and stop of the endTime values of forecasts starting today, stop inclusive.
+    """
+    start = pd.Timestamp(datetime.date.today(), tz='UTC')
+    return start, start + pd.Timedelta(days=day_range)
+
+
+def stream_forecasts(sites, day_range=3, prefetch=None):
+    """
+    Generates forecasts of multiple sites as a stream of site x day chunks, see helpers/streaming.py. FMI open data of
+    a grid cell is fetched when the first chunk of its sites is needed and each chunk is computed when the consumer
+    asks for it, so consumers such as write_stream_to_influx() receive the first chunks before the rest of the fleet
+    has been fetched or computed.
+    :param sites: List of site dicts, same format as config.sites.
+    :param day_range: Day count, same as in generate_forecast().
+    :param prefetch: Chunks computed ahead of the consumer in a background thread, config.stream_prefetch by default.
+    :return: Generator of (site_name, date, forecast dataframe) tuples, same values as the days of
+    generate_fleet_forecasts() with one worker.
+    """
+    if prefetch is None:
+        prefetch = config.stream_prefetch
+
+    today = datetime.date.today()
+    date_start = datetime.datetime(today.year, today.month, today.day)
+    date_end = date_start + datetime.timedelta(days=day_range, minutes=-1)
+
+    weather = site_index.iter_weather_for_sites(sites, date_start, date_end)
+    chunks = streaming.split_by_day(weather)
+    forecasts = __compute_chunks(chunks, {site["site_name"]: site for site in sites}, day_range)
+    return streaming.prefetch(forecasts, prefetch)
+
+
+def __compute_chunks(chunks, sites: dict, day_range):
+    """
+    Forecast stage of stream_forecasts().
+    :param chunks: Iterator of (site_name, date, FMI open dataframe) tuples.
+    :param sites: Dict {site_name: site dict}
+    """
+    try:
+        for site_name, day, data in chunks:
+            config.set_params_site(sites[site_name])
+            yield site_name, day, generate_forecast(day_range, data)
+    finally:
+        config.set_params_site({})
+
+
+def write_to_influx(data, measurement, site=None, upsert=None):
+    """
+    Writes rows of a dataframe as points timestamped with the endTime column, other columns except startTime are fields.
+    :param data: Dataframe with startTime and endTime columns.
+    :param measurement: Measurement name.
+    :param site: Value of the site tag of the points, points are not tagged if None.
+    :param upsert: Deletes earlier points of the written time window, only points of the site if site is given, before
+    writing. INFLUX_UPSERT by default.
+    """
+    write_sites_to_influx({site: data}, measurement, upsert)
+
+
+def write_sites_to_influx(data, measurement, upsert=None, all_sites=False):
+    """
+    Writes dataframes of multiple sites to one measurement with a single client and batched write requests, see
+    write_to_influx().
+    :param data: Dict {site tag value or None: dataframe}
+    :param measurement: Measurement name.
+    :param upsert: Deletes earlier points of the written time window of each site before writing, INFLUX_UPSERT by
+    default.
+    :param all_sites: The written sites are all sites of the measurement, upsert deletes the window with a single
+    request instead of one request per site.
+    """
+    if upsert is None:
+        upsert = INFLUX_UPSERT
+    with profiling.stage("write"):
+        __write_to_influx(data, measurement, upsert, all_sites)
+
+
+def write_stream_to_influx(stream, measurement='pv_forecast', upsert=None, window=None):
+    """
+    Writes a stream of forecast chunks from stream_forecasts() with a single client while the stream is computed,
+    output columns are converted to kilowatts.
+    :param stream: Iterator of (site_name, date, forecast dataframe) tuples.
+    :param measurement: Measurement name.
+    :param upsert: Deletes earlier points before writing, INFLUX_UPSERT by default.
+    :param window: (start, stop) covering all chunks of the stream, for example from get_forecast_window(). With upsert
+    the window of a site is deleted when its first chunk arrives, otherwise the window of each chunk is deleted before
+    the chunk. Sites whose chunks are not reached, for example when fetching fails, keep their earlier points.
+    :return: Number of written chunks.
+    """
+    if upsert is None:
+        upsert = INFLUX_UPSERT
+
+    connection = __connect_influx()
+    if connection is None:
+        return 0
+
+    deleted_sites = set()
+    chunk_count = 0
+    try:
+        for site_name, day, forecast in stream:
+            with profiling.stage("write"):
+                if upsert and window is not None and site_name not in deleted_sites:
+                    delete.delete_range(measurement, window[0], window[1], [site_name], client=connection[0])
+                    deleted_sites.add(site_name)
+                __write_points(connection, {site_name: convert_to_kilowatts(forecast.copy())}, measurement,
+                               upsert and window is None)
+            chunk_count += 1
+            print(f"Wrote forecast of '{site_name}' for {day} to measurement '{measurement}'")
+    finally:
+        connection[0].close()
+
+    return chunk_count
+
+
+def __write_to_influx(data, measurement, upsert, all_sites=False):
+    point_count = sum(len(site_data) for site_data in data.values())
+    print(f"Initializing write to measurement '{measurement}' with {point_count} points")
+    connection = __connect_influx()
+    if connection is None:
+        return
+
+    __write_points(connection, data, measurement, upsert, all_sites)
+    connection[0].close()
+
+
+def __connect_influx():
+    """
+    :return: InfluxDB client and its write api, None if InfluxDB could not be reached.
+    """
+    try:
+        client = record_replay.influx_client(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG)
         health = client.health()
         if health.status != 'pass':
             print(f"InfluxDB health check failed: {health.status} Message: {health.message}")
             client.close()
-            return
+            return None
         print(f"InfluxDB health status: {health.status}")
         # Override signout to avoid __del__ warning
         try:
             client.api_client._signout = lambda *args, **kwargs: None
         except AttributeError:
             pass
-        write_api = client.write_api(write_options=SYNCHRONOUS)
+        return client, client.write_api(write_options=SYNCHRONOUS)
     except Exception as conn_err:
         print(f"Cannot connect to InfluxDB at {INFLUX_URL}: {conn_err}")
-        return
+        return None
 
-    for i, row in enumerate(data.itertuples(), start=1):
-        point = Point(measurement)
-        for col in data.columns:
-            if col not in ['startTime', 'endTime']:
-                value = getattr(row, col)
-                if pd.notna(value):
+
+def __write_points(connection, data, measurement, upsert, all_sites=False):
+    """
+    Writes dataframes of sites as batched points, see write_sites_to_influx().
+    :param connection: Client and write api from __connect_influx()
+    """
+    client, write_api = connection
+    written = {site: site_data for site, site_data in data.items() if len(site_data) > 0}
+    if upsert and len(written) > 0:
+        # one window covering all sites, a single request when all sites are written and one per site otherwise
+        start = min(site_data['endTime'].min() for site_data in written.values())
+        stop = max(site_data['endTime'].max() for site_data in written.values())
+        sites = None if all_sites or None in written else list(written)
+        delete.delete_range(measurement, start, stop, sites, client=client)
+
+    points = []
+    for site, site_data in written.items():
+        # rows as plain tuples, column names such as fleet group names are not always valid attribute names
+        time_position = site_data.columns.get_loc('endTime')
+        for row in site_data.itertuples(index=False, name=None):
+            point = Point(measurement)
+            if site is not None:
+                point.tag('site', site)
+            for col, value in zip(site_data.columns, row):
+                if col not in ['startTime', 'endTime'] and pd.notna(value):
                     point.field(col, float(value))
-        point.time(row.endTime, WritePrecision.S)
+            point.time(row[time_position], WritePrecision.S)
+            points.append(point)
+
+    for first in range(0, len(points), config.influx_batch_size):
         try:
-            write_api.write(bucket=INFLUX_BUCKET, org=INFLUX_ORG, record=point)
+            write_api.write(bucket=INFLUX_BUCKET, org=INFLUX_ORG, record=points[first:first + config.influx_batch_size])
         except Exception as e:
-            print(f"Error writing point {i} to measurement '{measurement}': {e}")
+            print(f"Error writing points {first + 1}-{min(first + config.influx_batch_size, len(points))} to "
+                  f"measurement '{measurement}': {e}")
 
-    client.close()
 
+def read_from_influx(measurement, field, start, stop, site=None, interval_end=False):
+    """
+    Reads hourly means of a field from InfluxDB. Timestamps mark the end of each hour, same as written forecasts.
+    :param measurement: Measurement name.
+    :param field: Field name.
+    :param start: Range start, tz-aware datetime.
+    :param stop: Range stop, tz-aware datetime.
+    :param site: Reads only points with this site tag value if given.
+    :param interval_end: Points are stamped with the end of their interval, such as written forecasts. aggregateWindow()
+    averages [12:00, 13:00) into the hour stamped 13:00, which would move a forecast point stamped 12:00 to the next
+    hour, so these points are read as they are from (start, stop] and averaged into the hour they end.
+    :return: Pandas series indexed with UTC timestamps, empty if query failed.
+    """
+    site_filter = f' and r.site == "{site}"' if site is not None else ''
+    if interval_end:
+        # flux ranges include start and exclude stop
+        time_range = (f'range(start: {(start + pd.Timedelta(seconds=1)).isoformat()}, '
+                      f'stop: {(stop + pd.Timedelta(seconds=1)).isoformat()})')
+        aggregation = ''
+    else:
+        time_range = f'range(start: {start.isoformat()}, stop: {stop.isoformat()})'
+        aggregation = ' |> aggregateWindow(every: 1h, fn: mean, createEmpty: false)'
+    query = (f'from(bucket: "{INFLUX_BUCKET}")'
+             f' |> {time_range}'
+             f' |> filter(fn: (r) => r._measurement == "{measurement}" and r._field == "{field}"{site_filter})'
+             f'{aggregation}'
+             f' |> keep(columns: ["_time", "_value"])')
+    try:
+        client = record_replay.influx_client(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG)
+        df = client.query_api().query_data_frame(query, org=INFLUX_ORG)
+        client.close()
+    except Exception as e:
+        print(f"Error reading field '{field}' from measurement '{measurement}': {e}")
+        return pd.Series(dtype=float)
 
-if __name__ == '__main__':
+    if isinstance(df, list):
+        df = pd.concat(df)
+    if len(df) == 0:
+        return pd.Series(dtype=float)
+
+    series = df.set_index(pd.to_datetime(df['_time'], utc=True))['_value'].groupby(level=0).mean()
+    if interval_end:
+        series = series.resample('1h', closed='right', label='right').mean().dropna()
+    return series
+
+
+def read_latest_from_influx(measurement, field, start, tag='site'):
+    """
+    Reads the latest value of a field for each value of a tag with a single query.
+    :param measurement: Measurement name.
+    :param field: Field name.
+    :param start: Range start, tz-aware datetime. Older values are not read.
+    :param tag: Tag key, for example site names.
+    :return: Dataframe indexed with tag values with columns time and value, empty if query failed.
+    """
+    query = (f'from(bucket: "{INFLUX_BUCKET}")'
+             f' |> range(start: {start.isoformat()})'
+             f' |> filter(fn: (r) => r._measurement == "{measurement}" and r._field == "{field}")'
+             f' |> group(columns: ["{tag}"])'
+             f' |> last()'
+             f' |> keep(columns: ["_time", "_value", "{tag}"])')
+    empty = pd.DataFrame(columns=['time', 'value'])
+    try:
+        client = record_replay.influx_client(url=INFLUX_URL, token=INFLUX_TOKEN, org=INFLUX_ORG)
+        df = client.query_api().query_data_frame(query, org=INFLUX_ORG)
+        client.close()
+    except Exception as e:
+        print(f"Error reading latest field '{field}' from measurement '{measurement}': {e}")
+        return empty
+
+    if isinstance(df, list):
+        df = pd.concat(df)
+    if len(df) == 0 or tag not in df.columns:
+        return empty
+
+    df = df.rename(columns={'_time': 'time', '_value': 'value'})
+    df['time'] = pd.to_datetime(df['time'], utc=True)
+    return df.set_index(tag)[['time', 'value']]
+
+
+def update_calibration():
+    """
+    Refits bias calibration factors of the configured site from measured production and earlier uncalibrated
+    forecasts stored in InfluxDB. Both are read by the site tag of the configured site. Only days missing from the
+    calibration cache are processed.
+    """
+    stop = pd.Timestamp.now(tz='UTC').floor('D')
+    start = stop - pd.Timedelta(days=config.calibration_days)
+
+    forecast = read_from_influx('pv_forecast', 'output_uncalibrated', start, stop, config.site_name,
+                                interval_end=True)
+    measured = read_from_influx(MEASURED_MEASUREMENT, MEASURED_FIELD, start, stop, config.site_name)
+    print(f"Calibration data: {len(forecast)} forecasted and {len(measured)} measured hours")
+
+    calibration = bias_calibration.update_calibration(forecast.to_frame(config.site_name),
+                                                      measured.to_frame(config.site_name),
+                                                      pd.Series({config.site_name: config.rated_power}))
+    bias_calibration.save_calibration(calibration)
+    print(f"Calibration factors for '{config.site_name}': {bias_calibration.get_site_factors(calibration=calibration)}")
+
+
+def evaluate_forecast(day_count=14):
+    """
+    Compares forecasts stored in InfluxDB against measured production of the configured site, both read by its site
+    tag. Each forecast run overwrites earlier values of the same timestamps, so the stored values are the latest
+    forecast of each hour.
+    :param day_count: Number of complete days before today to evaluate.
+    :return: Dataframe indexed with dates and a "total" row, columns mae, rmse, bias (kW) and hours. Empty if there are no
+    hours with both forecasted and measured values.
+    """
+    stop = pd.Timestamp.now(tz='UTC').floor('D')
+    start = stop - pd.Timedelta(days=day_count)
+
+    forecast = read_from_influx('pv_forecast', 'output', start, stop, config.site_name, interval_end=True)
+    measured = read_from_influx(MEASURED_MEASUREMENT, MEASURED_FIELD, start, stop, config.site_name)
+    errors = (forecast - measured).dropna()
+    print(f"Evaluation data: {len(forecast)} forecasted, {len(measured)} measured and {len(errors)} common hours")
+
+    if len(errors) == 0:
+        return pd.DataFrame(columns=['mae', 'rmse', 'bias', 'hours'])
+
+    def metrics(values):
+        return pd.Series({'mae': values.abs().mean(), 'rmse': (values ** 2).mean() ** 0.5, 'bias': values.mean(),
+                          'hours': len(values)})
+
+    # hourly timestamps mark the end of the hour, days are grouped by hour start
+    days = (errors.index - pd.Timedelta(hours=1)).date
+    evaluation = errors.groupby(days).apply(metrics).unstack()
+    evaluation.loc['total'] = metrics(errors)
+    return evaluation
+
+
+def convert_to_kilowatts(forecast_data):
+    """
+    Converts output columns of a forecast from Watts to kilowatts.
+    :param forecast_data: Forecast dataframe from generate_forecast()
+    :return: Input dataframe with output, output_uncalibrated and quantile columns in kilowatts.
+    """
+    quantile_columns = [uncertainty.get_quantile_column(quantile) for quantile in config.uncertainty_quantiles]
+    for output_column in ['output', 'output_uncalibrated'] + quantile_columns:
+        if output_column in forecast_data.columns:
+            forecast_data[output_column] = forecast_data[output_column] / 1000.0
+    return forecast_data
+
+
+def run_forecast():
+    """
+    Generates the forecast of the active site in config, saves it and energy sums as csv files and writes them to
+    InfluxDB when InfluxDB is in use.
+    """
     os.makedirs('output', exist_ok=True)  # Luo 'output' kansion jos sitä ei ole
-    config.set_params_custom()
-    forecast_data = generate_forecast()
 
-    # Convert output column from Watts to kilowatts
-    if 'output' in forecast_data.columns:
-        forecast_data['output'] = forecast_data['output'] / 1000.0
+    if INFLUX_IN_USE:
+        check_influx_settings()
+
+    if INFLUX_IN_USE and CALIBRATION_IN_USE:
+        update_calibration()
+
+    forecast_data = convert_to_kilowatts(generate_forecast())
 
     # Filter out rows older than now
     now = pd.Timestamp.utcnow()
     forecast_data = forecast_data[forecast_data['endTime'] > now]
 
+    # Hourly and daily energy sums, output is in kW at this point and aggregation expects watts
+    energy = energy_aggregation.aggregate_energy(forecast_data['startTime'], forecast_data['output'] * 1000.0,
+                                                 resolution=60)
+
     # Save to CSV
     forecast_data.to_csv('output/forecast.csv', float_format='%.2f', index=False)
+    energy['daily'].to_csv('output/forecast_energy.csv', float_format='%.2f')
 
     if INFLUX_IN_USE:
         # Write to measurements
-        write_to_influx(forecast_data, 'pv_forecast')
-        tomorrow = forecast_data[forecast_data['startTime'].dt.date == (datetime.date.today() + datetime.timedelta(days=1))]
-        write_to_influx(tomorrow, 'pv_forecast_1d')
-        day_after = forecast_data[forecast_data['startTime'].dt.date == (datetime.date.today() + datetime.timedelta(days=2))]
-        write_to_influx(day_after, 'pv_forecast_2d')
+        write_to_influx(forecast_data, 'pv_forecast', site=config.site_name)
+        # day boundaries of the per day measurements are in config.local_timezone, same as pv_energy_daily
+        by_horizon = energy_aggregation.split_by_horizon(forecast_data, 'startTime', [1, 2])
+        write_to_influx(by_horizon[1], 'pv_forecast_1d', site=config.site_name)
+        write_to_influx(by_horizon[2], 'pv_forecast_2d', site=config.site_name)
+        write_to_influx(energy['hourly'], 'pv_energy_hourly', site=config.site_name)
+        write_to_influx(energy['daily'], 'pv_energy_daily', site=config.site_name)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generates PV forecast and writes it to csv files and InfluxDB.")
+    parser.add_argument("--profile", nargs="?", const="sampling", default=None, choices=["sampling", "cprofile"],
+                        help="profile the run, results are saved into the output directory")
+    args = parser.parse_args()
+
+    with profiling.profile("get_forecast", args.profile):
+        config.set_params_custom()
+        run_forecast()
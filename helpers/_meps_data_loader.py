@@ -12,13 +12,16 @@ Author: kalliov (Viivi Kallio).
 Modifications by: TimoSalola (Timo Salola).
 """
 import time
-import datetime as dt
 from datetime import datetime
 import pandas
 import pandas as pd
 import numpy as np
-from fmiopendata.wfs import download_stored_query
+import config
 from helpers import astronomical_calculations
+from helpers import fmi_archive
+from helpers import time_index
+from helpers import record_replay
+from helpers import profiling
 
 
 def collect_fmi_opendata(latlon: str, start_time:datetime, end_time:datetime)-> pandas.DataFrame:
@@ -26,7 +29,8 @@ def collect_fmi_opendata(latlon: str, start_time:datetime, end_time:datetime)->
     :param latlon:      str(latitude) + "," + str(longitude)
     :param start_time:  2013-03-05T12:00:00Z ISO TIME
     :param end_time:    2013-03-05T12:00:00Z ISO TIME
-    :return: Pandas dataframe with columns ["time", "dni", "dhi", "ghi", "dir_hi", "albedo", "T", "wind", "cloud_cover"]
+    :return: Pandas dataframe with columns ["dni", "dhi", "ghi", "dir_hi", "albedo", "T", "wind", "cloud_cover"],
+    indexed with UTC interval end times, see helpers/time_index.py
     """
 
 
@@ -42,15 +46,33 @@ def collect_fmi_opendata(latlon: str, start_time:datetime, end_time:datetime)->
                   ]
     parameters_str = ','.join(parameters)
 
+    if config.fmi_archive_mode == "read":
+        with profiling.stage("fetch"):
+            runs = fmi_archive.read_runs(latlon, start_time, end_time, config.fmi_archive_as_of)
+        with profiling.stage("parse"):
+            return __combine_runs([__process_raw_df(time_index.set_convention(raw, "end", 60)) for raw in runs])
+
     # Collect data
-    snd = download_stored_query(collection_string,
-                                args=["latlon=" + latlon,
-                                      "starttime=" + str(start_time),
-                                      "endtime=" + str(end_time),
-                                      'parameters=' + parameters_str])
-    data = snd.data
+    with profiling.stage("fetch"):
+        snd = record_replay.download_stored_query(collection_string,
+                                                  args=["latlon=" + latlon,
+                                                        "starttime=" + str(start_time),
+                                                        "endtime=" + str(end_time),
+                                                        'parameters=' + parameters_str])
+
+    with profiling.stage("parse"):
+        raw = __to_raw_df(snd.data)
+        if config.fmi_archive_mode == "append":
+            fmi_archive.append(latlon, raw, origin_time=fmi_archive.get_origin_time(getattr(snd, "_xml", None)))
+        return __process_raw_df(raw)
 
 
+def __to_raw_df(data: dict) -> pandas.DataFrame:
+    """
+    Forms the dataframe of raw HARMONIE values from parsed FMI open data.
+    :param data: data dict of the multipointcoverage query result
+    :return: Pandas dataframe with fmi_archive.VALUE_COLUMNS, radiation values are accumulated from model origin time
+    """
 
     # Times to use in forming dataframe
     data_list = []
@@ -61,21 +83,50 @@ def collect_fmi_opendata(latlon: str, start_time:datetime, end_time:datetime)->
 
         data_list.append({'Time': time_a,
                           'T': values['Air temperature']['value'],
-                          'GHI_accum': values['Global radiation accumulation']['value'],
-                          'NetSW_accum': values['Net short wave radiation accumulation at the surface']['value'],
-                          'DirHI_accum': values['Short wave radiation accumulation']['value'],
-                          'Wind speed': values['Wind speed']['value'],
-                          'Total cloud cover': values['Total cloud cover']['value']})
+                          'ghi_accum': values['Global radiation accumulation']['value'],
+                          'net_sw_accum': values['Net short wave radiation accumulation at the surface']['value'],
+                          'dir_hi_accum': values['Short wave radiation accumulation']['value'],
+                          'wind': values['Wind speed']['value'],
+                          'cloud_cover': values['Total cloud cover']['value']})
 
     # Create a DataFrame and set time as index   
     df = pd.DataFrame(data_list)
     df.set_index('Time', inplace=True)
 
+    # timestamp for 12:00 refers to average during 11:00-12:00, stored as the time convention of the dataframe
+    return time_index.set_convention(df, "end", 60)
+
+
+def __combine_runs(runs: list) -> pandas.DataFrame:
+    """
+    Combines processed dataframes of archived model runs, for each timestamp the value of the latest run is used.
+    :param runs: Dataframes from __process_raw_df() in origin time order.
+    :return: Pandas dataframe, see collect_fmi_opendata()
+    """
+    if len(runs) == 0:
+        print("No archived FMI open data for the requested time range")
+        return time_index.set_convention(pd.DataFrame(columns=["dni", "dhi", "ghi", "dir_hi", "albedo", "T", "wind",
+                                                               "cloud_cover"], index=pd.DatetimeIndex([])), "end", 60)
+
+    # first row of each run has no accumulation difference, those rows are taken from earlier runs when possible
+    combined = pd.concat([runs[0].iloc[:1]] + [run.dropna(subset=["ghi"]) for run in runs])
+    combined = combined[~combined.index.duplicated(keep="last")].sort_index()
+    combined.attrs.pop("origin_time", None)
+    return time_index.set_convention(combined, "end", 60)
+
+
+def __process_raw_df(df: pandas.DataFrame) -> pandas.DataFrame:
+    """
+    Computes irradiance components from raw HARMONIE values.
+    :param df: Dataframe from __to_raw_df()
+    :return: Pandas dataframe, see collect_fmi_opendata()
+    """
+
     # Calculate instant from accumulated values (only radiation parameters)
     diff = df.diff()
-    df['GHI'] = diff['GHI_accum'] / (60 * 60)
-    df['NetSW'] = diff['NetSW_accum'] / (60 * 60)
-    df['DirHI'] = diff['DirHI_accum'] / (60 * 60)
+    df['GHI'] = diff['ghi_accum'] / (60 * 60)
+    df['NetSW'] = diff['net_sw_accum'] / (60 * 60)
+    df['DirHI'] = diff['dir_hi_accum'] / (60 * 60)
     # GHI = grad_instant
     # DirHI = swavr_instant
     # netSW = nswrs_instant
@@ -94,8 +145,7 @@ def collect_fmi_opendata(latlon: str, start_time:datetime, end_time:datetime)->
     #
 
     # Adding solar zenith angle to df
-    df["time"] = df.index
-    df["sza"] = astronomical_calculations.get_solar_azimuth_zenit_fast(df["time"])[1]
+    df["sza"] = astronomical_calculations.get_solar_azimuth_zenit_fast(df.index)[1]
     # solar zenit angle added
 
     # Calculate dni from dhi
@@ -103,17 +153,10 @@ def collect_fmi_opendata(latlon: str, start_time:datetime, end_time:datetime)->
 
     # Keep the necessary parameters
     df = df[['DNI', 'DHI', 'GHI', 'DirHI', 'albedo',
-             'T', 'Wind speed', 'Total cloud cover']]
+             'T', 'wind', 'cloud_cover']]
 
     df.columns = ["dni", "dhi", "ghi", "dir_hi", "albedo", "T", "wind", "cloud_cover"]
 
-    df.insert(loc=0, column="time", value=df.index)
-
-    # shifting timestamps to time-interval centers as timestamp for 12:00 refers to average during 11:00-12:00
-    df["time"] = df["time"] + dt.timedelta(minutes=-30)
-    # adding utc timezone marker to time
-    df["time"] = df["time"].dt.tz_localize("UTC")
-
     # restricting values to zero
     clip_columns = ["dni", "dhi", "ghi"]
     df[clip_columns] = df[clip_columns].clip(lower=0.0)
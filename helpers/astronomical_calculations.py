@@ -24,24 +24,29 @@ Author: TimoSalola (Timo Salola).
 """
 
 from datetime import datetime
+import numpy
 import pandas
 import pvlib.atmosphere
 import config
 from pvlib import location, irradiance
+from helpers import linke_turbidity
 
 
-def get_solar_angle_of_incidence_fast(dt:datetime)-> float:
+def get_solar_angle_of_incidence_fast(dt:datetime, solar_position=None)-> float:
     """
     Estimates solar angle of incidence at given datetime. Other parameters, tilt, azimuth and geolocation are read from
     config.py.
     :param dt: Datetime object, should include date and time.
+    :param solar_position: (azimuth, apparent zenith) from get_solar_azimuth_zenit_fast(dt), computed if not given.
     :return: Angle of incidence in degrees. Angle between sunlight and solar panel normal
 
     Optimized version, should work well
     """
 
 
-    solar_azimuth, solar_apparent_zenith = get_solar_azimuth_zenit_fast(dt)
+    if solar_position is None:
+        solar_position = get_solar_azimuth_zenit_fast(dt)
+    solar_azimuth, solar_apparent_zenith = solar_position
     panel_tilt = config.tilt
     panel_azimuth = config.azimuth
 
@@ -68,6 +73,48 @@ def get_air_mass_fast(time: datetime)-> float:
 
 
 
+def get_solar_geometry(dt: datetime)-> dict:
+    """
+    Computes all time dependent sun related values required by the irradiance transpositions with a single solar
+    position computation. Used by vectorized pipelines which would otherwise compute solar position once per step.
+    :param dt: times to compute the geometry for, pandas DatetimeIndex.
+    :return: dict of numpy arrays with keys "azimuth", "apparent_zenith", "airmass" and "dni_extra"
+    """
+
+    solar_azimuth, solar_apparent_zenith = get_solar_azimuth_zenit_fast(dt)
+
+    # same air mass model and zenith as in get_air_mass_fast()
+    air_mass = pvlib.atmosphere.get_relative_airmass(solar_apparent_zenith)
+
+    # extraterrestrial radiation, takes sun-earth distance variation into account
+    dni_extra = irradiance.get_extra_radiation(dt)
+
+    return {"azimuth": numpy.asarray(solar_azimuth, dtype=float),
+            "apparent_zenith": numpy.asarray(solar_apparent_zenith, dtype=float),
+            "airmass": numpy.asarray(air_mass, dtype=float),
+            "dni_extra": numpy.asarray(dni_extra, dtype=float)}
+
+
+def get_aoi_projection(geometry: dict, tilt, azimuth):
+    """
+    Cosine of the angle of incidence for precomputed solar geometry, same as pvlib.irradiance.aoi_projection.
+    Tilt and azimuth can be numpy arrays of orientations, each orientation is computed for every timestamp.
+    :param geometry: Solar geometry dict from get_solar_geometry()
+    :param tilt: Panel tilt in degrees, float or numpy array.
+    :param azimuth: Panel azimuth in degrees, float or numpy array.
+    :return: numpy array with shape broadcast(tilt, azimuth).shape + (time count,), values in range [-1, 1]
+    """
+
+    zenith = numpy.radians(geometry["apparent_zenith"])
+    tilt = numpy.radians(numpy.asarray(tilt, dtype=float))[..., None]
+    azimuth = numpy.asarray(azimuth, dtype=float)[..., None]
+
+    projection = (numpy.cos(tilt) * numpy.cos(zenith) +
+                  numpy.sin(tilt) * numpy.sin(zenith) * numpy.cos(numpy.radians(geometry["azimuth"] - azimuth)))
+
+    return numpy.clip(projection, -1.0, 1.0)
+
+
 def get_solar_azimuth_zenit_fast(dt: datetime)-> (float, float):
     """
     Returns apparent solar zenith and solar azimuth angles in degrees.
@@ -80,7 +127,8 @@ def get_solar_azimuth_zenit_fast(dt: datetime)-> (float, float):
     panel_longitude = config.longitude
 
     # panel location object, required by pvlib
-    panel_location = location.Location(panel_latitude, panel_longitude, tz=config.timezone)
+    panel_location = location.Location(panel_latitude, panel_longitude, tz=config.timezone,
+                                       altitude=linke_turbidity.get_altitude(panel_latitude, panel_longitude))
 
     # solar position object
     solar_position = panel_location.get_solarposition(dt)
@@ -0,0 +1,248 @@
+"""
+Per-site bias calibration of the PV output model.
+
+The Huld constants, panel reflectance constant and rated power used by the model are fixed values, whereas real
+installations drift due to soiling, shading and faulty installation metadata. This file fits per-site correction
+factors from recent measured and forecasted production and applies them to the model output.
+
+Correction model, fitted separately for each site:
+measured = a * forecast + b * forecast * ln(forecast / rated_power)
+
+[a]: Gain. Absorbs errors in rated power and losses which scale linearly with output, such as soiling.
+[b]: Low light term. Absorbs errors which depend on irradiance level, such as partial shading or faulty reflectance
+and Huld efficiency constants.
+
+Fitting is done with regularized least squares for all sites at once. Only the sufficient statistics (XᵀX, Xᵀy) are
+stored per site and day, which means that refitting only has to process days which are not yet in the cache.
+
+Data format:
+Forecast and measured values are given as pandas dataframes with a shared time index and one column per site.
+"""
+
+import datetime
+import json
+import os
+import numpy
+import pandas
+
+import config
+
+
+# names of the stored per-day statistics, order matches the arrays used in this file
+__STAT_NAMES = ["xx11", "xx12", "xx22", "xy1", "xy2", "n"]
+
+# default factors, a=1 and b=0 leave the model output unmodified
+DEFAULT_FACTORS = (1.0, 0.0)
+
+
+def load_calibration(path=None) -> dict:
+    """
+    Loads calibration cache from disk.
+    :param path: Cache file path, config.calibration_cache_file by default.
+    :return: Dict with keys "stats" {site: {date: [statistics]}} and "factors" {site: [a, b]}
+    """
+    if path is None:
+        path = config.calibration_cache_file
+
+    if not os.path.exists(path):
+        return {"stats": {}, "factors": {}}
+
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+def save_calibration(calibration: dict, path=None):
+    """
+    Saves calibration cache to disk.
+    :param calibration: Dict as returned by load_calibration() or update_calibration().
+    :param path: Cache file path, config.calibration_cache_file by default.
+    """
+    if path is None:
+        path = config.calibration_cache_file
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as file:
+        json.dump(calibration, file, indent=1)
+
+
+def daily_statistics(forecast: pandas.DataFrame, measured: pandas.DataFrame,
+                     rated_power: pandas.Series) -> dict:
+    """
+    Computes least squares sufficient statistics per site and day.
+    :param forecast: Forecasted output, time index and one column per site.
+    :param measured: Measured output with the same unit as forecast, time index and one column per site.
+    :param rated_power: Rated power per site with the same unit as forecast, indexed with site names.
+    :return: Dict {site: {"YYYY-MM-DD": [xx11, xx12, xx22, xy1, xy2, n]}}
+    """
+
+    sites = [site for site in forecast.columns if site in measured.columns and site in rated_power.index]
+    forecast, measured = forecast[sites].align(measured[sites], join="inner", axis=0)
+
+    # no measurements yet or a failed read, cached statistics are kept
+    if len(sites) == 0 or len(forecast.index) == 0:
+        return {}
+
+    f = forecast.to_numpy(dtype=float)
+    y = measured.to_numpy(dtype=float)
+    rated = rated_power[sites].to_numpy(dtype=float)
+
+    # rows where both values exist and the forecast is large enough for the logarithm to be meaningful
+    valid = numpy.isfinite(f) & numpy.isfinite(y) & (f > rated * 1e-3)
+    f = numpy.where(valid, f, 0.0)
+    y = numpy.where(valid, y, 0.0)
+
+    # design matrix columns, x1 = forecast, x2 = forecast * ln(relative output)
+    x1 = f
+    x2 = numpy.where(valid, f * numpy.log(numpy.maximum(f, 1e-12) / rated), 0.0)
+
+    products = numpy.stack([x1 * x1, x1 * x2, x2 * x2, x1 * y, x2 * y, valid.astype(float)])
+
+    # summing products for each day with one group by, result shape is (day, statistic, site)
+    days = forecast.index.date
+    stacked = pandas.DataFrame(products.transpose(1, 0, 2).reshape(len(forecast.index), -1))
+    sums = stacked.groupby(days).sum()
+    sums_array = sums.to_numpy().reshape(len(sums.index), len(__STAT_NAMES), len(sites))
+
+    statistics = {}
+    for site_number, site in enumerate(sites):
+        statistics[site] = {str(day): sums_array[day_number, :, site_number].tolist()
+                            for day_number, day in enumerate(sums.index)
+                            if sums_array[day_number, -1, site_number] > 0}
+
+    return statistics
+
+
+def update_calibration(forecast: pandas.DataFrame, measured: pandas.DataFrame, rated_power: pandas.Series,
+                       calibration=None, day_count=None, today=None) -> dict:
+    """
+    Incrementally updates calibration. Statistics are computed only for complete days which are missing from the cache,
+    days older than day_count are dropped and factors are refitted for all sites at once.
+    :param forecast: Forecasted output, time index and one column per site.
+    :param measured: Measured output, time index and one column per site.
+    :param rated_power: Rated power per site, indexed with site names.
+    :param calibration: Calibration dict, loaded from disk if not given.
+    :param day_count: Length of the fitting window in days, config.calibration_days by default.
+    :param today: Current date, days from today onwards are not complete and will not be cached.
+    :return: Updated calibration dict.
+    """
+
+    if calibration is None:
+        calibration = load_calibration()
+    if day_count is None:
+        day_count = config.calibration_days
+    if today is None:
+        today = datetime.datetime.now(datetime.timezone.utc).date()
+
+    first_day = today - datetime.timedelta(days=day_count)
+    stats = calibration.setdefault("stats", {})
+
+    # restricting new data to complete days within the window which are missing from the cache of any site
+    index_days = pandas.Index(forecast.index.date).astype(str)
+    window_days = {str(first_day + datetime.timedelta(days=i)) for i in range(day_count)}
+    missing_days = {day for day in window_days.intersection(index_days)
+                    if any(day not in stats.get(site, {}) for site in forecast.columns)}
+
+    if len(missing_days) > 0:
+        new_stats = daily_statistics(forecast[index_days.isin(missing_days)], measured, rated_power)
+        for site, site_stats in new_stats.items():
+            cached = stats.setdefault(site, {})
+            for day, values in site_stats.items():
+                cached.setdefault(day, values)
+
+    # dropping days which are out of the fitting window
+    for site in stats:
+        stats[site] = {day: values for day, values in stats[site].items()
+                       if first_day <= datetime.date.fromisoformat(day) < today}
+
+    calibration["factors"] = fit_factors(stats)
+
+    return calibration
+
+
+def fit_factors(stats: dict) -> dict:
+    """
+    Solves correction factors for all sites from cached daily statistics with one batched least squares solve.
+    Regularization pulls factors towards DEFAULT_FACTORS which keeps sites with little data close to the model.
+    :param stats: Dict {site: {date: [statistics]}}
+    :return: Dict {site: [a, b]}
+    """
+
+    sites = [site for site in stats if len(stats[site]) > 0]
+    if len(sites) == 0:
+        return {}
+
+    # summing daily statistics, shape (site, statistic)
+    totals = numpy.array([numpy.sum(list(stats[site].values()), axis=0) for site in sites])
+    xx11, xx12, xx22, xy1, xy2, n = totals.T
+
+    xtx = numpy.empty((len(sites), 2, 2))
+    xtx[:, 0, 0] = xx11
+    xtx[:, 0, 1] = xx12
+    xtx[:, 1, 0] = xx12
+    xtx[:, 1, 1] = xx22
+    xty = numpy.stack([xy1, xy2], axis=1)
+
+    # ridge regularization relative to the scale of each diagonal element, ridge*(xx11, xx22)
+    prior = numpy.array(DEFAULT_FACTORS)
+    ridge = config.calibration_regularization * numpy.stack([xx11, xx22], axis=1) + 1e-9
+    xtx[:, 0, 0] += ridge[:, 0]
+    xtx[:, 1, 1] += ridge[:, 1]
+    xty = xty + ridge * prior
+
+    factors = numpy.linalg.solve(xtx, xty[:, :, None])[:, :, 0]
+
+    # sites with too few samples keep default factors
+    too_few = n < config.calibration_min_samples
+    factors[too_few] = prior
+
+    factors[:, 0] = numpy.clip(factors[:, 0], config.calibration_gain_limits[0], config.calibration_gain_limits[1])
+
+    return {site: factors[number].tolist() for number, site in enumerate(sites)}
+
+
+def apply_calibration(df: pandas.DataFrame, factors=None, rated_power=None) -> pandas.DataFrame:
+    """
+    Applies correction factors to output column of a pipeline dataframe. Uncorrected output is stored as
+    "output_uncalibrated" which is the value used when fitting factors later. Output quantile columns of
+    helpers/uncertainty.py are corrected with the same factors.
+    :param df: Pipeline dataframe with output column in watts.
+    :param factors: (a, b) correction factors, DEFAULT_FACTORS if None.
+    :param rated_power: Rated power in kW, config.rated_power by default.
+    :return: Input df with corrected output column.
+    """
+
+    if "output" not in df.columns:
+        print("column output not found in dataframe, calibration can not be applied")
+        return df
+
+    if factors is None:
+        factors = DEFAULT_FACTORS
+    if rated_power is None:
+        rated_power = config.rated_power
+
+    a, b = factors
+    output = df["output"].to_numpy(dtype=float)
+    df["output_uncalibrated"] = output
+
+    for column in ["output"] + [column for column in df.columns if column.startswith("output_q")]:
+        values = df[column].to_numpy(dtype=float)
+        relative_output = numpy.maximum(values, 1e-12) / (rated_power * 1000.0)
+        multiplier = numpy.maximum(a + b * numpy.log(relative_output), 0.0)
+        df[column] = numpy.where(values > 0, values * multiplier, 0.0)
+
+    return df
+
+
+def get_site_factors(site=None, calibration=None) -> tuple:
+    """
+    Returns cached correction factors for a site or DEFAULT_FACTORS if site has not been calibrated.
+    :param site: Site name, config.site_name by default.
+    :param calibration: Calibration dict, loaded from disk if not given.
+    :return: (a, b)
+    """
+    if site is None:
+        site = config.site_name
+    if calibration is None:
+        calibration = load_calibration()
+
+    return tuple(calibration.get("factors", {}).get(site, DEFAULT_FACTORS))
@@ -0,0 +1,115 @@
+"""
+Daylight only evaluation of the PV model pipeline. At Finnish latitudes the sun is below the horizon for most of the
+day during winter, yet the step by step pipeline evaluates transpositions, reflections, temperatures and output for
+every row. Functions in this file run the pipeline steps only for rows which can produce power and write the results
+back into the full dataframe.
+
+Rows are processed in two groups:
+Steps 2-4 (transpositions and reflections): rows where the sun is above the horizon or any of dni, dhi, ghi is above
+zero. Irradiance of an hour long FMI open data row can be positive even when the sun is below the horizon at the
+timestamp of the row, these rows are kept so that results match the full pipeline.
+Steps 5-6 (temperature and output): rows with absorbed radiation above zero.
+
+Skipped rows get zero for all added columns, except for module_temp which is set to air temperature as the panels
+do not absorb any radiation.
+"""
+
+import numpy
+import pandas
+
+from helpers import astronomical_calculations
+from helpers import irradiance_transpositions
+from helpers import reflection_estimator
+from helpers import panel_temperature_estimator
+from helpers import output_estimator
+from helpers import profiling
+import config
+
+
+def get_daylight_mask(df: pandas.DataFrame, zenith=None) -> numpy.ndarray:
+    """
+    :param df: Irradiance dataframe with dni, dhi and ghi columns and a datetime index.
+    :param zenith: Apparent solar zenith of each row, computed from df index if not given.
+    :return: Boolean numpy array, True for rows which can produce power.
+    """
+
+    if zenith is None:
+        zenith = astronomical_calculations.get_solar_azimuth_zenit_fast(df.index)[1]
+
+    irradiance = df[["dni", "dhi", "ghi"]].to_numpy(dtype=float)
+
+    return (numpy.asarray(zenith) < 90) | numpy.any(irradiance > 0, axis=1)
+
+
+def process_daylight_rows(df: pandas.DataFrame, weather_donor=None) -> pandas.DataFrame:
+    """
+    Runs pipeline steps 2-6 only for rows which can produce power.
+    :param df: Irradiance dataframe from solar_irradiance_estimator.py
+    :param weather_donor: Dataframe with wind and T columns, same as data_fmi in main.get_pvlib_data(). If not given,
+    dummy wind and temperature values from config are added when the columns are missing.
+    :return: Input df with the same columns as produced by the full pipeline.
+    """
+
+    daylight = get_daylight_mask(df)
+    print("Daylight mask: processing " + str(int(daylight.sum())) + " of " + str(len(daylight)) + " rows")
+
+    def transpose_and_reflect(data):
+        # step 2. project irradiance components to plane of array:
+        with profiling.stage("transpose"):
+            data = irradiance_transpositions.irradiance_df_to_poa_df(data)
+
+        with profiling.stage("reflect"):
+            # step 3. simulate how much of irradiance components is absorbed:
+            data = reflection_estimator.add_reflection_corrected_poa_components_to_df(data)
+
+            # step 4. compute sum of reflection-corrected components:
+            data = reflection_estimator.add_reflection_corrected_poa_to_df(data)
+        return data
+
+    df = __run_on_rows(df, daylight, transpose_and_reflect)
+
+    # step 4.1. adding wind and air temperature
+    if weather_donor is not None:
+        df = panel_temperature_estimator.add_wind_and_temp_to_df1_from_df2(df, weather_donor)
+    else:
+        df = panel_temperature_estimator.add_dummy_wind_and_temp(df, config.wind_speed, config.air_temp)
+
+    def temperature_and_output(data):
+        # step 5. estimate panel temperature based on wind speed, air temperature and absorbed radiation
+        with profiling.stage("temperature"):
+            data = panel_temperature_estimator.add_estimated_panel_temperature(data)
+
+        # step 6. estimate power output
+        with profiling.stage("output"):
+            data = output_estimator.add_output_to_df(data)
+        return data
+
+    absorbing = (df["poa_ref_cor"] > 0).to_numpy()
+    df = __run_on_rows(df, absorbing, temperature_and_output, {"module_temp": df["T"].to_numpy(dtype=float)})
+
+    return df
+
+
+def __run_on_rows(df: pandas.DataFrame, mask: numpy.ndarray, function, skipped_values=None) -> pandas.DataFrame:
+    """
+    Runs function on masked rows and scatters the columns it adds back to the full dataframe.
+    :param df: Full dataframe.
+    :param mask: Boolean numpy array of rows to process.
+    :param function: Function which takes a dataframe and returns it with new columns.
+    :param skipped_values: Dict {column: numpy array} of values for skipped rows, zero for other columns.
+    :return: Full dataframe with new columns.
+    """
+
+    if skipped_values is None:
+        skipped_values = {}
+
+    result = function(df[mask].copy())
+
+    for column in result.columns:
+        if column in df.columns:
+            continue
+        values = numpy.array(skipped_values.get(column, numpy.zeros(len(df.index))), dtype=float)
+        values[mask] = result[column].to_numpy(dtype=float)
+        df[column] = values
+
+    return df
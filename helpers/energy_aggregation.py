@@ -0,0 +1,106 @@
+"""
+Energy aggregation functions. Used for converting PV output power time series to hourly, daily and per forecast horizon
+energy sums. Plotting, csv exporting and InfluxDB energy measurements use these same functions so that daily kWh
+values are computed the same way everywhere.
+
+Energy of a single row is power * resolution, meaning that each row is assumed to represent the mean power of a
+data_resolution long interval. Rows are grouped to days by the local date of their timestamp.
+
+Terminology:
+Horizon: Day offset from the reference date. Horizon 0 is today, 1 tomorrow and 2 the day after tomorrow.
+"""
+
+import numpy
+import pandas
+
+import config
+from helpers import time_index
+
+
+def aggregate_energy(time, power, resolution=None, timezone=None, reference_date=None) -> dict:
+    """
+    Computes hourly, daily and per horizon energy with one resampling pass over the input rows. Daily and horizon
+    sums are computed from the hourly sums.
+    :param time: Tz-aware timestamps, pandas series or index.
+    :param power: Power values in watts, same length as time.
+    :param resolution: Minutes between rows, config.data_resolution by default.
+    :param timezone: Timezone used for day boundaries, config.local_timezone by default.
+    :param reference_date: Date of horizon 0, current date in given timezone by default.
+    :return: Dict with keys
+    "hourly": Dataframe with columns startTime, endTime(UTC) and energy_kwh for hours which contain data.
+    "daily": Dataframe with columns startTime, endTime(UTC), energy_kwh, hours and horizon, indexed by local date.
+    "horizon": Series of energy_kwh indexed by horizon.
+    """
+
+    if resolution is None:
+        resolution = config.data_resolution
+    if timezone is None:
+        timezone = config.local_timezone
+
+    local_time = pandas.DatetimeIndex(time).tz_convert(timezone)
+    if reference_date is None:
+        reference_date = pandas.Timestamp.now(tz=timezone).date()
+
+    # W -> kWh per row
+    energy = pandas.Series(numpy.asarray(power, dtype=float) * (resolution / 60.0) / 1000.0, index=local_time)
+
+    # the only pass over the full resolution data
+    hourly = energy.resample("h").agg(["sum", "count"])
+    hourly = hourly[hourly["count"] > 0]
+
+    # daily sums from hourly sums, resampling handles daylight saving days with 23 or 25 hours
+    daily = hourly["sum"].resample("D").agg(["sum", "count"])
+    daily = daily[daily["count"] > 0]
+
+    daily_df = pandas.DataFrame({
+        "startTime": daily.index.tz_convert("UTC"),
+        "endTime": (daily.index + pandas.DateOffset(days=1)).tz_convert("UTC"),
+        "energy_kwh": daily["sum"].to_numpy(),
+        "hours": daily["count"].to_numpy(),
+    }, index=pandas.Index(daily.index.date, name="date"))
+    daily_df["horizon"] = [(day - reference_date).days for day in daily_df.index]
+
+    hourly_df = pandas.DataFrame({
+        "startTime": hourly.index.tz_convert("UTC"),
+        "endTime": hourly.index.tz_convert("UTC") + pandas.Timedelta(hours=1),
+        "energy_kwh": hourly["sum"].to_numpy(),
+    })
+
+    horizon = daily_df.set_index("horizon")["energy_kwh"]
+
+    return {"hourly": hourly_df, "daily": daily_df, "horizon": horizon}
+
+
+def daily_energy(df: pandas.DataFrame, resolution=None, timezone=None) -> pandas.Series:
+    """
+    Shorthand for daily energy sums of a pipeline dataframe.
+    :param df: Dataframe with output column, rows are grouped by their interval centers.
+    :param resolution: Minutes between rows, config.data_resolution by default.
+    :param timezone: Timezone used for day boundaries, config.local_timezone by default.
+    :return: Series of kWh values indexed by local date.
+    """
+    return aggregate_energy(time_index.get_times(df), df["output"], resolution, timezone)["daily"]["energy_kwh"]
+
+
+def split_by_horizon(df: pandas.DataFrame, time_column: str, horizons: list, timezone=None,
+                     reference_date=None) -> dict:
+    """
+    Splits rows of a dataframe to forecast horizons with one grouping pass.
+    :param df: Dataframe with a tz-aware time column.
+    :param time_column: Name of the time column used for day boundaries.
+    :param horizons: List of wanted horizons, for example [1, 2] for tomorrow and the day after.
+    :param timezone: Timezone used for day boundaries, config.local_timezone by default.
+    :param reference_date: Date of horizon 0, current date in given timezone by default.
+    :return: Dict {horizon: dataframe}, empty dataframe for horizons without rows.
+    """
+
+    if timezone is None:
+        timezone = config.local_timezone
+    if reference_date is None:
+        reference_date = pandas.Timestamp.now(tz=timezone).date()
+
+    local_dates = df[time_column].dt.tz_convert(timezone).dt.normalize().dt.tz_localize(None)
+    horizon = (local_dates - pandas.Timestamp(reference_date)).dt.days
+
+    groups = dict(list(df.groupby(horizon.to_numpy())))
+    return {h: groups.get(h, df.iloc[0:0]) for h in horizons}
@@ -0,0 +1,334 @@
+"""
+Hierarchical aggregation of fleet forecasts. Per site forecasts are stored as rows of a site x time matrix and summed to
+the levels of config.aggregation_levels, for example site -> feeder -> region -> portfolio. Each site dict in
+config.sites can have a key for each level, sites without a key belong to group "unassigned" of that level.
+
+Sums of all groups of a level are computed with a single matrix product between a group x site membership matrix and
+the site x time matrix. When only some sites are refreshed, update_fleet_state() adds the change of the refreshed rows
+to the groups of those sites instead of summing the whole fleet again. Refreshed forecasts replace earlier values only
+at their own times, earlier hours keep their values and the state keeps config.fleet_state_days of history before the
+latest forecasts. The state records the group of each site, when a site has moved to another group or has been removed
+from config.sites the groups of that level are summed again from the site x time matrix. get_changed_aggregates()
+returns only the rows of the levels changed by the latest update.
+
+Aggregates can be written as InfluxDB measurements, one measurement per level with a field per group, or as Parquet
+partitions. Parquet requires the optional pyarrow package, csv files with the same partition layout are written if it
+is not installed.
+"""
+
+import os
+import numpy
+import pandas
+
+import config
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+def build_site_matrix(forecasts: dict, column="output", time_column="endTime") -> (pandas.DatetimeIndex, list,
+                                                                                  numpy.ndarray):
+    """
+    :param forecasts: Dict {site_name: forecast dataframe}
+    :param column: Forecast column to aggregate.
+    :param time_column: Column with row timestamps, the index is used if the column does not exist.
+    :return: Sorted union of forecast times, site names and site x time matrix. Missing values are nan.
+    """
+
+    series = {site_name: __forecast_series(forecast, column, time_column) for site_name, forecast in forecasts.items()}
+
+    indexes = [values.index for values in series.values()]
+    times = indexes[0]
+    for index in indexes[1:]:
+        times = times.union(index)
+    times = times.sort_values()
+
+    sites = list(series)
+    matrix = numpy.full((len(sites), len(times)), numpy.nan)
+    for number, site_name in enumerate(sites):
+        matrix[number, times.get_indexer(series[site_name].index)] = series[site_name].to_numpy(dtype=float)
+
+    return times, sites, matrix
+
+
+def get_membership(sites: list, level: str, site_params=None) -> (list, numpy.ndarray):
+    """
+    :param sites: Site names in matrix row order.
+    :param level: Hierarchy level, for example "region".
+    :param site_params: List of site dicts, config.sites by default.
+    :return: Group names of the level and group x site membership matrix of ones and zeros.
+    """
+
+    codes, groups = pandas.factorize(pandas.Series(get_site_groups(sites, level, site_params), dtype=object))
+
+    membership = numpy.zeros((len(groups), len(sites)))
+    membership[codes, numpy.arange(len(sites))] = 1.0
+
+    return list(groups), membership
+
+
+def get_site_groups(sites: list, level: str, site_params=None) -> list:
+    """
+    :param sites: Site names.
+    :param level: Hierarchy level, for example "region".
+    :param site_params: List of site dicts, config.sites by default.
+    :return: Group name of each site in the level, "unassigned" for sites without a group.
+    """
+
+    if site_params is None:
+        site_params = config.sites
+    params = {site["site_name"]: site for site in site_params}
+
+    return [str(params.get(site_name, {}).get(level, "unassigned")) for site_name in sites]
+
+
+def aggregate(times, sites: list, matrix: numpy.ndarray, levels=None, site_params=None) -> dict:
+    """
+    Sums site rows to groups of each hierarchy level.
+    :param times: Times of matrix columns.
+    :param sites: Site names of matrix rows.
+    :param matrix: Site x time matrix from build_site_matrix()
+    :param levels: Hierarchy levels, config.aggregation_levels by default.
+    :param site_params: List of site dicts, config.sites by default.
+    :return: Dict {level: dataframe indexed by time with a column for each group}. Missing site values count as zero.
+    """
+
+    if levels is None:
+        levels = config.aggregation_levels
+
+    values = numpy.nan_to_num(matrix, nan=0.0)
+
+    aggregates = {}
+    for level in levels:
+        groups, membership = get_membership(sites, level, site_params)
+        aggregates[level] = pandas.DataFrame((membership @ values).T, index=times, columns=groups)
+
+    return aggregates
+
+
+def create_fleet_state(forecasts: dict, levels=None, site_params=None, column="output") -> dict:
+    """
+    :param forecasts: Dict {site_name: forecast dataframe}
+    :param levels: Hierarchy levels, config.aggregation_levels by default.
+    :param site_params: List of site dicts, config.sites by default.
+    :param column: Forecast column to aggregate.
+    :return: State dict with keys "times", "sites", "matrix", "column", "aggregates", see aggregate(), and "groups" with
+    the group of each site as {level: {site_name: group}}. All times and groups are listed as changed, see
+    update_fleet_state().
+    """
+    times, sites, matrix = build_site_matrix(forecasts, column)
+    aggregates = aggregate(times, sites, matrix, levels, site_params)
+    return {"times": times, "sites": sites, "matrix": matrix, "column": column, "aggregates": aggregates,
+            "groups": {level: dict(zip(sites, get_site_groups(sites, level, site_params))) for level in aggregates},
+            "changed": {level: list(aggregates_df.columns) for level, aggregates_df in aggregates.items()},
+            "changed_times": times}
+
+
+def update_fleet_state(state: dict, forecasts: dict, site_params=None) -> dict:
+    """
+    Replaces the forecasts of refreshed sites at the times of the refreshed forecasts and updates only the groups of
+    those sites. Values of earlier times are kept, times older than config.fleet_state_days before the first refreshed
+    time are dropped. Sites which are not refreshed and not in site_params are removed. Levels where a site has moved
+    to another group or has been removed are summed again from the matrix at all times.
+    :param state: State from create_fleet_state() or an earlier update.
+    :param forecasts: Dict {site_name: forecast dataframe} of refreshed sites, new sites are added to the fleet.
+    :param site_params: List of site dicts, config.sites by default.
+    :return: Updated state. Aggregate columns which changed are listed under key "changed" as {level: [groups]} and
+    their changed times under key "changed_times".
+    """
+
+    if site_params is None:
+        site_params = config.sites
+    new_times, new_sites, new_matrix = build_site_matrix(forecasts, state["column"])
+
+    # rows of sites removed from the fleet
+    site_names = {site["site_name"] for site in site_params}
+    kept = [site_name in site_names or site_name in new_sites for site_name in state["sites"]]
+    if not all(kept):
+        state["sites"] = [site_name for site_name, keep in zip(state["sites"], kept) if keep]
+        state["matrix"] = state["matrix"][numpy.array(kept)]
+
+    # extending time axis and site rows of the state where needed
+    times = state["times"].union(new_times)
+    if not times.equals(state["times"]):
+        matrix = numpy.full((len(state["sites"]), len(times)), numpy.nan)
+        matrix[:, times.get_indexer(state["times"])] = state["matrix"]
+        state["matrix"] = matrix
+        state["aggregates"] = {level: aggregates.reindex(times, fill_value=0.0)
+                               for level, aggregates in state["aggregates"].items()}
+        state["times"] = times
+
+    added_sites = [site_name for site_name in new_sites if site_name not in state["sites"]]
+    if added_sites:
+        state["sites"] = state["sites"] + added_sites
+        state["matrix"] = numpy.vstack([state["matrix"], numpy.full((len(added_sites), len(times)), numpy.nan)])
+
+    # refreshed rows in state order at the refreshed times, values missing from the new forecasts are kept
+    rows = numpy.array([state["sites"].index(site_name) for site_name in new_sites], dtype=numpy.int64)
+    columns = times.get_indexer(new_times)
+    previous = state["matrix"][numpy.ix_(rows, columns)]
+    refreshed = numpy.where(numpy.isnan(new_matrix), previous, new_matrix)
+
+    delta = numpy.nan_to_num(refreshed, nan=0.0) - numpy.nan_to_num(previous, nan=0.0)
+    state["matrix"][numpy.ix_(rows, columns)] = refreshed
+
+    state["changed"] = {}
+    state["changed_times"] = new_times
+    previous_groups = state.get("groups", {})
+    state["groups"] = {}
+    for level in state["aggregates"]:
+        site_groups = dict(zip(state["sites"], get_site_groups(state["sites"], level, site_params)))
+        groups, membership = get_membership(new_sites, level, site_params)
+        aggregates = state["aggregates"][level]
+
+        # sites with another group than in the previous update, states saved without site groups are summed again
+        level_groups = previous_groups.get(level)
+        moved = None if level_groups is None else {site_name: group for site_name, group in level_groups.items()
+                                                   if site_groups.get(site_name) != group}
+        if moved is None or len(moved) > 0:
+            # old groups keep their columns, they are zero when all of their sites have left
+            rebuilt = aggregate(times, state["sites"], state["matrix"], [level], site_params)[level]
+            state["aggregates"][level] = rebuilt.reindex(columns=aggregates.columns.union(rebuilt.columns, sort=False),
+                                                         fill_value=0.0)
+            if moved is None:
+                changed = list(state["aggregates"][level].columns)
+            else:
+                changed = groups + list(moved.values()) + [site_groups[site_name] for site_name in moved
+                                                           if site_name in site_groups]
+            state["changed"][level] = list(dict.fromkeys(changed))
+            state["changed_times"] = times
+        else:
+            for group in groups:
+                if group not in aggregates.columns:
+                    aggregates[group] = 0.0
+            aggregates.iloc[columns, aggregates.columns.get_indexer(groups)] += (membership @ delta).T
+            state["changed"][level] = groups
+        state["groups"][level] = site_groups
+
+    if len(new_times) > 0:
+        __trim_fleet_state(state, new_times.min() - pandas.Timedelta(days=config.fleet_state_days))
+
+    return state
+
+
+def get_changed_aggregates(state: dict, whole_days=False) -> dict:
+    """
+    Rows of the aggregates changed by the latest update. Rows contain all groups of their level, so that written
+    points and files replace earlier ones completely.
+    :param state: State from create_fleet_state() or update_fleet_state()
+    :param whole_days: Returns all times of the UTC dates of changed times, for rewriting the daily partitions of
+    write_aggregates_to_parquet().
+    :return: Dict {level: dataframe} with the changed rows of each level which has changed groups.
+    """
+    if whole_days:
+        dates = numpy.unique(__utc_dates(state["changed_times"]))
+    changed = {}
+    for level, aggregates_df in state["aggregates"].items():
+        if len(state["changed"].get(level, [])) == 0:
+            continue
+        if whole_days:
+            changed[level] = aggregates_df[numpy.isin(__utc_dates(aggregates_df.index), dates)]
+        else:
+            changed[level] = aggregates_df[aggregates_df.index.isin(state["changed_times"])]
+    return changed
+
+
+def __trim_fleet_state(state: dict, first_time):
+    """
+    Drops times before first_time from the matrix and aggregates of a state.
+    """
+    kept = state["times"] >= first_time
+    if kept.all():
+        return
+    state["times"] = state["times"][kept]
+    state["matrix"] = state["matrix"][:, kept]
+    state["aggregates"] = {level: aggregates_df[kept] for level, aggregates_df in state["aggregates"].items()}
+
+
+def save_fleet_state(state: dict, path=None):
+    """
+    :param state: State from create_fleet_state()
+    :param path: File path, config.save_directory + "fleet_state.pkl" by default.
+    """
+    if path is None:
+        path = config.save_directory + "fleet_state.pkl"
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    pandas.to_pickle(state, path)
+
+
+def load_fleet_state(path=None):
+    """
+    :param path: File path, config.save_directory + "fleet_state.pkl" by default.
+    :return: State dict, None if no state has been saved.
+    """
+    if path is None:
+        path = config.save_directory + "fleet_state.pkl"
+    if not os.path.exists(path):
+        return None
+    return pandas.read_pickle(path)
+
+
+def write_aggregates_to_influx(aggregates: dict, write_function, measurement_prefix="pv_forecast_"):
+    """
+    Writes each level as its own measurement, for example "pv_forecast_region", with a field for each group.
+    :param aggregates: Dict {level: dataframe} from aggregate()
+    :param write_function: Function taking a dataframe with startTime and endTime columns and a measurement name, for
+    example get_forecast.write_to_influx.
+    :param measurement_prefix: Prefix of measurement names.
+    """
+    for level, aggregates_df in aggregates.items():
+        data = aggregates_df.copy()
+        data.insert(loc=0, column="endTime", value=data.index)
+        data.insert(loc=0, column="startTime", value=data.index - pandas.Timedelta(hours=1))
+        write_function(data.reset_index(drop=True), measurement_prefix + level)
+
+
+def write_aggregates_to_parquet(aggregates: dict, directory=None) -> list:
+    """
+    Writes aggregates partitioned by level and UTC date:
+    <directory>/level=<level>/date=<yyyy-mm-dd>/aggregates.parquet
+    Csv files are written instead if pyarrow is not installed.
+    :param aggregates: Dict {level: dataframe} from aggregate()
+    :param directory: Root directory, config.save_directory + "aggregates/" by default.
+    :return: Paths of the written files.
+    """
+
+    if directory is None:
+        directory = config.save_directory + "aggregates/"
+    if pyarrow is None:
+        print("pyarrow not installed, writing aggregates as csv files")
+
+    paths = []
+    for level, aggregates_df in aggregates.items():
+        for date, day_df in aggregates_df.groupby(__utc_dates(aggregates_df.index)):
+            partition = os.path.join(directory, "level=" + level, "date=" + str(date))
+            os.makedirs(partition, exist_ok=True)
+            day_df = day_df.rename_axis("time")
+            day_df.columns = [str(column) for column in day_df.columns]
+            if pyarrow is not None:
+                path = os.path.join(partition, "aggregates.parquet")
+                day_df.to_parquet(path)
+            else:
+                path = os.path.join(partition, "aggregates.csv")
+                day_df.to_csv(path, float_format="%.4f")
+            paths.append(path)
+
+    return paths
+
+
+def __utc_dates(times) -> numpy.ndarray:
+    times = pandas.DatetimeIndex(times)
+    return (times.tz_convert("UTC") if times.tz is not None else times).date
+
+
+def __forecast_series(forecast: pandas.DataFrame, column: str, time_column: str) -> pandas.Series:
+    if time_column in forecast.columns:
+        index = pandas.DatetimeIndex(forecast[time_column])
+    else:
+        index = pandas.DatetimeIndex(forecast.index)
+    series = pandas.Series(forecast[column].to_numpy(dtype=float), index=index)
+    return series[~series.index.duplicated(keep="last")]
@@ -0,0 +1,205 @@
+"""
+Append-only columnar archive of raw FMI open data HARMONIE inputs. FMI open data keeps only the latest model runs, so
+forecasts can not be recomputed for past days after a model change. With config.fmi_archive_mode = "append" every
+response of _meps_data_loader.collect_fmi_opendata() is appended to the archive before parsing, with "read" the
+loader reads the archive instead of FMI open data, which allows backfills and model comparisons at disk speed.
+
+Layout, one directory per query point under config.fmi_archive_directory:
+<column>.bin: Raw little endian values of one column, int64 for the time columns and float64 for the others. Files
+are only appended to and read as numpy memory maps.
+runs.bin: Index with one int64 row of RUN_FIELDS per appended response. A response is the model run of its origin time
+for the requested time range, its rows are sorted by valid time.
+
+Rows of a response are written to the column files first and its index row last, so the rows of a response which was
+interrupted are never read and are overwritten by the next append. Range reads select the responses overlapping the
+range from the index and the rows within each response with a binary search of the valid times, only those rows are
+read from disk.
+
+Radiation parameters of HARMONIE are accumulated from the model origin time, so reads return each response as its own
+dataframe and differences of accumulated values are computed within a single model run.
+
+The model origin time of a response is read from its om:resultTime element with get_origin_time(). Only if it is
+missing, for example in FMI open data fixtures recorded without the parsed XML, it is estimated as the latest run time
+config.fmi_publication_delay hours before fetching, runs are published every config.fmi_run_interval hours.
+"""
+
+import os
+import re
+
+import numpy
+import pandas
+
+import config
+
+
+# archived columns and their dtypes, time columns are seconds since epoch
+TIME_COLUMNS = ["valid_time", "origin_time", "fetch_time"]
+VALUE_COLUMNS = ["T", "ghi_accum", "net_sw_accum", "dir_hi_accum", "wind", "cloud_cover"]
+
+# fields of a row in runs.bin
+RUN_FIELDS = ["first_row", "row_count", "first_time", "last_time", "origin_time", "fetch_time"]
+
+# namespaces of the om:resultTime element in FMI WFS responses
+OM_RESULT_TIME = "{http://www.opengis.net/om/2.0}resultTime"
+GML_TIME_POSITION = "{http://www.opengis.net/gml/3.2}timePosition"
+
+
+def append(latlon: str, raw: pandas.DataFrame, origin_time=None, fetch_time=None, directory=None):
+    """
+    Appends one FMI open data response to the archive of its query point.
+    :param latlon: Query point, str(latitude) + "," + str(longitude)
+    :param raw: Dataframe with VALUE_COLUMNS indexed with valid times, naive timestamps are assumed to be in UTC.
+    :param origin_time: Model origin time from get_origin_time(), estimated from fetch_time only if not given.
+    :param fetch_time: Time of fetching, current time by default.
+    :param directory: Archive root directory, config.fmi_archive_directory by default.
+    """
+    if len(raw.index) == 0:
+        return
+
+    fetch_time = __to_timestamp(pandas.Timestamp.now(tz="UTC") if fetch_time is None else fetch_time)
+    if origin_time is None:
+        # fallback for responses without om:resultTime, the estimate is wrong when a model run is published late
+        origin_time = estimate_origin_time(fetch_time)
+        print("No model origin time in FMI open data response for " + latlon + ", estimated " + str(origin_time))
+    origin_time = __to_timestamp(origin_time)
+
+    path = __point_directory(latlon, directory)
+    os.makedirs(path, exist_ok=True)
+
+    raw = raw.sort_index()
+    valid_times = __to_seconds(raw.index)
+    columns = {"valid_time": valid_times,
+               "origin_time": numpy.full(len(valid_times), origin_time.value // 10 ** 9, dtype=numpy.int64),
+               "fetch_time": numpy.full(len(valid_times), fetch_time.value // 10 ** 9, dtype=numpy.int64)}
+    for column in VALUE_COLUMNS:
+        columns[column] = raw[column].to_numpy(dtype=numpy.float64)
+
+    runs = __read_runs(path)
+    first_row = int(runs[-1, 0] + runs[-1, 1]) if len(runs) > 0 else 0
+
+    for column, values in columns.items():
+        with open(os.path.join(path, column + ".bin"), "ab") as file:
+            # rows after the last indexed response are left over from an interrupted append
+            file.truncate(first_row * values.dtype.itemsize)
+            file.write(values.astype(values.dtype.newbyteorder("<"), copy=False).tobytes())
+
+    run = numpy.array([first_row, len(valid_times), valid_times[0], valid_times[-1], columns["origin_time"][0],
+                       columns["fetch_time"][0]], dtype="<i8")
+    with open(os.path.join(path, "runs.bin"), "ab") as file:
+        file.truncate(len(runs) * len(RUN_FIELDS) * 8)
+        file.write(run.tobytes())
+
+
+def read_runs(latlon: str, start, end, as_of=None, directory=None) -> list:
+    """
+    Reads archived responses which overlap a time range.
+    :param latlon: Query point, str(latitude) + "," + str(longitude)
+    :param start: Range start, naive timestamps are assumed to be in UTC.
+    :param end: Range end, inclusive.
+    :param as_of: Only responses of model runs with origin time at or before this time are read, all by default.
+    :param directory: Archive root directory, config.fmi_archive_directory by default.
+    :return: List of dataframes with VALUE_COLUMNS, one for each response in origin time order. Indexed with UTC
+    valid times, df.attrs["origin_time"] is the origin time of the run.
+    """
+    path = __point_directory(latlon, directory)
+    runs = __read_runs(path)
+    if len(runs) == 0:
+        return []
+
+    start_seconds = __to_timestamp(start).value // 10 ** 9
+    end_seconds = __to_timestamp(end).value // 10 ** 9
+    selected = (runs[:, 2] <= end_seconds) & (runs[:, 3] >= start_seconds)
+    if as_of is not None:
+        selected &= runs[:, 4] <= __to_timestamp(as_of).value // 10 ** 9
+    if not selected.any():
+        return []
+
+    row_total = int(runs[-1, 0] + runs[-1, 1])
+    maps = {column: numpy.memmap(os.path.join(path, column + ".bin"), mode="r", shape=(row_total,),
+                                 dtype="<i8" if column in TIME_COLUMNS else "<f8")
+            for column in ["valid_time"] + VALUE_COLUMNS}
+
+    results = []
+    # stable sort keeps the append order of responses of the same model run
+    for run in runs[selected][numpy.argsort(runs[selected][:, 4], kind="stable")]:
+        first_row, row_count = int(run[0]), int(run[1])
+        valid_times = maps["valid_time"][first_row:first_row + row_count]
+        low = first_row + int(numpy.searchsorted(valid_times, start_seconds, side="left"))
+        high = first_row + int(numpy.searchsorted(valid_times, end_seconds, side="right"))
+        if high <= low:
+            continue
+
+        index = pandas.to_datetime(numpy.asarray(maps["valid_time"][low:high]), unit="s", utc=True).as_unit("us")
+        df = pandas.DataFrame({column: numpy.array(maps[column][low:high]) for column in VALUE_COLUMNS}, index=index)
+        df.attrs["origin_time"] = pandas.Timestamp(int(run[4]), unit="s", tz="UTC")
+        results.append(df)
+
+    del maps
+    return results
+
+
+def list_runs(latlon: str, directory=None) -> pandas.DataFrame:
+    """
+    :param latlon: Query point, str(latitude) + "," + str(longitude)
+    :param directory: Archive root directory, config.fmi_archive_directory by default.
+    :return: Dataframe of the archive index with one row per response and columns of RUN_FIELDS, times as UTC
+    timestamps.
+    """
+    runs = pandas.DataFrame(__read_runs(__point_directory(latlon, directory)), columns=RUN_FIELDS)
+    for field in ["first_time", "last_time", "origin_time", "fetch_time"]:
+        runs[field] = pandas.to_datetime(runs[field], unit="s", utc=True)
+    return runs
+
+
+def get_origin_time(root):
+    """
+    :param root: Parsed XML root of an FMI WFS response, fmiopendata keeps it in the _xml attribute of its results.
+    :return: Model origin time from the first om:resultTime element as a UTC pandas Timestamp, None if the response
+    has no origin time.
+    """
+    if root is None:
+        return None
+    for result_time in root.iter(OM_RESULT_TIME):
+        position = result_time.find(".//" + GML_TIME_POSITION)
+        if position is not None and position.text:
+            return pandas.Timestamp(position.text).tz_convert("UTC")
+    return None
+
+
+def estimate_origin_time(fetch_time) -> pandas.Timestamp:
+    """
+    Fallback for responses without an origin time, see get_origin_time().
+    :param fetch_time: Time the model run was fetched.
+    :return: Origin time of the latest model run which was published at fetch time, UTC.
+    """
+    published = __to_timestamp(fetch_time) - pandas.Timedelta(hours=config.fmi_publication_delay)
+    return published.floor(str(config.fmi_run_interval) + "h")
+
+
+def __read_runs(path: str) -> numpy.ndarray:
+    """
+    :return: int64 array with shape (response count, len(RUN_FIELDS)), partially written rows are ignored.
+    """
+    filename = os.path.join(path, "runs.bin")
+    if not os.path.exists(filename):
+        return numpy.empty((0, len(RUN_FIELDS)), dtype=numpy.int64)
+    values = numpy.fromfile(filename, dtype="<i8")
+    run_count = len(values) // len(RUN_FIELDS)
+    return values[:run_count * len(RUN_FIELDS)].reshape(run_count, len(RUN_FIELDS)).astype(numpy.int64)
+
+
+def __point_directory(latlon: str, directory=None) -> str:
+    if directory is None:
+        directory = config.fmi_archive_directory
+    return os.path.join(directory, re.sub(r"[^0-9.\-]+", "_", latlon.strip()))
+
+
+def __to_timestamp(time) -> pandas.Timestamp:
+    time = pandas.Timestamp(time)
+    return time.tz_localize("UTC") if time.tz is None else time.tz_convert("UTC")
+
+
+def __to_seconds(index) -> numpy.ndarray:
+    index = pandas.DatetimeIndex(index)
+    index = index.tz_localize("UTC") if index.tz is None else index.tz_convert("UTC")
+    return index.as_unit("s").asi8
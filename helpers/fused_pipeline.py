@@ -0,0 +1,291 @@
+"""
+Fused single pass version of the PV model pipeline. Computes system output directly from irradiance, weather and solar
+geometry arrays without adding the intermediate columns (dni_poa, dhi_poa, ghi_poa, poa, dni_rc, dhi_rc, ghi_rc,
+poa_ref_cor, module_temp) to a dataframe. Solar position is computed only once.
+
+The equations are the same as in the step by step pipeline:
+irradiance_transpositions.py -> reflection_estimator.py -> panel_temperature_estimator.py -> output_estimator.py
+Function __debug_compare_fused_pipeline() in __testing.py checks that both pipelines give the same output.
+
+Two backends are available:
+"numpy": Vectorized numpy implementation, no extra dependencies.
+"numba": Compiled loop which processes each timestamp once from start to end. Requires the optional numba package,
+falls back to numpy if numba is not installed.
+
+The fused pipeline is intended for large runs such as fleets of installations and backfills.
+"""
+
+import math
+import numpy
+import pandas
+
+import config
+from helpers import astronomical_calculations
+from helpers import irradiance_transpositions
+from helpers import reflection_estimator
+from helpers import panel_temperature_estimator
+from helpers import output_estimator
+from helpers import daylight_mask
+from helpers import horizon_shading
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+# compiled kernel, created on first use
+__numba_kernel = None
+
+# temperature models of the numba kernel as (form, p0, p1, p2), same equations as panel_temperature_estimator.py
+# form 0: absorbed * exp(p0 + p1 * wind) + air_temp + p2 * absorbed
+# form 1: air_temp + p0 * absorbed / (p1 + p2 * wind)
+__NUMBA_TEMPERATURE_MODELS = {
+    "king": (0, panel_temperature_estimator.KING_A, panel_temperature_estimator.KING_B, 0.0),
+    "sapm": (0, panel_temperature_estimator.KING_A, panel_temperature_estimator.KING_B,
+             panel_temperature_estimator.SAPM_DELTA_T / 1000.0),
+    "faiman": (1, 1.0, panel_temperature_estimator.FAIMAN_U0, panel_temperature_estimator.FAIMAN_U1),
+    "pvsyst": (1, panel_temperature_estimator.PVSYST_ALPHA_ABSORPTION *
+               (1.0 - panel_temperature_estimator.PVSYST_MODULE_EFFICIENCY),
+               panel_temperature_estimator.PVSYST_U_C, panel_temperature_estimator.PVSYST_U_V)}
+
+
+def process_irradiance_df(df: pandas.DataFrame, backend="numpy", daylight_only=None) -> pandas.DataFrame:
+    """
+    Adds output column to an irradiance dataframe with dni, dhi and ghi columns. Uses albedo, T and wind columns if they
+    exist, config values otherwise. Solar geometry is computed from df index, same as in the step by step pipeline.
+    :param df: Irradiance dataframe from solar_irradiance_estimator.py
+    :param backend: "numpy" or "numba"
+    :param daylight_only: Compute output only for rows which can receive radiation, config.daylight_only by default.
+    :return: Input df with output column.
+    """
+
+    if daylight_only is None:
+        daylight_only = config.daylight_only
+
+    geometry = astronomical_calculations.get_solar_geometry(df.index)
+
+    def column_or_default(name, default):
+        if name in df.columns:
+            return df[name].to_numpy(dtype=float)
+        return numpy.full(len(df.index), default, dtype=float)
+
+    inputs = [df["dni"].to_numpy(dtype=float), df["dhi"].to_numpy(dtype=float), df["ghi"].to_numpy(dtype=float),
+              column_or_default("albedo", config.albedo), column_or_default("T", config.air_temp),
+              column_or_default("wind", config.wind_speed)]
+
+    if not daylight_only:
+        df["output"] = compute_output(*inputs, geometry, backend=backend)
+        return df
+
+    # same rows as in helpers/daylight_mask.py, mask uses the already computed zenith
+    daylight = daylight_mask.get_daylight_mask(df, geometry["apparent_zenith"])
+    output = numpy.zeros(len(df.index))
+    output[daylight] = compute_output(*[values[daylight] for values in inputs],
+                                      {key: values[daylight] for key, values in geometry.items()}, backend=backend)
+    df["output"] = output
+    return df
+
+
+def compute_output(dni, dhi, ghi, albedo, air_temp, wind, geometry: dict, tilt=None, azimuth=None,
+                   rated_power=None, module_elevation=None, backend="numpy", a_r=None,
+                   temperature_model=None, horizon_profile=None) -> numpy.ndarray:
+    """
+    Computes PV system output in watts from irradiance and weather arrays.
+    :param dni: Direct normal irradiance, numpy array.
+    :param dhi: Diffuse horizontal irradiance, numpy array.
+    :param ghi: Global horizontal irradiance, numpy array.
+    :param albedo: Ground albedo, numpy array.
+    :param air_temp: Air temperature in Celsius, numpy array.
+    :param wind: Wind speed at 2m in m/s, numpy array.
+    :param geometry: Solar geometry dict from astronomical_calculations.get_solar_geometry()
+    :param tilt: Panel tilt, config.tilt by default.
+    :param azimuth: Panel azimuth, config.azimuth by default.
+    :param rated_power: Rated power in kW, config.rated_power by default.
+    :param module_elevation: Module elevation in meters, config.module_elevation by default.
+    :param backend: "numpy" or "numba"
+    :param a_r: Panel reflectance constant, reflection_estimator.reflectance_constant by default.
+    :param temperature_model: Name of a model in panel_temperature_estimator.TEMPERATURE_MODELS,
+    config.temperature_model by default.
+    :param horizon_profile: Horizon profile of helpers/horizon_shading.py, config.horizon_profile by default.
+    :return: Output in watts, numpy array.
+
+    Installation parameters can also be numpy arrays, for example a grid of orientations. Parameter arrays broadcast
+    together and the result has shape broadcast(parameters).shape + (time count,). Albedo can be an array with the
+    same leading dimensions as the parameters and a time axis. Parameter arrays are only supported by the numpy
+    backend.
+    """
+
+    if tilt is None:
+        tilt = config.tilt
+    if azimuth is None:
+        azimuth = config.azimuth
+    if rated_power is None:
+        rated_power = config.rated_power
+    if module_elevation is None:
+        module_elevation = config.module_elevation
+    if a_r is None:
+        a_r = reflection_estimator.reflectance_constant
+    if temperature_model is None:
+        temperature_model = config.temperature_model
+    horizon_table = horizon_shading.get_horizon_table(horizon_profile)
+
+    if backend == "numba":
+        if any(numpy.ndim(value) > 0 for value in [tilt, azimuth, rated_power, module_elevation, a_r]) or \
+                numpy.ndim(albedo) > 1:
+            print("numba backend does not support parameter arrays, using numpy backend")
+        elif temperature_model not in __NUMBA_TEMPERATURE_MODELS:
+            print("numba backend does not support temperature model '" + str(temperature_model) +
+                  "', using numpy backend")
+        elif numba is not None:
+            return __compute_output_numba(dni, dhi, ghi, albedo, air_temp, wind, geometry, tilt, azimuth,
+                                          rated_power, module_elevation, a_r, temperature_model, horizon_table)
+        else:
+            print("numba not installed, using numpy backend")
+
+    return __compute_output_numpy(dni, dhi, ghi, albedo, air_temp, wind, geometry, tilt, azimuth, rated_power,
+                                  module_elevation, a_r, temperature_model, horizon_table)
+
+
+def __compute_output_numpy(dni, dhi, ghi, albedo, air_temp, wind, geometry, tilt, azimuth, rated_power,
+                           module_elevation, a_r, temperature_model, horizon_table) -> numpy.ndarray:
+
+    # installation parameters with an added time axis so that parameter arrays broadcast over time
+    tilt_t, rated_power_t, module_elevation_t, a_r_t = [numpy.asarray(value, dtype=float)[..., None]
+                                                        for value in [tilt, rated_power, module_elevation, a_r]]
+
+    # step 2. projections to plane of array
+    projection = astronomical_calculations.get_aoi_projection(geometry, tilt, azimuth)
+    angle_of_incidence = numpy.clip(numpy.degrees(numpy.arccos(projection)), 0, 90)
+    dni_poa = numpy.abs(dni * numpy.cos(numpy.radians(angle_of_incidence)))
+    if len(horizon_table) > 0:
+        dni_poa = dni_poa * horizon_shading.get_beam_factor(geometry["azimuth"], geometry["apparent_zenith"],
+                                                            horizon_table)
+    dhi_poa = irradiance_transpositions.get_perez_sky_diffuse(dhi, dni, geometry, tilt, azimuth)
+    ghi_poa = ghi * albedo * (1.0 - numpy.cos(numpy.radians(tilt_t))) / 2.0
+
+    # step 3. and 4. absorbed radiation
+    dni_reflected, dhi_reflected, ghi_reflected = reflection_estimator.get_reflection_losses(angle_of_incidence,
+                                                                                           tilt_t, a_r_t)
+    absorbed = (1 - dni_reflected) * dni_poa + (1 - dhi_reflected) * dhi_poa + (1 - ghi_reflected) * ghi_poa
+    absorbed = numpy.where(absorbed < 0, 0.0, absorbed)
+
+    # step 5. module temperature, air temperature is used where the model gives nan
+    module_temp = panel_temperature_estimator.temperature_of_module(absorbed, wind, module_elevation_t, air_temp,
+                                                                    temperature_model)
+    module_temp = numpy.where(numpy.isnan(module_temp), air_temp, module_temp)
+
+    # step 6. output, zero for radiation under 0.1W and nan values
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        output = output_estimator.estimate_output(absorbed, module_temp, rated_power_t)
+    output = numpy.where(absorbed < 0.1, 0.0, output)
+
+    return numpy.nan_to_num(output, nan=0.0)
+
+
+def __compute_output_numba(dni, dhi, ghi, albedo, air_temp, wind, geometry, tilt, azimuth, rated_power,
+                           module_elevation, a_r, temperature_model, horizon_table) -> numpy.ndarray:
+    global __numba_kernel
+
+    if __numba_kernel is None:
+        __numba_kernel = numba.njit(cache=True, error_model="numpy")(__fused_kernel)
+
+    dni_reflected, dhi_reflected, ghi_reflected = reflection_estimator.get_reflection_losses(0.0, tilt, a_r)
+
+    output = numpy.empty(len(dni), dtype=float)
+    __numba_kernel(numpy.ascontiguousarray(dni, dtype=float), numpy.ascontiguousarray(dhi, dtype=float),
+                   numpy.ascontiguousarray(ghi, dtype=float), numpy.ascontiguousarray(albedo, dtype=float),
+                   numpy.ascontiguousarray(air_temp, dtype=float), numpy.ascontiguousarray(wind, dtype=float),
+                   geometry["apparent_zenith"], geometry["azimuth"], geometry["airmass"], geometry["dni_extra"],
+                   float(tilt), float(azimuth), float(a_r),
+                   float(dhi_reflected), float(ghi_reflected), float((module_elevation / 10) ** 0.1429),
+                   *__NUMBA_TEMPERATURE_MODELS[temperature_model],
+                   float(rated_power) * 1000.0, irradiance_transpositions.PEREZ_F1,
+                   irradiance_transpositions.PEREZ_F2, irradiance_transpositions.PEREZ_EPSILON_BINS, horizon_table,
+                   horizon_shading.TABLE_RESOLUTION, output)
+    return output
+
+
+def __fused_kernel(dni, dhi, ghi, albedo, air_temp, wind, zenith, solar_azimuth, airmass, dni_extra, tilt, azimuth,
+                   a_r, dhi_reflected, ghi_reflected, wind_height_factor, temperature_form, t0, t1, t2, rated_power_w,
+                   f1c, f2c, epsilon_bins, horizon, horizon_resolution, output):
+    """
+    Scalar loop version of __compute_output_numpy(), compiled with numba. Writes results to output array.
+    """
+
+    cos_tilt = math.cos(math.radians(tilt))
+    sin_tilt = math.sin(math.radians(tilt))
+    ghi_factor = (1.0 - cos_tilt) / 2.0
+    exp_ar = math.exp(-1.0 / a_r)
+    cos_85 = math.cos(math.radians(85.0))
+    kappa = 1.041
+
+    for i in range(len(dni)):
+        z = math.radians(zenith[i])
+
+        # angle of incidence, same as pvlib.irradiance.aoi
+        projection = (math.cos(z) * cos_tilt +
+                      math.sin(z) * sin_tilt * math.cos(math.radians(solar_azimuth[i] - azimuth)))
+        projection = min(max(projection, -1.0), 1.0)
+        aoi = min(max(math.degrees(math.acos(projection)), 0.0), 90.0)
+        cos_aoi = math.cos(math.radians(aoi))
+
+        dni_poa = abs(dni[i] * cos_aoi)
+
+        # horizon shading, same lookup as horizon_shading.get_beam_factor(), empty horizon is unobstructed
+        if len(horizon) > 0:
+            solar_azimuth_i = 0.0 if math.isnan(solar_azimuth[i]) else solar_azimuth[i]
+            horizon_index = int(math.floor(solar_azimuth_i / horizon_resolution + 0.5)) % len(horizon)
+            if 90.0 - zenith[i] < horizon[horizon_index]:
+                dni_poa = 0.0
+        ghi_poa = ghi[i] * albedo[i] * ghi_factor
+
+        # perez diffuse, same as pvlib.irradiance.perez
+        if math.isnan(airmass[i]):
+            dhi_poa = 0.0
+        else:
+            delta = dhi[i] * airmass[i] / dni_extra[i]
+            epsilon = ((dhi[i] + dni[i]) / dhi[i] + kappa * z ** 3) / (1.0 + kappa * z ** 3)
+            epsilon_bin = -1
+            if not math.isnan(epsilon):
+                for bin_number in range(len(epsilon_bins)):
+                    if epsilon >= epsilon_bins[bin_number]:
+                        epsilon_bin = bin_number
+            if epsilon_bin < 0:
+                dhi_poa = math.nan
+            else:
+                f1 = max(f1c[epsilon_bin, 0] + f1c[epsilon_bin, 1] * delta + f1c[epsilon_bin, 2] * z, 0.0)
+                f2 = f2c[epsilon_bin, 0] + f2c[epsilon_bin, 1] * delta + f2c[epsilon_bin, 2] * z
+                a = max(projection, 0.0)
+                b = max(math.cos(z), cos_85)
+                sky = dhi[i] * (0.5 * (1.0 - f1) * (1.0 + cos_tilt) + f1 * a / b + f2 * sin_tilt)
+                dhi_poa = max(sky, 0.0)
+
+        # absorbed radiation
+        dni_reflected = (math.exp(-cos_aoi / a_r) - exp_ar) / (1.0 - exp_ar)
+        absorbed = (1.0 - dni_reflected) * dni_poa + (1.0 - dhi_reflected) * dhi_poa + (1.0 - ghi_reflected) * ghi_poa
+
+        if math.isnan(absorbed) or absorbed < 0.1:
+            output[i] = 0.0
+            continue
+
+        # module temperature, forms of __NUMBA_TEMPERATURE_MODELS
+        wind_speed = wind_height_factor * wind[i]
+        if temperature_form == 0:
+            module_temp = absorbed * math.exp(t0 + t1 * wind_speed) + air_temp[i] + t2 * absorbed
+        else:
+            module_temp = air_temp[i] + t0 * absorbed / (t1 + t2 * wind_speed)
+        if math.isnan(module_temp):
+            module_temp = air_temp[i]
+
+        # Huld 2010 output
+        nrad = absorbed / 1000.0
+        log_nrad = math.log(nrad)
+        t_diff = module_temp - 25.0
+        efficiency = (1.0 - 0.017162 * log_nrad - 0.040289 * log_nrad ** 2
+                      + t_diff * (-0.004681 + 0.000148 * log_nrad + 0.000169 * log_nrad ** 2)
+                      + 0.000005 * t_diff ** 2)
+        efficiency = max(efficiency, 0.5)
+
+        value = rated_power_w * nrad * efficiency
+        output[i] = 0.0 if math.isnan(value) else value
@@ -0,0 +1,89 @@
+"""
+Beam shading by the local horizon. Neighbouring buildings, trees and terrain block direct sunlight when the sun is low,
+which at Finnish latitudes is a large part of the year. A horizon profile gives the elevation of the horizon as seen
+from the panels for a set of azimuths:
+{azimuth in degrees: horizon elevation in degrees}, for example {0: 0, 90: 15, 180: 5, 270: 25}
+or the name of a csv file with azimuth and elevation columns, azimuths use the same convention as config.azimuth.
+
+Profiles are interpolated linearly between the given azimuths (wrapping around north) into a lookup table with one
+horizon elevation every TABLE_RESOLUTION degrees of azimuth. Tables are compiled once per profile and kept in memory,
+so shading a run costs one table lookup per timestamp. DNI is shaded where the apparent solar elevation is below the
+horizon elevation at the solar azimuth, diffuse and ground reflected irradiance are not changed.
+
+The active profile is config.horizon_profile, sites can set their own profile with a "horizon_profile" key in
+config.sites. None or an empty profile is an unobstructed horizon.
+"""
+
+import numpy
+import pandas
+
+import config
+
+
+# degrees of azimuth between lookup table entries
+TABLE_RESOLUTION = 0.5
+
+# tables compiled during this run, keys are profile items or csv file names
+__table_cache = {}
+
+
+def get_horizon_table(profile=None) -> numpy.ndarray:
+    """
+    :param profile: Horizon profile dict or csv file name, config.horizon_profile by default.
+    :return: Horizon elevations in degrees for azimuths 0, TABLE_RESOLUTION, 2 * TABLE_RESOLUTION, ... below 360. Empty
+    array for an unobstructed horizon.
+    """
+    if profile is None:
+        profile = config.horizon_profile
+    if profile is None or len(profile) == 0:
+        return numpy.empty(0, dtype=float)
+
+    key = profile if isinstance(profile, str) else tuple(sorted((float(azimuth), float(elevation))
+                                                                for azimuth, elevation in profile.items()))
+    if key not in __table_cache:
+        if isinstance(profile, str):
+            profile = __read_profile_file(profile)
+        __table_cache[key] = __compile_table(profile)
+
+    return __table_cache[key]
+
+
+def get_beam_factor(solar_azimuth, solar_apparent_zenith, table=None) -> numpy.ndarray:
+    """
+    :param solar_azimuth: Solar azimuth in degrees, numpy array or pandas series.
+    :param solar_apparent_zenith: Apparent solar zenith in degrees, same length as solar_azimuth.
+    :param table: Lookup table from get_horizon_table(), table of config.horizon_profile by default.
+    :return: numpy array, 0.0 where the sun is behind the horizon and 1.0 elsewhere.
+    """
+    if table is None:
+        table = get_horizon_table()
+    solar_apparent_zenith = numpy.asarray(solar_apparent_zenith, dtype=float)
+    if len(table) == 0:
+        return numpy.ones(solar_apparent_zenith.shape)
+
+    horizon = table[get_table_indices(solar_azimuth, len(table))]
+    return numpy.where(90.0 - solar_apparent_zenith < horizon, 0.0, 1.0)
+
+
+def get_table_indices(solar_azimuth, table_length: int) -> numpy.ndarray:
+    """
+    :return: Indices of the nearest lookup table entries, the fused numba kernel uses the same rounding.
+    """
+    azimuth = numpy.nan_to_num(numpy.asarray(solar_azimuth, dtype=float), nan=0.0)
+    return numpy.floor(azimuth / TABLE_RESOLUTION + 0.5).astype(numpy.int64) % table_length
+
+
+def __compile_table(profile: dict) -> numpy.ndarray:
+    azimuths = numpy.array(list(profile.keys()), dtype=float) % 360.0
+    elevations = numpy.array(list(profile.values()), dtype=float)
+    table_azimuths = numpy.arange(0.0, 360.0, TABLE_RESOLUTION)
+    return numpy.interp(table_azimuths, azimuths, elevations, period=360.0)
+
+
+def __read_profile_file(filename: str) -> dict:
+    """
+    Reads a csv file with azimuth and elevation columns, other columns are ignored.
+    """
+    profile = pandas.read_csv(filename)
+    profile.columns = [str(column).strip().lower() for column in profile.columns]
+    return dict(zip(profile["azimuth"], profile["elevation"]))
@@ -18,6 +18,7 @@ import pandas
 import pandas as pd
 import pvlib.irradiance
 import helpers.astronomical_calculations as astronomical_calculations
+from helpers import horizon_shading
 import config
 
 
@@ -76,15 +77,19 @@ def __project_dni_to_panel_surface_using_time_fast(dni: float, dt: datetime)-> f
     :param dt: Time of simulation
     :return: Direct radiation per 1m² of solar panel surface
 
-    This version of the function is fairly well optimized.
+    This version of the function is fairly well optimized. Direct radiation is shaded when the sun is behind the
+    horizon of config.horizon_profile, see helpers/horizon_shading.py
     """
 
-
-    angle_of_incidence = astronomical_calculations.get_solar_angle_of_incidence_fast(dt)
+    solar_position = astronomical_calculations.get_solar_azimuth_zenit_fast(dt)
+    angle_of_incidence = astronomical_calculations.get_solar_angle_of_incidence_fast(dt, solar_position)
 
 
     output = numpy.abs(__project_dni_to_panel_surface_using_angle(dni, angle_of_incidence))
 
+    if len(horizon_shading.get_horizon_table()) > 0:
+        output = output * horizon_shading.get_beam_factor(*solar_position)
+
     return output
 
 
@@ -140,6 +145,105 @@ def __project_dhi_to_panel_surface_perez_fast(time: datetime, dhi: float, dni: f
     return dhi_perez
 
 
+"""
+VECTORIZED PEREZ
+Native version of the Perez model used by vectorized pipelines. Takes precomputed solar geometry and computes the
+sky diffuse irradiance for any number of panel orientations at once. Orientation independent terms, sky clearness bins
+and brightness coefficients, are computed only once per timestamp.
+"""
+
+# Perez 1990 all sites composite coefficients, same values pvlib uses by default. Columns are constant, delta and
+# zenith angle coefficients, rows are clearness bins from overcast to clear. Last row maps invalid clearness to nan.
+PEREZ_F1 = numpy.array([[-0.008, 0.588, -0.062],
+                        [0.130, 0.683, -0.151],
+                        [0.330, 0.487, -0.221],
+                        [0.568, 0.187, -0.295],
+                        [0.873, -0.392, -0.362],
+                        [1.132, -1.237, -0.412],
+                        [1.060, -1.600, -0.359],
+                        [0.678, -0.327, -0.250],
+                        [numpy.nan, numpy.nan, numpy.nan]])
+PEREZ_F2 = numpy.array([[-0.060, 0.072, -0.022],
+                        [-0.019, 0.066, -0.029],
+                        [0.055, -0.064, -0.026],
+                        [0.109, -0.152, -0.014],
+                        [0.226, -0.462, 0.001],
+                        [0.288, -0.823, 0.056],
+                        [0.264, -1.127, 0.131],
+                        [0.156, -1.377, 0.251],
+                        [numpy.nan, numpy.nan, numpy.nan]])
+
+# lower limits of the sky clearness bins
+PEREZ_EPSILON_BINS = numpy.array([0.0, 1.065, 1.23, 1.5, 1.95, 2.8, 4.5, 6.2])
+
+
+def get_perez_sky_diffuse(dhi, dni, geometry: dict, tilt=None, azimuth=None):
+    """
+    Perez sky diffuse irradiance on panel surfaces. Results match pvlib.irradiance.perez with the default
+    allsitescomposite1990 coefficients.
+    :param dhi: Diffuse horizontal irradiance, numpy array.
+    :param dni: Direct normal irradiance, numpy array.
+    :param geometry: Solar geometry dict from astronomical_calculations.get_solar_geometry()
+    :param tilt: Panel tilt in degrees, float or numpy array of orientations. config.tilt by default.
+    :param azimuth: Panel azimuth in degrees, float or numpy array of orientations. config.azimuth by default.
+    :return: numpy array with shape broadcast(tilt, azimuth).shape + dhi.shape
+    """
+
+    if tilt is None:
+        tilt = config.tilt
+    if azimuth is None:
+        azimuth = config.azimuth
+
+    dhi = numpy.asarray(dhi, dtype=float)
+    dni = numpy.asarray(dni, dtype=float)
+    z = numpy.radians(geometry["apparent_zenith"])
+    airmass = geometry["airmass"]
+
+    # orientation independent part
+    f1, f2 = __perez_brightness_coefficients(dhi, dni, z, airmass, geometry["dni_extra"])
+    b = numpy.maximum(numpy.cos(z), math.cos(numpy.radians(85)))
+
+    # orientation dependent part, broadcasting orientations over time
+    a = numpy.maximum(astronomical_calculations.get_aoi_projection(geometry, tilt, azimuth), 0)
+    panel_tilt = numpy.radians(numpy.asarray(tilt, dtype=float))[..., None]
+
+    term1 = 0.5 * (1 - f1) * (1 + numpy.cos(panel_tilt))
+    term2 = f1 * a / b
+    term3 = f2 * numpy.sin(panel_tilt)
+
+    sky_diffuse = numpy.maximum(dhi * (term1 + term2 + term3), 0)
+
+    # sun below horizon
+    return numpy.where(numpy.isnan(airmass), 0.0, sky_diffuse)
+
+
+def __perez_brightness_coefficients(dhi, dni, z, airmass, dni_extra):
+    """
+    Circumsolar(F1) and horizon(F2) brightness coefficients of the Perez model. Clearness bins are looked up from
+    PEREZ_EPSILON_BINS and coefficients from PEREZ_F1 and PEREZ_F2.
+    :return: F1, F2 numpy arrays
+    """
+
+    kappa = 1.041
+
+    # sky brightness
+    delta = dhi * airmass / dni_extra
+
+    # sky clearness
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        epsilon = ((dhi + dni) / dhi + kappa * z ** 3) / (1 + kappa * z ** 3)
+
+    # bin index 0 is overcast and 7 clear, invalid values are mapped to the nan row
+    epsilon_bin = numpy.searchsorted(PEREZ_EPSILON_BINS, epsilon, side="right") - 1
+    epsilon_bin[numpy.isnan(epsilon)] = -1
+
+    f1 = PEREZ_F1[epsilon_bin, 0] + PEREZ_F1[epsilon_bin, 1] * delta + PEREZ_F1[epsilon_bin, 2] * z
+    f1 = numpy.maximum(f1, 0)
+    f2 = PEREZ_F2[epsilon_bin, 0] + PEREZ_F2[epsilon_bin, 1] * delta + PEREZ_F2[epsilon_bin, 2] * z
+
+    return f1, f2
+
+
 def __project_ghi_to_panel_surface(ghi: float, albedo=config.albedo)-> float:
     """
     Equation from
@@ -0,0 +1,147 @@
+"""
+Cached site climatology for PVlib clear sky modeling. Without an explicit linke_turbidity argument, the PVlib Ineichen
+model reads monthly Linke turbidity values from the LinkeTurbidities.h5 file bundled with PVlib on every call, and
+pvlib Location objects created without an altitude read the altitude from another bundled file.
+
+This file reads both values once per site and keeps them in memory and in a json file so that repeated runs, fleets of
+sites and backfills do not repeat the file reads. The cache file contains:
+{"latitude,longitude": {"altitude": meters, "linke_turbidity": [12 monthly values]}}
+
+Monthly values are interpolated to days of year in the same way as pvlib.clearsky.lookup_linke_turbidity().
+"""
+
+import calendar
+import json
+import os
+import numpy
+import pandas
+from pvlib import clearsky, location
+
+import config
+
+
+# site entries read during this run, keys are the same as in the cache file
+__site_cache = {}
+
+
+def get_site_climatology(latitude: float, longitude: float) -> dict:
+    """
+    :param latitude: Site latitude in degrees.
+    :param longitude: Site longitude in degrees.
+    :return: Dict with "altitude" in meters and "linke_turbidity", numpy array of 12 monthly Linke turbidity values.
+    """
+
+    key = str(round(float(latitude), 4)) + "," + str(round(float(longitude), 4))
+
+    if key not in __site_cache:
+        file_cache = __load_cache_file()
+        if key not in file_cache:
+            file_cache[key] = __read_site_climatology(latitude, longitude)
+            __save_cache_file(file_cache)
+        __site_cache[key] = {"altitude": file_cache[key]["altitude"],
+                             "linke_turbidity": numpy.array(file_cache[key]["linke_turbidity"], dtype=float)}
+
+    return __site_cache[key]
+
+
+def get_altitude(latitude=None, longitude=None) -> float:
+    """
+    :return: Site altitude in meters, same value as used by pvlib Location objects created without an altitude.
+    Uses config coordinates by default.
+    """
+    if latitude is None:
+        latitude = config.latitude
+    if longitude is None:
+        longitude = config.longitude
+    return get_site_climatology(latitude, longitude)["altitude"]
+
+
+def get_linke_turbidity(times: pandas.DatetimeIndex, latitude=None, longitude=None) -> pandas.Series:
+    """
+    Same as pvlib.clearsky.lookup_linke_turbidity(times, latitude, longitude) but without reading the h5 file.
+    :param times: Times for the turbidity values.
+    :param latitude: Site latitude, config.latitude by default.
+    :param longitude: Site longitude, config.longitude by default.
+    :return: Series of Linke turbidity values indexed by times.
+    """
+    if latitude is None:
+        latitude = config.latitude
+    if longitude is None:
+        longitude = config.longitude
+
+    monthly = get_site_climatology(latitude, longitude)["linke_turbidity"]
+    return pandas.Series(interpolate_linke_turbidity(monthly, times), index=times)
+
+
+def interpolate_linke_turbidity(monthly, times: pandas.DatetimeIndex) -> numpy.ndarray:
+    """
+    Interpolates monthly values to the day of year of each time, monthly values are assumed to be at the middle of
+    each month.
+    :param monthly: Monthly Linke turbidity values, numpy array with shape (12,) or (site count, 12).
+    :param times: Times to interpolate to.
+    :return: numpy array with shape (time count,) or (site count, time count).
+    """
+
+    monthly = numpy.asarray(monthly, dtype=float)
+
+    # previous December and next January for the first and last half months
+    padded = numpy.concatenate([monthly[..., -1:], monthly, monthly[..., :1]], axis=-1)
+
+    times_utc = times.tz_convert("UTC") if times.tz is not None else times
+    day_of_year = numpy.asarray(times_utc.dayofyear, dtype=float)
+    is_leap = numpy.asarray(times_utc.is_leap_year)
+
+    # interpolation position of each time, identical for all sites
+    position = numpy.where(is_leap,
+                           numpy.interp(day_of_year, __month_middles(True), numpy.arange(14)),
+                           numpy.interp(day_of_year, __month_middles(False), numpy.arange(14)))
+    lower = numpy.minimum(numpy.floor(position).astype(numpy.int64), 12)
+    fraction = position - lower
+
+    return padded[..., lower] * (1 - fraction) + padded[..., lower + 1] * fraction
+
+
+def __month_middles(leap: bool) -> numpy.ndarray:
+    """
+    Day of year of the middle of each month including previous December and next January, same as in pvlib.
+    """
+    month_days = numpy.array(calendar.mdays[1:], dtype=float)
+    year_days = 365
+    if leap:
+        month_days[1] += 1
+        year_days = 366
+    return numpy.concatenate([[-calendar.mdays[-1] / 2.0],
+                              numpy.cumsum(month_days) - month_days / 2.0,
+                              [year_days + calendar.mdays[1] / 2.0]])
+
+
+def __read_site_climatology(latitude: float, longitude: float) -> dict:
+    """
+    Reads altitude and monthly Linke turbidity values from the files bundled with pvlib.
+    """
+
+    # one time in the middle of each month, monthly values are returned without interpolation
+    month_times = pandas.DatetimeIndex([pandas.Timestamp(2001, month, 15, tz="UTC") for month in range(1, 13)])
+    turbidity = clearsky.lookup_linke_turbidity(month_times, latitude, longitude, interp_turbidity=False)
+
+    return {"altitude": float(location.lookup_altitude(latitude, longitude)),
+            "linke_turbidity": [float(value) for value in turbidity]}
+
+
+def __load_cache_file() -> dict:
+    if not os.path.exists(config.linke_turbidity_cache_file):
+        return {}
+    try:
+        with open(config.linke_turbidity_cache_file) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        print("Could not read Linke turbidity cache " + config.linke_turbidity_cache_file + ", reading pvlib files")
+        return {}
+
+
+def __save_cache_file(file_cache: dict):
+    directory = os.path.dirname(config.linke_turbidity_cache_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(config.linke_turbidity_cache_file, "w") as file:
+        json.dump(file_cache, file, indent=1)
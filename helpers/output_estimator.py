@@ -53,7 +53,7 @@ def add_output_to_df(df: pandas.DataFrame)-> pandas.DataFrame:
     # this line makes sure the output estimation is not called when per w² radiation is below 0.1W. If the radiation is
     # this low, the system would not produce any power and values of 0.0 cause issues as the output model contains
     # logarithms
-    df['output'] = df.apply(lambda row: 0.0 if row['poa_ref_cor'] < 0.1 else __estimate_output(row['poa_ref_cor'], row['module_temp']),axis=1 )
+    df['output'] = df.apply(lambda row: 0.0 if row['poa_ref_cor'] < 0.1 else estimate_output(row['poa_ref_cor'], row['module_temp']),axis=1 )
 
     # filling nans
     df['output'] = df['output'].fillna(0.0)
@@ -61,7 +61,7 @@ def add_output_to_df(df: pandas.DataFrame)-> pandas.DataFrame:
     return df
 
 
-def __estimate_output(absorbed_radiation: float, panel_temp: float)-> float:
+def estimate_output(absorbed_radiation: float, panel_temp: float, rated_power=None)-> float:
 
     """
     Huld 2010 model
@@ -83,6 +83,7 @@ def __estimate_output(absorbed_radiation: float, panel_temp: float)-> float:
 
     :param absorbed_radiation: Solar irradiance absorbed by m² of solar panel surface.
     :param panel_temp: Estimated solar panel temperature.
+    :param rated_power: Rated power in kW, config.rated_power by default. Works with floats and numpy arrays.
     :return: Estimated system output in watts.
     """
 
@@ -113,7 +114,9 @@ def __estimate_output(absorbed_radiation: float, panel_temp: float)-> float:
 
     nrad = absorbed_radiation / 1000.0
     Tdiff = panel_temp - 25
-    rated_power = config.rated_power * 1000.0
+    if rated_power is None:
+        rated_power = config.rated_power
+    rated_power = rated_power * 1000.0
     base = 1
 
     part_k1 = k1 * numpy.log(nrad)
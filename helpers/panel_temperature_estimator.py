@@ -2,11 +2,17 @@
 This file contains functions for estimating PV panel temperatures and transferring temperature data from another
 dataframe.
 
+Module temperature models are registered in TEMPERATURE_MODELS. Each model is a vectorized function with the
+signature model(absorbed_radiation, wind_speed, air_temperature) where wind_speed is the wind speed at module height,
+see get_wind_at_module_height(). The model is selected with config.temperature_model, sites in config.sites can
+override it with a "temperature_model" key.
+
 Author: TimoSalola (Timo Salola).
 """
-import math
+import numpy
 import pandas
 import config
+from helpers import time_index
 
 
 def add_estimated_panel_temperature(df:pandas.DataFrame)-> pandas.DataFrame:
@@ -37,16 +43,28 @@ def add_estimated_panel_temperature(df:pandas.DataFrame)-> pandas.DataFrame:
         print("Aborting")
         return df
 
-    def helper_add_panel_temp(df):
-        estimated_temp = temperature_of_module(df["poa_ref_cor"], df["wind"], config.module_elevation, df["T"])
-        if math.isnan(estimated_temp):
-            return df["T"]
-        else:
-            return estimated_temp
+    air_temperature = df["T"].to_numpy(dtype=float)
+    estimated_temp = temperature_of_module(df["poa_ref_cor"].to_numpy(dtype=float), df["wind"].to_numpy(dtype=float),
+                                           config.module_elevation, air_temperature)
+
+    # storing result as a new column, air temperature where the model gives nan
+    df["module_temp"] = numpy.where(numpy.isnan(estimated_temp), air_temperature, estimated_temp)
+
+    return df
 
-    # applying helper function to dataset and storing result as a new column
-    df["module_temp"] = df.apply(helper_add_panel_temp, axis=1)
 
+def add_module_temperatures_of_all_models(df: pandas.DataFrame, models=None) -> pandas.DataFrame:
+    """
+    Adds a module temperature column for each temperature model, for example module_temp_faiman. Used for comparing
+    models, module_temp column and output are not changed.
+    :param df: Dataframe with T, wind and poa_ref_cor columns.
+    :param models: List of model names, all models of TEMPERATURE_MODELS by default.
+    :return: Input df with module_temp_<model> columns.
+    """
+    temperatures = get_module_temperatures(df["poa_ref_cor"].to_numpy(dtype=float), df["wind"].to_numpy(dtype=float),
+                                           config.module_elevation, df["T"].to_numpy(dtype=float), models)
+    for model, values in temperatures.items():
+        df["module_temp_" + model] = values
     return df
 
 
@@ -84,50 +102,153 @@ def add_wind_and_temp_to_df1_from_df2(df1: pandas.DataFrame, df2: pandas.DataFra
     :param df1: target df, pvlib generated multi day df
     :param df2: donor df, fmi open generated multi day df
     :return: target df with wind and T columns which are from df2
+
+    Weather values are linearly interpolated in time to the interval centers of df1, df1 keeps its rows and index.
+    Times before the first or after the last donor value get the first or last donor value. Interval centers follow
+    the time conventions of both dataframes, see helpers/time_index.py
     """
 
-    # If df1 does not have values where minute == 30, the frames do not align well. Can cause issues.
-    # alignment issues can be avoided by using config.data_resolution of 60, 30, 15, 10, 5, 1
+    values = interpolate_to_times(time_index.get_times(df1), time_index.get_times(df2),
+                                  df2[["wind", "T"]].to_numpy(dtype=float))
+
+    df1["wind"] = values[:, 0]
+    df1["T"] = values[:, 1]
 
-    # creating weather df
-    weather_df = df2[["time", "wind", "T"]]
+    return df1
 
-    # joining weather df to df1
-    df1 = df1.merge(weather_df, on="time", how="outer")
 
-    # filling in nan values for wind
-    df1['wind'] = df1['wind'].interpolate(limit_direction='both')
+def interpolate_to_times(target_times, donor_times, donor_values: numpy.ndarray) -> numpy.ndarray:
+    """
+    Linear interpolation of donor values to target times. Times are handled as int64 epoch nanoseconds so that the
+    interpolation is a sorted search instead of a join, the cost grows with n log n and no rows are added.
+    :param target_times: Times to interpolate to, datetime Series or DatetimeIndex.
+    :param donor_times: Times of donor values, datetime Series or DatetimeIndex.
+    :param donor_values: numpy array with shape (donor time count,) or (donor time count, column count).
+    :return: numpy array with shape (target time count,) or (target time count, column count). Nan donor values are
+    skipped, columns without any values are nan.
+    """
 
-    # filling in nan values for temp
-    df1['T'] = df1['T'].interpolate(limit_direction='both')
+    target = __to_epoch(target_times).astype(float)
+    donor = __to_epoch(donor_times)
 
-    return df1
+    donor_values = numpy.asarray(donor_values, dtype=float)
+    columns = donor_values.reshape(len(donor), -1)
 
+    # numpy.interp requires increasing donor times
+    order = numpy.argsort(donor, kind="stable")
+    donor = donor[order].astype(float)
+    columns = columns[order]
 
-def temperature_of_module(absorbed_radiation: float, wind: float, module_elevation: float, air_temperature: float) ->float:
+    result = numpy.full((len(target), columns.shape[1]), numpy.nan)
+    for column_number in range(columns.shape[1]):
+        valid = ~numpy.isnan(columns[:, column_number])
+        if valid.any():
+            result[:, column_number] = numpy.interp(target, donor[valid], columns[valid, column_number])
+
+    return result.reshape((len(target),) + donor_values.shape[1:])
+
+
+def __to_epoch(times) -> numpy.ndarray:
     """
-    :param absorbed_radiation: radiation hitting solar panel after reflections are accounted for in W
-    :param wind: wind speed in meters per second
+    :return: Times as int64 nanoseconds since epoch, timezone aware times are converted to UTC.
+    """
+    return pandas.DatetimeIndex(times).as_unit("ns").asi8
+
+
+def temperature_of_module(absorbed_radiation, wind, module_elevation, air_temperature, model=None):
+    """
+    :param absorbed_radiation: radiation hitting solar panel after reflections are accounted for in W, float or numpy
+    array
+    :param wind: wind speed at 2m in meters per second
     :param module_elevation: module elevation from ground, in meters
     :param air_temperature: air temperature at 2m in Celsius
+    :param model: name of a model in TEMPERATURE_MODELS, config.temperature_model by default
     :return: module temperature in Celsius
+    """
+    if model is None:
+        model = config.temperature_model
+    if model not in TEMPERATURE_MODELS:
+        print("Unknown temperature model '" + str(model) + "', using king")
+        model = "king"
+
+    return TEMPERATURE_MODELS[model](absorbed_radiation, get_wind_at_module_height(wind, module_elevation),
+                                     air_temperature)
+
+
+def get_module_temperatures(absorbed_radiation, wind, module_elevation, air_temperature, models=None) -> dict:
+    """
+    Evaluates multiple temperature models for the same inputs. Wind speed at module height is computed once for all
+    models.
+    :param models: List of model names, all models of TEMPERATURE_MODELS by default.
+    :return: Dict {model name: module temperature in Celsius}
+    """
+    if models is None:
+        models = list(TEMPERATURE_MODELS)
+
+    wind_speed = get_wind_at_module_height(wind, module_elevation)
+    return {model: TEMPERATURE_MODELS[model](absorbed_radiation, wind_speed, air_temperature) for model in models}
+
+
+def get_wind_at_module_height(wind, module_elevation):
+    """
+    Wind speed at module elevation, assumes 0 speed at ground, wind speed vector len at 2m and forms a curve which
+    describes the wind speed transition from 0 to 10m wind speed to higher.
+    :param wind: wind speed in meters per second
+    :param module_elevation: module elevation from ground, in meters
+    :return: wind speed at module elevation in meters per second
+    """
+    return (module_elevation / 10) ** 0.1429 * wind
+
+
+# constants of the temperature models, open rack glass/glass modules for king and sapm
+KING_A = -3.47
+KING_B = -0.0594
+SAPM_DELTA_T = 3.0
+FAIMAN_U0 = 25.0
+FAIMAN_U1 = 6.84
+PVSYST_U_C = 29.0
+PVSYST_U_V = 0.0
+PVSYST_ALPHA_ABSORPTION = 0.9
+PVSYST_MODULE_EFFICIENCY = 0.1
+
+
+def king_temperature(absorbed_radiation, wind_speed, air_temperature):
+    """
+    Back of module temperature.
 
     King 2004 model
     D.~King, J.~Kratochvil, and W.~Boyson,
     Photovoltaic Array Performance Model Vol. 8,
     PhD thesis (Sandia Naitional Laboratories, 2004).
     """
+    return absorbed_radiation * numpy.exp(KING_A + KING_B * wind_speed) + air_temperature
+
 
-    # two empirical constants
-    constant_a = -3.47
-    constant_b = -0.0594
+def sapm_temperature(absorbed_radiation, wind_speed, air_temperature):
+    """
+    Cell temperature of the Sandia Array Performance Model, King 2004 back of module temperature and the difference
+    between cell and module back at 1000 W/m2.
+    """
+    return king_temperature(absorbed_radiation, wind_speed, air_temperature) + \
+        absorbed_radiation / 1000.0 * SAPM_DELTA_T
 
-    # wind is sometimes given as west/east components
 
-    # wind speed at model elevation, assumes 0 speed at ground, wind speed vector len at 2m and forms a
-    # curve which describes the wind speed transition from 0 to 10m wind speed to higher
-    wind_speed = (module_elevation / 10) ** 0.1429 * wind
+def faiman_temperature(absorbed_radiation, wind_speed, air_temperature):
+    """
+    Faiman 2008 model, D. Faiman, Assessing the outdoor operating temperature of photovoltaic modules, Progress in
+    Photovoltaics 16(4), 2008.
+    """
+    return air_temperature + absorbed_radiation / (FAIMAN_U0 + FAIMAN_U1 * wind_speed)
+
+
+def pvsyst_temperature(absorbed_radiation, wind_speed, air_temperature):
+    """
+    PVsyst cell temperature model with free standing module heat loss factors.
+    """
+    heat_input = absorbed_radiation * PVSYST_ALPHA_ABSORPTION * (1.0 - PVSYST_MODULE_EFFICIENCY)
+    return air_temperature + heat_input / (PVSYST_U_C + PVSYST_U_V * wind_speed)
 
-    module_temperature = absorbed_radiation * math.e ** (constant_a + constant_b * wind_speed) + air_temperature
 
-    return module_temperature
+# registry of temperature models, new models can be added with the same signature
+TEMPERATURE_MODELS = {"king": king_temperature, "sapm": sapm_temperature, "faiman": faiman_temperature,
+                      "pvsyst": pvsyst_temperature}
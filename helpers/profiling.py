@@ -0,0 +1,208 @@
+"""
+Profiling mode for the forecast entry points. get_forecast.py and main.py accept a --profile option which runs the
+whole program under a profiler, "python cli.py profile <subcommand>" profiles a single subcommand. Results are written
+into config.save_directory:
+
+<name>-profile.txt: Wall time of each pipeline stage and a per function report.
+<name>-profile.collapsed: Sampled call stacks in collapsed format, one "frame;frame;frame count" line per stack. Can be
+drawn as a flamegraph with flamegraph.pl or opened in speedscope. The pipeline stage of each sample is the root frame.
+<name>-profile.prof: cProfile statistics for snakeviz or pstats, "cprofile" mode only.
+
+Modes:
+"sampling": Call stacks of the main thread are sampled every config.profile_sample_interval seconds by a background
+thread. Low overhead, the per function report is based on sample counts.
+"cprofile": Deterministic profiling of every function call with cProfile, call stacks are sampled for the flamegraph.
+
+Pipeline stages are marked with "with profiling.stage(name):" blocks. Stages used by the program are fetch, parse,
+transpose, reflect, temperature, output, uncertainty, write and plot. When profiling is not active stage() returns a
+shared no-op context manager, so the stage blocks cost a single global lookup.
+"""
+
+import collections
+import contextlib
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+
+import config
+
+
+# active profiling session, None when profiling is off
+__session = None
+
+# returned by stage() when profiling is off
+__NO_STAGE = contextlib.nullcontext()
+
+
+def stage(name: str):
+    """
+    Context manager marking a pipeline stage.
+    :param name: Stage name, for example "transpose".
+    """
+    if __session is None:
+        return __NO_STAGE
+    return __session.stage(name)
+
+
+def start(name: str, mode="sampling"):
+    """
+    Starts profiling.
+    :param name: Name used in output filenames, for example "get_forecast".
+    :param mode: "sampling" or "cprofile"
+    """
+    global __session
+    if __session is not None:
+        print("Profiling already active, ignoring start of '" + name + "'")
+        return
+    if mode not in ["sampling", "cprofile"]:
+        print("Unknown profiling mode '" + str(mode) + "', using sampling")
+        mode = "sampling"
+    __session = _ProfilingSession(name, mode)
+    __session.start()
+
+
+def stop() -> list:
+    """
+    Stops profiling and writes the reports.
+    :return: Paths of the written files.
+    """
+    global __session
+    if __session is None:
+        return []
+    session = __session
+    __session = None
+    return session.stop()
+
+
+@contextlib.contextmanager
+def profile(name: str, mode=None):
+    """
+    Profiles the code inside the with block if mode is given, does nothing otherwise.
+    :param name: Name used in output filenames.
+    :param mode: "sampling", "cprofile" or None
+    """
+    if mode is None:
+        yield
+        return
+    start(name, mode)
+    try:
+        yield
+    finally:
+        for path in stop():
+            print("Profiling results saved as: " + path)
+
+
+class _ProfilingSession:
+
+    def __init__(self, name, mode):
+        self.name = name
+        self.mode = mode
+        self.stage_stack = []
+        self.stage_times = collections.defaultdict(float)
+        self.stage_counts = collections.defaultdict(int)
+        self.stacks = collections.Counter()
+        self.sample_count = 0
+        self.profiler = cProfile.Profile() if mode == "cprofile" else None
+        self.thread_id = threading.get_ident()
+        self.stop_event = threading.Event()
+        self.sampler = threading.Thread(target=self.sample, daemon=True)
+        self.time_start = 0.0
+        self.time_total = 0.0
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        self.stage_stack.append(name)
+        time_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_times[name] += time.perf_counter() - time_start
+            self.stage_counts[name] += 1
+            self.stage_stack.pop()
+
+    def start(self):
+        self.time_start = time.perf_counter()
+        self.sampler.start()
+        if self.profiler is not None:
+            self.profiler.enable()
+
+    def stop(self) -> list:
+        if self.profiler is not None:
+            self.profiler.disable()
+        self.stop_event.set()
+        self.sampler.join()
+        self.time_total = time.perf_counter() - self.time_start
+        return self.write()
+
+    def sample(self):
+        """
+        Records the call stack of the profiled thread until stopped.
+        """
+        while not self.stop_event.wait(config.profile_sample_interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(code.co_name + " (" + os.path.basename(code.co_filename) + ":" +
+                              str(code.co_firstlineno) + ")")
+                frame = frame.f_back
+            stage_name = self.stage_stack[-1] if self.stage_stack else "other"
+            self.stacks[";".join(["stage " + stage_name] + frames[::-1])] += 1
+            self.sample_count += 1
+
+    def write(self) -> list:
+        os.makedirs(config.save_directory, exist_ok=True)
+        base = config.save_directory + self.name + "-profile"
+        paths = [base + ".txt", base + ".collapsed"]
+
+        with open(base + ".collapsed", "w") as file:
+            for stack, count in self.stacks.most_common():
+                file.write(stack + " " + str(count) + "\n")
+
+        with open(base + ".txt", "w") as file:
+            file.write("Profile of '" + self.name + "', mode " + self.mode + ", total " +
+                       str(round(self.time_total, 3)) + " seconds, " + str(self.sample_count) + " samples\n\n")
+            file.write("Stages (wall time, calls):\n")
+            for stage_name, seconds in sorted(self.stage_times.items(), key=lambda item: -item[1]):
+                file.write("  " + stage_name.ljust(14) + str(round(seconds, 3)).rjust(10) + " s " +
+                           str(self.stage_counts[stage_name]).rjust(6) + "\n")
+            file.write("\n")
+
+            if self.profiler is not None:
+                self.profiler.dump_stats(base + ".prof")
+                paths.append(base + ".prof")
+                report = io.StringIO()
+                pstats.Stats(self.profiler, stream=report).sort_stats("cumulative").print_stats(60)
+                file.write(report.getvalue())
+            else:
+                file.write(self.sample_report())
+
+        return paths
+
+    def sample_report(self) -> str:
+        """
+        Per function report from samples, self samples are counted for the innermost frame of each stack and total
+        samples for every function in the stack.
+        """
+        own = collections.Counter()
+        total = collections.Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+
+        samples = max(self.sample_count, 1)
+        lines = ["Functions by total samples (total %, self %):"]
+        for frame, count in total.most_common(60):
+            lines.append(str(round(100 * count / samples, 1)).rjust(7) + str(round(100 * own[frame] / samples, 1))
+                         .rjust(7) + "  " + frame)
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,243 @@
+"""
+Record and replay of FMI open data and InfluxDB traffic. Allows running, benchmarking and load testing forecasts
+without live FMI open data and InfluxDB services.
+
+Modes, set with config.record_replay_mode or the RECORD_REPLAY environment variable read by get_forecast.py:
+None: Calls go directly to the services.
+"record": Calls go to the services and responses are saved as gzip compressed pickle fixtures in
+config.fixture_directory.
+"replay": Responses are read from fixtures, the services are not contacted. Each replayed call waits
+config.replay_latency seconds plus a random jitter of up to config.replay_latency_jitter seconds to simulate network
+latency. Jitter is drawn from a generator seeded with config.replay_seed so that runs are repeatable.
+
+Fixtures of FMI open data queries are matched by query id and arguments. If no exact match exists, for example when
+replaying on a later day with different query times, the latest fixture recorded for the same coordinates is used.
+InfluxDB queries are matched by query text, unmatched queries return an empty dataframe. InfluxDB writes and deletes
+are not saved, in replay mode they are only counted.
+
+FMI open data is fetched with download_stored_query() from this file and InfluxDB clients are created with
+influx_client(), both pass calls directly to fmiopendata and influxdb_client when the mode is None.
+
+Private helper functions use a single underscore as they are called from the client classes, where double underscore
+names would be mangled.
+"""
+
+import glob
+import gzip
+import hashlib
+import os
+import pickle
+import random
+import threading
+import time
+
+import pandas
+from fmiopendata.wfs import download_stored_query as fmi_download_stored_query
+from influxdb_client import InfluxDBClient
+
+import config
+
+
+# fixtures read during this run and counts of replayed calls
+__fixture_cache = {}
+__statistics = {"fmi": 0, "influx_query": 0, "influx_write": 0, "influx_delete": 0}
+__lock = threading.Lock()
+__random = None
+
+
+def download_stored_query(query_id: str, args=None):
+    """
+    Same as fmiopendata.wfs.download_stored_query(), recorded or replayed depending on config.record_replay_mode.
+    """
+
+    if config.record_replay_mode is None:
+        return fmi_download_stored_query(query_id, args=args)
+
+    args = list(args or [])
+    filename = _fixture_path("fmi-" + _latlon_label(args), query_id, args)
+
+    if config.record_replay_mode == "record":
+        result = fmi_download_stored_query(query_id, args=args)
+        _save_fixture(filename, result)
+        return result
+
+    if not os.path.exists(filename):
+        candidates = glob.glob(os.path.join(config.fixture_directory, "fmi-" + _latlon_label(args) + "-*.pkl.gz"))
+        if not candidates:
+            raise FileNotFoundError("No FMI open data fixture for " + query_id + " " + str(args) + " in " +
+                                    config.fixture_directory)
+        filename = max(candidates, key=os.path.getmtime)
+        print("No exact FMI open data fixture, replaying " + filename)
+
+    _replay_delay("fmi")
+    return _load_fixture(filename)
+
+
+def influx_client(url=None, token=None, org=None):
+    """
+    Returns an InfluxDB client depending on config.record_replay_mode. Parameters are the same as for
+    influxdb_client.InfluxDBClient.
+    """
+
+    if config.record_replay_mode is None:
+        return InfluxDBClient(url=url, token=token, org=org)
+    if config.record_replay_mode == "record":
+        return _RecordingInfluxClient(InfluxDBClient(url=url, token=token, org=org))
+    return _ReplayInfluxClient()
+
+
+def get_statistics() -> dict:
+    """
+    :return: Dict with counts of replayed calls by type.
+    """
+    with __lock:
+        return dict(__statistics)
+
+
+def reset():
+    """
+    Clears fixtures read into memory, call counts and the latency generator.
+    """
+    global __random
+    with __lock:
+        __fixture_cache.clear()
+        for key in __statistics:
+            __statistics[key] = 0
+        __random = None
+
+
+class _RecordingInfluxClient:
+    """
+    Passes calls to an InfluxDB client and saves query results as fixtures.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self.api_client = client.api_client
+
+    def health(self):
+        return self._client.health()
+
+    def write_api(self, *args, **kwargs):
+        return self._client.write_api(*args, **kwargs)
+
+    def delete_api(self):
+        return self._client.delete_api()
+
+    def query_api(self):
+        return _RecordingQueryApi(self._client.query_api())
+
+    def close(self):
+        self._client.close()
+
+
+class _RecordingQueryApi:
+
+    def __init__(self, query_api):
+        self._query_api = query_api
+
+    def query_data_frame(self, query, *args, **kwargs):
+        result = self._query_api.query_data_frame(query, *args, **kwargs)
+        _save_fixture(_fixture_path("influx-query", query), result)
+        return result
+
+
+class _ReplayInfluxClient:
+    """
+    Stand-in for an InfluxDB client which answers from fixtures.
+    """
+
+    class _Health:
+        status = "pass"
+        message = "replay"
+
+    class _ApiClient:
+        pass
+
+    def __init__(self):
+        self.api_client = self._ApiClient()
+
+    def health(self):
+        return self._Health()
+
+    def write_api(self, *args, **kwargs):
+        return _ReplayWriteApi()
+
+    def delete_api(self):
+        return _ReplayDeleteApi()
+
+    def query_api(self):
+        return _ReplayQueryApi()
+
+    def close(self):
+        pass
+
+
+class _ReplayWriteApi:
+
+    def write(self, *args, **kwargs):
+        _replay_delay("influx_write")
+
+    def close(self):
+        pass
+
+
+class _ReplayDeleteApi:
+
+    def delete(self, *args, **kwargs):
+        _replay_delay("influx_delete")
+
+
+class _ReplayQueryApi:
+
+    def query_data_frame(self, query, *args, **kwargs):
+        _replay_delay("influx_query")
+        filename = _fixture_path("influx-query", query)
+        if not os.path.exists(filename):
+            print("No InfluxDB fixture for query, returning empty dataframe")
+            return pandas.DataFrame()
+        return _load_fixture(filename)
+
+
+def _fixture_path(prefix: str, *key) -> str:
+    digest = hashlib.sha1(repr(key).encode()).hexdigest()[:16]
+    return os.path.join(config.fixture_directory, prefix + "-" + digest + ".pkl.gz")
+
+
+def _latlon_label(args: list) -> str:
+    for arg in args:
+        if str(arg).startswith("latlon="):
+            return str(arg)[len("latlon="):].replace(",", "_")
+    return "unknown"
+
+
+def _save_fixture(filename: str, result):
+    os.makedirs(config.fixture_directory, exist_ok=True)
+
+    # writing to a temporary file first so that concurrent replays never read a partial fixture
+    temporary = filename + "." + str(os.getpid()) + "." + str(threading.get_ident()) + ".tmp"
+    with gzip.open(temporary, "wb") as file:
+        pickle.dump(result, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary, filename)
+
+
+def _load_fixture(filename: str):
+    with __lock:
+        if filename not in __fixture_cache:
+            with gzip.open(filename, "rb") as file:
+                __fixture_cache[filename] = pickle.load(file)
+        result = __fixture_cache[filename]
+
+    # callers may modify results, giving each caller its own copy
+    return pickle.loads(pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def _replay_delay(call_type: str):
+    global __random
+    with __lock:
+        __statistics[call_type] += 1
+        if __random is None:
+            __random = random.Random(config.replay_seed)
+        delay = config.replay_latency + __random.uniform(0, config.replay_latency_jitter)
+    if delay > 0:
+        time.sleep(delay)
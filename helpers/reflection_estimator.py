@@ -65,7 +65,7 @@ def add_reflection_corrected_poa_to_df(df: pandas.DataFrame) -> pandas.DataFrame
 
     # helper function
     def helper_components_to_corrected_poa(df: pandas.DataFrame) -> pandas.DataFrame:
-        return components_to_corrected_poa(df["dni_poa"], df["dhi_poa"], df["ghi_poa"], df["time"])
+        return components_to_corrected_poa(df["dni_poa"], df["dhi_poa"], df["ghi_poa"], df.name)
 
     # applying helper function to dataset and storing result as a new column
     #df["poa_ref_cor"] = df.apply(helper_components_to_corrected_poa, axis=1)
@@ -78,7 +78,7 @@ def add_reflection_corrected_poa_to_df(df: pandas.DataFrame) -> pandas.DataFrame
 def add_reflection_corrected_poa_components_to_df(df: pandas.DataFrame)-> pandas.DataFrame:
     def helper_add_dni_ref(df):
         #  (1-alpha_BN)*BTN
-        return math.fabs(1 - __dni_reflected(df["time"])) * df["dni_poa"]
+        return math.fabs(1 - __dni_reflected(df.name)) * df["dni_poa"]
 
     def helper_add_dhi_ref(df):
         # (1-alpha_d)*DT
@@ -107,6 +107,24 @@ def add_reflection_corrected_poa_components_to_df(df: pandas.DataFrame)-> pandas
 
     return df
 
+def get_reflection_losses(angle_of_incidence, tilt=None, a_r=None) -> tuple:
+    """
+    Array version of the reflection loss functions below, used by vectorized pipelines. All parameters can be floats
+    or numpy arrays which broadcast together.
+    :param angle_of_incidence: Angle of incidence in degrees.
+    :param tilt: Panel tilt in degrees, config.tilt by default.
+    :param a_r: Panel reflectance constant, reflectance_constant by default.
+    :return: (dni_reflected, dhi_reflected, ghi_reflected), each in range [0,1]
+    """
+    if tilt is None:
+        tilt = config.tilt
+    if a_r is None:
+        a_r = reflectance_constant
+
+    return (__dni_reflected_from_aoi(angle_of_incidence, a_r), __dhi_reflected(tilt, a_r),
+            __ghi_reflected(tilt, a_r))
+
+
 def __dni_reflected(dt: datetime)-> float:
     """
     Computes a constant in range [0,1] which represents how much of the direct irradiance is reflected from panel
@@ -117,14 +135,20 @@ def __dni_reflected(dt: datetime)-> float:
     F_B_(alpha) in "Calculation of the PV modules angular losses under field conditions by means of an analytical model"
     """
 
-    a_r = reflectance_constant
-
     AOI = astronomical_calculations.get_solar_angle_of_incidence_fast(dt)
 
+    return __dni_reflected_from_aoi(AOI, reflectance_constant)
+
+
+def __dni_reflected_from_aoi(AOI, a_r):
+    """
+    F_B_(alpha) for given angle of incidence(degrees) and panel reflectance constant.
+    """
+
     # upper section of the fraction equation
-    upper_fraction = math.e ** (-numpy.cos(numpy.radians(AOI)) / a_r) - math.e ** (-1.0 / a_r)
+    upper_fraction = numpy.exp(-numpy.cos(numpy.radians(AOI)) / a_r) - numpy.exp(-1.0 / a_r)
     # lower section of the fraction equation
-    lower_fraction = 1.0 - math.e ** (-1.0 / a_r)
+    lower_fraction = 1.0 - numpy.exp(-1.0 / a_r)
 
     # fraction or alpha_BN or dni_reflected
     dni_reflected = upper_fraction / lower_fraction
@@ -132,58 +156,72 @@ def __dni_reflected(dt: datetime)-> float:
     return dni_reflected
 
 
-def __ghi_reflected()-> float:
+def __ghi_reflected(tilt=None, a_r=None)-> float:
     """
     Computes a constant in range [0,1] which represents how much of ground reflected irradiation is reflected away from
     solar panel surfaces. Note that this is constant for an installation.
+    :param tilt: Panel tilt in degrees, config.tilt by default.
+    :param a_r: Panel reflectance constant, reflectance_constant by default.
     :return: [0,1] float, 0 no light reflected, 1 no light absorbed by panels.
 
     F_A(beta) in "Calculation of the PV modules angular losses under field conditions by means of an analytical model"
 
     """
+    if tilt is None:
+        tilt = config.tilt
+    if a_r is None:
+        a_r = reflectance_constant
 
     # constants, these are from
     c1 = 4.0 / (3.0 * math.pi)
 
     c2 = -0.074
-    a_r = reflectance_constant
-    panel_tilt = numpy.radians(config.tilt)  # theta_T
+    panel_tilt = numpy.radians(tilt)  # theta_T
 
     # equation parts, part 1 is used 2 times
-    part1 = math.sin(panel_tilt) + (panel_tilt - math.sin(panel_tilt)) / (1.0 - math.cos(panel_tilt))
+    # part 1 goes to 0 as tilt goes to 0, the limit is used for flat panels to avoid division by zero
+    with numpy.errstate(invalid="ignore", divide="ignore"):
+        part1 = numpy.sin(panel_tilt) + (panel_tilt - numpy.sin(panel_tilt)) / (1.0 - numpy.cos(panel_tilt))
+    part1 = numpy.where(numpy.cos(panel_tilt) == 1.0, 0.0, part1)
 
     part2 = c1 * part1 + c2 * (part1 ** 2.0)
     part3 = (-1.0 / a_r) * part2
 
-    ghi_reflected = math.e ** part3
+    ghi_reflected = numpy.exp(part3)
 
     return ghi_reflected
 
 
-def __dhi_reflected()-> float:
+def __dhi_reflected(tilt=None, a_r=None)-> float:
     """
     Computes a constant in range [0,1] which represents how much of atmospheric diffuse light is reflected away from
     solar panel surfaces. Constant for an installation. Almost a 1 to 1 copy of __ghi_reflected except
     "pi -" addition to part1 and "1-cos" to "1+cos" replacement in part1 as well.
+    :param tilt: Panel tilt in degrees, config.tilt by default.
+    :param a_r: Panel reflectance constant, reflectance_constant by default.
     :return: [0,1] float, 0 no light reflected, 1 no light absorbed by panels.
 
     F_D(beta) in "Calculation of the PV modules angular losses under field conditions by means of an analytical model"
     """
+    if tilt is None:
+        tilt = config.tilt
+    if a_r is None:
+        a_r = reflectance_constant
+
     # constants
 
     c1 = 4.0 / (math.pi * 3.0)
     c2 = -0.074
-    a_r = reflectance_constant
-    panel_tilt = numpy.radians(config.tilt)  # theta_T
+    panel_tilt = numpy.radians(tilt)  # theta_T
     pi = math.pi
 
     # equation parts, part 1 is used 2 times
-    part1 = math.sin(panel_tilt) + (pi - panel_tilt - math.sin(panel_tilt)) / (1.0 + math.cos(panel_tilt))
+    part1 = numpy.sin(panel_tilt) + (pi - panel_tilt - numpy.sin(panel_tilt)) / (1.0 + numpy.cos(panel_tilt))
 
     part2 = c1 * part1 + c2 * (part1 ** 2.0)
     part3 = (-1.0 / a_r) * part2
 
-    dhi_reflected = math.e ** part3
+    dhi_reflected = numpy.exp(part3)
 
     return dhi_reflected
 
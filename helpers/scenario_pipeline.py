@@ -0,0 +1,118 @@
+"""
+Single pass evaluation of several irradiance scenarios for the same site. Scenarios are irradiance dataframes from
+solar_irradiance_estimator.py, for example FMI open data, PVlib Ineichen clear sky and PVlib simplified Solis clear sky.
+
+All scenarios are interpolated to a common time grid by their interval centers, see helpers/time_index.py, and stacked
+on a scenario axis, after which the fused pipeline
+evaluates every scenario with the same solar geometry in one vectorized call. Scenario rows outside the time range of
+the scenario data are nan, FMI open data for example only covers ~64 hours.
+
+Weather columns T and wind are taken from the scenario itself if it has them, then from the weather dataframe if one
+is given and from config otherwise. This is the same as in main.get_pvlib_data() where FMI open data is used as weather
+data donor for clear sky data. Albedo is taken from the scenario or from config.
+"""
+
+import numpy
+import pandas
+
+import config
+from helpers import astronomical_calculations
+from helpers import fused_pipeline
+from helpers import panel_temperature_estimator
+from helpers import time_index
+
+
+def evaluate_scenarios(scenarios: dict, times=None, weather=None, clear_sky=None) -> pandas.DataFrame:
+    """
+    :param scenarios: Dict {scenario name: irradiance dataframe with dni, dhi and ghi columns and a datetime index}
+    :param times: Common time grid of instants, DatetimeIndex. Index of the first scenario by default, in which case
+    the grid has the time convention of the first scenario.
+    :param weather: Optional dataframe with T and wind columns used for scenarios without weather columns.
+    :param clear_sky: Name of the clear sky scenario. If given, "percent_<name>" columns with the output of each other
+    scenario as percentage of clear sky output are added.
+    :return: Dataframe indexed by times with "output_<name>" column for each scenario and percentages.
+    """
+
+    names = list(scenarios)
+    for name, data in list(scenarios.items()) + [("weather", weather)]:
+        if data is not None and time_index.LABEL_KEY not in data.attrs:
+            print("Scenario '" + name + "' has no time convention, its timestamps are used as instants. FMI open data "
+                  "rows are interval means labeled with the interval end, see helpers/time_index.py")
+    result = pandas.DataFrame(index=scenarios[names[0]].index if times is None else times)
+    if times is None:
+        result = time_index.set_convention(result, *time_index.get_convention(scenarios[names[0]]))
+    else:
+        result = time_index.set_convention(result, "instant")
+    times = result.index
+
+    geometry = astronomical_calculations.get_solar_geometry(times)
+    centers = time_index.get_times(result)
+
+    # scenario count x time count arrays
+    columns = {}
+    for column, default in [("dni", None), ("dhi", None), ("ghi", None), ("albedo", config.albedo),
+                            ("T", config.air_temp), ("wind", config.wind_speed)]:
+        columns[column] = numpy.stack([__column_on_grid(scenarios[name], column, centers, weather, default)
+                                       for name in names])
+
+    # rows without irradiance data, computed as zeros and replaced with nan after the pipeline
+    missing = numpy.isnan(columns["dni"]) | numpy.isnan(columns["dhi"]) | numpy.isnan(columns["ghi"])
+
+    output = fused_pipeline.compute_output(columns["dni"], columns["dhi"], columns["ghi"], columns["albedo"],
+                                           columns["T"], columns["wind"], geometry)
+    output = numpy.where(missing, numpy.nan, output)
+
+    for number, name in enumerate(names):
+        result["output_" + name] = output[number]
+
+    if clear_sky is not None:
+        clear_sky_output = output[names.index(clear_sky)]
+        for number, name in enumerate(names):
+            if name == clear_sky:
+                continue
+            with numpy.errstate(divide="ignore", invalid="ignore"):
+                percent = 100.0 * output[number] / clear_sky_output
+            result["percent_" + name] = numpy.where(clear_sky_output > 0, percent, numpy.nan)
+
+    return result
+
+
+def get_scenario_df(result: pandas.DataFrame, name: str) -> pandas.DataFrame:
+    """
+    Single scenario from evaluate_scenarios() results in the same format as pipeline results, with an output column.
+    Rows outside the scenario data are left out.
+    :param result: Dataframe from evaluate_scenarios()
+    :param name: Scenario name.
+    :return: Dataframe with output column.
+    """
+    data = result[["output_" + name]].rename(columns={"output_" + name: "output"})
+    return data.dropna()
+
+
+def __column_on_grid(data: pandas.DataFrame, column: str, times: pandas.DatetimeIndex, weather, default):
+    """
+    Values of column interpolated to grid interval centers, nan outside the time range of the source dataframe.
+    Source rows are placed at their interval centers, naive timestamps are taken as UTC. FMI open data row 12:00 is
+    the mean of 11:00-12:00 and is placed at 11:30.
+    """
+
+    source = data
+    if column not in source.columns:
+        if weather is not None and column in ["T", "wind"] and column in weather.columns:
+            source = weather
+        elif default is not None:
+            return numpy.full(len(times), default, dtype=float)
+        else:
+            return numpy.full(len(times), numpy.nan)
+
+    source_times = time_index.get_times(source)
+    if source_times.equals(times):
+        return source[column].to_numpy(dtype=float)
+
+    values = panel_temperature_estimator.interpolate_to_times(times, source_times, source[column].to_numpy(dtype=float))
+
+    # no extrapolation for irradiance, weather values are extended like in add_wind_and_temp_to_df1_from_df2()
+    if column in ["dni", "dhi", "ghi"]:
+        values[(times < source_times.min()) | (times > source_times.max())] = numpy.nan
+
+    return values
@@ -0,0 +1,205 @@
+"""
+Shared memory transport of fleet inputs to worker processes. Pickling per site dataframes to worker processes costs
+more than the fused pipeline itself for large fleets, so the fetching process packs the weather arrays of all sites into
+a single block of shared memory. Workers receive only a small handle dict and the site dicts, attach to the block
+without copying and return only the output arrays of their sites.
+
+Block layout is a float64 array with shape (site count, row count, time count). Rows are the timestamps as seconds
+since epoch, the WEATHER_COLUMNS and the GEOMETRY_KEYS of astronomical_calculations.get_solar_geometry(). Solar
+position is the most expensive part of the fleet run, so geometry rows are filled by the workers, each for its own
+sites, and the filled block holds both weather and geometry of the whole fleet. Sites with fewer timestamps than the
+longest site are padded with nan, the true length of each site is stored in the handle.
+
+Transports, config.shared_array_transport:
+"shm": multiprocessing.shared_memory, the block lives in RAM and is removed by release().
+"memmap": numpy memory mapped .npy file in config.save_directory, for systems with a small /dev/shm. The file is
+deleted by release().
+"""
+
+import os
+import uuid
+import concurrent.futures
+from multiprocessing import shared_memory
+
+import numpy
+import pandas
+
+import config
+from helpers import astronomical_calculations
+from helpers import fused_pipeline
+
+
+# rows of the block, in order
+TIME_ROW = 0
+WEATHER_COLUMNS = ["dni", "dhi", "ghi", "albedo", "T", "wind"]
+GEOMETRY_KEYS = ["apparent_zenith", "azimuth", "airmass", "dni_extra"]
+ROW_COUNT = 1 + len(WEATHER_COLUMNS) + len(GEOMETRY_KEYS)
+
+
+def compute_fleet_output(sites: list, weather: dict, workers=None, transport=None) -> dict:
+    """
+    Computes output of each site in worker processes with the fused pipeline.
+    :param sites: List of site dicts, same format as config.sites.
+    :param weather: Dict {site_name: irradiance dataframe}, for example from site_index.fetch_weather_for_sites().
+    Missing albedo, T and wind columns are replaced with config values.
+    :param workers: Number of worker processes, config.fleet_workers by default.
+    :param transport: "shm" or "memmap", config.shared_array_transport by default.
+    :return: Dict {site_name: output in watts as numpy array with one value per weather row}
+    """
+
+    if workers is None:
+        workers = config.fleet_workers
+
+    handle, owner = share_fleet_inputs(sites, weather, transport)
+    try:
+        site_numbers = list(range(len(sites)))
+        chunks = [site_numbers[i::workers] for i in range(workers) if site_numbers[i::workers]]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+            results = list(executor.map(__compute_chunk, [handle] * len(chunks), chunks,
+                                        [[sites[number] for number in chunk] for chunk in chunks]))
+    finally:
+        release(handle, owner)
+
+    outputs = {}
+    for chunk, chunk_outputs in zip(chunks, results):
+        for number, output in zip(chunk, chunk_outputs):
+            outputs[sites[number]["site_name"]] = output
+    return outputs
+
+
+def share_fleet_inputs(sites: list, weather: dict, transport=None) -> (dict, object):
+    """
+    Packs timestamps and weather of each site into a shared block. Geometry rows are left as nan, see fill_geometry().
+    :param sites: List of site dicts.
+    :param weather: Dict {site_name: irradiance dataframe}
+    :param transport: "shm" or "memmap", config.shared_array_transport by default.
+    :return: Handle dict for attach() and owner object for release()
+    """
+
+    lengths = [len(weather[site["site_name"]].index) for site in sites]
+    handle, owner, block = create_block((len(sites), ROW_COUNT, max(lengths)), transport)
+    block[:] = numpy.nan
+    handle["lengths"] = lengths
+
+    defaults = {"albedo": config.albedo, "T": config.air_temp, "wind": config.wind_speed}
+    for number, site in enumerate(sites):
+        data = weather[site["site_name"]]
+        length = lengths[number]
+        block[number, TIME_ROW, :length] = pandas.DatetimeIndex(data.index).as_unit("s").asi8
+        for row, column in enumerate(WEATHER_COLUMNS, start=TIME_ROW + 1):
+            if column in data.columns:
+                block[number, row, :length] = data[column].to_numpy(dtype=float)
+            else:
+                block[number, row, :length] = defaults[column]
+
+    if isinstance(block, numpy.memmap):
+        block.flush()
+
+    return handle, owner
+
+
+def fill_geometry(values: numpy.ndarray, site: dict) -> dict:
+    """
+    Computes solar geometry of a site and writes it into the geometry rows of the site.
+    :param values: Writable (row count, time count) view of the block for one site.
+    :param site: Site dict, coordinates are set as the active parameters with config.set_params_site()
+    :return: Geometry dict of views to the block.
+    """
+    config.set_params_site(site)
+    times = pandas.to_datetime(values[TIME_ROW].astype(numpy.int64), unit="s", utc=True)
+    geometry = astronomical_calculations.get_solar_geometry(times)
+
+    views = {}
+    for row, key in enumerate(GEOMETRY_KEYS, start=TIME_ROW + 1 + len(WEATHER_COLUMNS)):
+        values[row] = geometry[key]
+        views[key] = values[row]
+    return views
+
+
+def create_block(shape: tuple, transport=None) -> (dict, object, numpy.ndarray):
+    """
+    Creates a float64 block which worker processes can attach to.
+    :param shape: Array shape.
+    :param transport: "shm" or "memmap", config.shared_array_transport by default.
+    :return: Handle dict, owner object for release() and writable numpy array view of the block. The owner is the
+    shared memory object, None for "memmap".
+    """
+
+    if transport is None:
+        transport = config.shared_array_transport
+    size = int(numpy.prod(shape)) * numpy.dtype(float).itemsize
+
+    if transport == "memmap":
+        directory = os.path.join(config.save_directory, "shared")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, uuid.uuid4().hex + ".npy")
+        block = numpy.lib.format.open_memmap(path, mode="w+", dtype=float, shape=shape)
+        return {"transport": "memmap", "path": path, "shape": shape}, None, block
+
+    if transport != "shm":
+        print("Unknown shared array transport '" + str(transport) + "', using shm")
+    memory = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    block = numpy.ndarray(shape, dtype=float, buffer=memory.buf)
+    return {"transport": "shm", "name": memory.name, "shape": shape}, memory, block
+
+
+def attach(handle: dict, writable=False) -> (numpy.ndarray, object):
+    """
+    Attaches to a block without copying.
+    :param handle: Handle dict from create_block()
+    :param writable: Returns a writable view if True, read only otherwise.
+    :return: Numpy array view of the block and the attached shared memory object, which has to be closed after all
+    views of the block are deleted. None for "memmap", the file is unmapped when the views are deleted.
+    """
+
+    if handle["transport"] == "memmap":
+        return numpy.load(handle["path"], mmap_mode="r+" if writable else "r"), None
+
+    memory = shared_memory.SharedMemory(name=handle["name"])
+    block = numpy.ndarray(handle["shape"], dtype=float, buffer=memory.buf)
+    block.flags.writeable = writable
+    return block, memory
+
+
+def release(handle: dict, owner):
+    """
+    Removes a block created by create_block(). Views of the block must not be used after this.
+    :param handle: Handle dict from create_block()
+    :param owner: Owner object from create_block()
+    """
+
+    if handle["transport"] == "memmap":
+        os.remove(handle["path"])
+        return
+
+    owner.close()
+    owner.unlink()
+
+
+def __compute_chunk(handle: dict, site_numbers: list, sites: list) -> list:
+    """
+    Worker function, fills geometry and computes output of the given sites from an attached block.
+    :return: List of output arrays in site_numbers order.
+    """
+
+    block, attachment = attach(handle, writable=True)
+    try:
+        outputs = [__compute_site(block[number, :, :handle["lengths"][number]], site)
+                   for number, site in zip(site_numbers, sites)]
+    finally:
+        # worker processes are reused, parameters of the last site are not left active
+        config.set_params_site({})
+        del block
+        if attachment is not None:
+            attachment.close()
+
+    return outputs
+
+
+def __compute_site(values: numpy.ndarray, site: dict) -> numpy.ndarray:
+    """
+    Output of one site from its (row count, time count) view of the block.
+    """
+    geometry = fill_geometry(values, site)
+    dni, dhi, ghi, albedo, air_temp, wind = values[TIME_ROW + 1:TIME_ROW + 1 + len(WEATHER_COLUMNS)]
+    return fused_pipeline.compute_output(dni, dhi, ghi, albedo, air_temp, wind, geometry)
@@ -0,0 +1,144 @@
+"""
+Spatial index for fleets of installations. FMI open HARMONIE point forecasts are interpolated from a ~2.5km model grid,
+meaning that installations close to each other receive practically the same weather forecast. This file groups sites
+into grid cells and fetches FMI open data once per cell, after which the weather dataframe is copied to all sites in
+the cell.
+
+Grid cells are formed by snapping coordinates to a regular grid with cells of grid_cell_size kilometers in both
+directions. Cells with a single site are queried with the exact coordinates of that site, cells with multiple sites
+with the mean coordinates of their sites.
+
+Sites are dicts with at least "site_name", "latitude" and "longitude" keys, same format as config.sites.
+"""
+
+import numpy
+import pandas
+
+import config
+from helpers import _meps_data_loader
+
+
+# kilometers per degree of latitude
+__KM_PER_DEGREE = 111.32
+
+
+def get_grid_keys(latitudes, longitudes, cell_size=None) -> numpy.ndarray:
+    """
+    Snaps coordinates to grid cells.
+    :param latitudes: Latitudes in degrees, numpy array.
+    :param longitudes: Longitudes in degrees, numpy array.
+    :param cell_size: Grid cell size in km, config.grid_cell_size by default.
+    :return: Integer array with shape (site count, 2), one (row, column) key per site.
+    """
+    if cell_size is None:
+        cell_size = config.grid_cell_size
+
+    latitudes = numpy.asarray(latitudes, dtype=float)
+    longitudes = numpy.asarray(longitudes, dtype=float)
+
+    rows = numpy.floor(latitudes * __KM_PER_DEGREE / cell_size)
+
+    # longitude degree length depends on latitude, using the latitude of the cell row center so that all sites in a row
+    # share the same column width
+    row_latitudes = (rows + 0.5) * cell_size / __KM_PER_DEGREE
+    columns = numpy.floor(longitudes * __KM_PER_DEGREE * numpy.cos(numpy.radians(row_latitudes)) / cell_size)
+
+    return numpy.stack([rows, columns], axis=1).astype(numpy.int64)
+
+
+def build_query_points(sites: list, cell_size=None) -> list:
+    """
+    Groups sites into grid cells.
+    :param sites: List of site dicts.
+    :param cell_size: Grid cell size in km, config.grid_cell_size by default.
+    :return: List of query points, each a dict with keys "latitude", "longitude" and "sites" (list of site names).
+    """
+
+    latitudes = numpy.array([site["latitude"] for site in sites], dtype=float)
+    longitudes = numpy.array([site["longitude"] for site in sites], dtype=float)
+    keys = get_grid_keys(latitudes, longitudes, cell_size)
+
+    # cell number of each site, cells in order of first appearance
+    _, first_index, cell_numbers = numpy.unique(keys, axis=0, return_index=True, return_inverse=True)
+    cell_numbers = cell_numbers.ravel()
+    cell_order = numpy.argsort(first_index)
+
+    counts = numpy.bincount(cell_numbers)
+    mean_latitudes = numpy.bincount(cell_numbers, weights=latitudes) / counts
+    mean_longitudes = numpy.bincount(cell_numbers, weights=longitudes) / counts
+
+    # site indices of each cell
+    cell_members = numpy.split(numpy.argsort(cell_numbers, kind="stable"), numpy.cumsum(counts)[:-1])
+
+    query_points = []
+    for cell in cell_order:
+        members = cell_members[cell]
+        query_points.append({"latitude": round(float(mean_latitudes[cell]), 4),
+                             "longitude": round(float(mean_longitudes[cell]), 4),
+                             "sites": [sites[i]["site_name"] for i in members]})
+
+    return query_points
+
+
+def fetch_weather_for_sites(sites: list, date_start, date_end, cell_size=None) -> dict:
+    """
+    Fetches FMI open data once per grid cell and gives each site its own copy of the weather dataframe of its cell.
+    :param sites: List of site dicts.
+    :param date_start: Start of the forecast period.
+    :param date_end: End of the forecast period.
+    :param cell_size: Grid cell size in km, config.grid_cell_size by default.
+    :return: Dict {site_name: FMI open dataframe}
+    """
+    return dict(iter_weather_for_sites(sites, date_start, date_end, cell_size))
+
+
+def iter_weather_for_sites(sites: list, date_start, date_end, cell_size=None):
+    """
+    Same as fetch_weather_for_sites() but fetches each grid cell only when the sites of the previous cell have been
+    consumed, which keeps only the weather of one cell in memory.
+    :return: Generator of (site_name, FMI open dataframe) tuples, sites of the same cell are consecutive.
+    """
+
+    query_points = build_query_points(sites, cell_size)
+    print("Fetching FMI open data for " + str(len(sites)) + " sites with " + str(len(query_points)) +
+          " queries, dedupe ratio " + str(round(len(sites) / max(len(query_points), 1), 2)))
+
+    for point in query_points:
+        data = __fetch_query_point(point, date_start, date_end)
+        for site_name in point["sites"]:
+            yield site_name, data.copy()
+
+
+def __fetch_query_point(point: dict, date_start, date_end) -> pandas.DataFrame:
+    """
+    Fetches FMI open data of a query point from build_query_points().
+    """
+    # collect_fmi_opendata() computes solar angles at config coordinates, using the query point as a temporary override
+    original_latitude = config.latitude
+    original_longitude = config.longitude
+
+    try:
+        config.latitude = point["latitude"]
+        config.longitude = point["longitude"]
+        latlon = str(point["latitude"]) + "," + str(point["longitude"])
+        return _meps_data_loader.collect_fmi_opendata(latlon, date_start, date_end)
+    finally:
+        config.latitude = original_latitude
+        config.longitude = original_longitude
+
+
+def get_dedupe_ratio(sites: list, cell_size=None) -> float:
+    """
+    :return: Number of sites per FMI open query.
+    """
+    return len(sites) / max(len(build_query_points(sites, cell_size)), 1)
+
+
+def query_points_to_df(query_points: list) -> pandas.DataFrame:
+    """
+    Site to query point table, useful for inspecting which sites share weather data.
+    :param query_points: List from build_query_points()
+    :return: Dataframe indexed by site name with query point latitude and longitude.
+    """
+    rows = [(site_name, point["latitude"], point["longitude"]) for point in query_points for site_name in point["sites"]]
+    return pandas.DataFrame(rows, columns=["site_name", "latitude", "longitude"]).set_index("site_name")
@@ -13,9 +13,13 @@ Author: TimoSalola (Timo Salola).
 import sys
 import pandas
 import pandas as pd
-from pvlib import location
+import numpy
+import pvlib.clearsky
+from pvlib import location, solarposition, atmosphere, irradiance
 from datetime import timedelta, datetime
 from helpers import _meps_data_loader
+from helpers import linke_turbidity
+from helpers import time_index
 import config
 
 """
@@ -76,26 +80,79 @@ def __get_irradiance_pvlib(date_start: datetime, date_end: datetime, mod="ineich
     :return: Dataframe with ghi, dni, dhi. Or only GHI if using haurwitz
     """
 
-    # creating site data required by pvlib poa
-    site = location.Location(config.latitude, config.longitude, tz=config.timezone)
+    # creating site data required by pvlib poa, altitude from cache instead of the pvlib altitude file
+    site = location.Location(config.latitude, config.longitude, tz=config.timezone,
+                             altitude=linke_turbidity.get_altitude())
 
-    # measurement frequency, for example "15min" or "60min"
-    measurement_frequency = str(config.data_resolution) + "min"
+    times = __get_times(date_start, date_end)
+
+    # creating a clear sky and solar position entities
+    if mod == "ineichen":
+        # cached monthly turbidity values instead of the pvlib turbidity file
+        clearsky = site.get_clearsky(times, model=mod, linke_turbidity=linke_turbidity.get_linke_turbidity(times))
+    else:
+        clearsky = site.get_clearsky(times, model=mod)
 
-    # measurement count, 1440 minutes per day
-    measurement_count = 1440 / config.data_resolution
+    # returning clearsky irradiance df, values are for the instants of the index
+    return time_index.set_convention(clearsky, "instant")
 
-    times = pd.date_range(start=date_start,
-                          end=date_end,  # year + day for which the irradiance is calculated
-                          freq=measurement_frequency,  # take measurement every 60 minutes
-                          tz=site.tz)  # timezone
 
-    # creating a clear sky and solar position entities
-    clearsky = site.get_clearsky(times, model=mod)
+def get_clear_sky_irradiance_for_sites(sites: list, date_start: datetime, day_count: int) -> dict:
+    """
+    PVlib Ineichen clear sky irradiance for multiple sites. Gives the same values as get_solar_irradiance() with model
+    "pvlib" for each site, but computes the clear sky model for all sites with one vectorized call. Linke turbidity
+    and altitude come from the cache in linke_turbidity.py.
+    :param sites: List of site dicts with "site_name", "latitude" and "longitude" keys, same format as config.sites.
+    :param date_start: first day in model
+    :param day_count: how many days to model
+    :return: Dict {site_name: dataframe with ghi, dni and dhi columns}
+    """
+
+    date_end = date_start + timedelta(days=day_count, minutes=-1)
+    times = __get_times(date_start, date_end)
+
+    climatologies = [linke_turbidity.get_site_climatology(site["latitude"], site["longitude"]) for site in sites]
+    altitudes = numpy.array([climatology["altitude"] for climatology in climatologies])[:, None]
+
+    # site count x time count arrays
+    turbidity = linke_turbidity.interpolate_linke_turbidity(
+        numpy.stack([climatology["linke_turbidity"] for climatology in climatologies]), times)
 
-    # adds index as a separate time column, for some reason this is required as even a named index is not callable
-    # with df[index_name] and df.index is not supported by function apply structures
-    clearsky.insert(loc=0, column="time", value=clearsky.index)
+    # solar position depends on site coordinates and altitude, computed separately for each site
+    apparent_zenith = numpy.empty(turbidity.shape)
+    for number, site in enumerate(sites):
+        solar_position = solarposition.get_solarposition(times, site["latitude"], site["longitude"],
+                                                         altitude=altitudes[number, 0],
+                                                         pressure=atmosphere.alt2pres(altitudes[number, 0]))
+        apparent_zenith[number] = solar_position["apparent_zenith"].to_numpy()
+
+    airmass_absolute = atmosphere.get_absolute_airmass(atmosphere.get_relative_airmass(apparent_zenith),
+                                                       atmosphere.alt2pres(altitudes))
+    dni_extra = irradiance.get_extra_radiation(times).to_numpy()
+
+    # night values divide by zero, pandas inputs used by get_solar_irradiance() hide the same warnings
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        irradiance_values = pvlib.clearsky.ineichen(apparent_zenith, airmass_absolute, turbidity, altitude=altitudes,
+                                                    dni_extra=dni_extra)
+
+    data = {}
+    for number, site in enumerate(sites):
+        site_df = pd.DataFrame({"ghi": irradiance_values["ghi"][number], "dni": irradiance_values["dni"][number],
+                                "dhi": irradiance_values["dhi"][number]}, index=times)
+        data[site["site_name"]] = time_index.set_convention(site_df, "instant")
+
+    return data
+
+
+def __get_times(date_start: datetime, date_end: datetime) -> pandas.DatetimeIndex:
+    """
+    Timestamps for pvlib simulations at config.data_resolution.
+    """
+
+    # measurement frequency, for example "15min" or "60min"
+    measurement_frequency = str(config.data_resolution) + "min"
 
-    # returning clearsky irradiance df
-    return clearsky
+    return pd.date_range(start=date_start,
+                         end=date_end,  # year + day for which the irradiance is calculated
+                         freq=measurement_frequency,  # take measurement every 60 minutes
+                         tz=config.timezone)  # timezone
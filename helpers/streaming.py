@@ -0,0 +1,83 @@
+"""
+Generator stages of streamed forecasts, see get_forecast.stream_forecasts(). A stream is an iterator of tuples whose
+last item is a pipeline dataframe, for example (site_name, dataframe) after fetching and (site_name, date, dataframe)
+after splitting into days. Each stage pulls items from the previous stage only when its consumer asks for the next
+item, so the first chunks can be written while later chunks have not yet been fetched or computed and only a few
+chunks are held in memory at a time.
+
+prefetch() runs the stages before it in a background thread. This overlaps computation with slow consumers such as
+InfluxDB writes. Stages run in the background thread may change the active site parameters in config, consumers of a
+prefetched stream should take site names from the stream items instead of config.
+"""
+
+import queue
+import threading
+
+from helpers import time_index
+
+
+def split_by_day(stream):
+    """
+    Splits each dataframe of a stream into days. Rows belong to the UTC date of their interval start, see
+    helpers/time_index.py.
+    :param stream: Iterator of (key, dataframe) tuples.
+    :return: Generator of (key, datetime.date, dataframe) tuples in time order of each dataframe.
+    """
+    for key, df in stream:
+        days = time_index.get_times(df, "start").date
+        for day in sorted(set(days)):
+            yield key, day, df[days == day]
+
+
+def prefetch(stream, size: int):
+    """
+    Computes up to size items of a stream ahead of the consumer in a background thread. Exceptions of the stream are
+    raised to the consumer.
+    :param stream: Any iterator.
+    :param size: Number of items computed ahead, 0 disables the background thread.
+    :return: Generator of the items of stream.
+    """
+    if size <= 0:
+        yield from stream
+        return
+
+    items = queue.Queue(maxsize=size)
+    stopped = threading.Event()
+
+    def produce():
+        try:
+            for item in stream:
+                if not __put(items, (True, item), stopped):
+                    return
+            __put(items, (False, None), stopped)
+        except BaseException as e:
+            __put(items, (False, e), stopped)
+
+    thread = threading.Thread(target=produce, name="prefetch", daemon=True)
+    thread.start()
+    try:
+        while True:
+            has_item, item = items.get()
+            if not has_item:
+                if item is not None:
+                    raise item
+                return
+            yield item
+    finally:
+        # consumer stopped early or finished, letting the producer exit without filling the queue
+        stopped.set()
+        thread.join()
+
+
+def __put(items: queue.Queue, entry: tuple, stopped: threading.Event) -> bool:
+    """
+    Puts an entry into the queue unless the consumer has stopped.
+    :return: False if the consumer has stopped.
+    """
+    while not stopped.is_set():
+        try:
+            items.put(entry, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
@@ -0,0 +1,85 @@
+"""
+Time convention of pipeline dataframes. Each dataframe has a single time representation, its tz-aware UTC
+DatetimeIndex, which pandas stores as int64 nanoseconds since epoch. There is no separate time column.
+
+What an index timestamp stands for is stored in df.attrs, which pandas keeps through column additions, copies and row
+selections:
+"instant": Values at the timestamp, used for pvlib clear sky simulations.
+"end": Mean values of the interval which ends at the timestamp. Meteorological convention of FMI open data, the
+timestamp 12:00 refers to the mean of 11:00-12:00.
+df.attrs["time_resolution"] holds the interval length in minutes.
+
+Solar geometry and all model steps use the index timestamps. When dataframes with different conventions are joined,
+for example FMI open data weather used for pvlib clear sky data, rows are aligned by interval centers from
+get_times(df, "center"). Dataframes without the attributes are treated as "instant" data at config.data_resolution.
+"""
+
+import numpy
+import pandas
+
+import config
+
+
+# keys of the time convention in df.attrs
+LABEL_KEY = "time_label"
+RESOLUTION_KEY = "time_resolution"
+
+# position of the index timestamp within its interval, as a fraction of the interval length from interval start
+__LABEL_POSITIONS = {"instant": 0.5, "end": 1.0}
+__POSITIONS = {"start": 0.0, "center": 0.5, "end": 1.0}
+
+
+def set_convention(df: pandas.DataFrame, label: str, resolution=None) -> pandas.DataFrame:
+    """
+    Converts df index to tz-aware UTC and stores the time convention in df.attrs.
+    :param df: Dataframe with a datetime index, naive timestamps are assumed to be in UTC.
+    :param label: "instant" or "end"
+    :param resolution: Interval length in minutes, config.data_resolution by default.
+    :return: Input df.
+    """
+    if label not in __LABEL_POSITIONS:
+        print("Unknown time label '" + str(label) + "', using instant")
+        label = "instant"
+    if resolution is None:
+        resolution = config.data_resolution
+
+    index = pandas.DatetimeIndex(df.index)
+    df.index = index.tz_localize("UTC") if index.tz is None else index.tz_convert("UTC")
+    df.attrs[LABEL_KEY] = label
+    df.attrs[RESOLUTION_KEY] = resolution
+
+    return df
+
+
+def get_convention(df: pandas.DataFrame) -> (str, float):
+    """
+    :param df: Pipeline dataframe.
+    :return: Time label and interval length in minutes, ("instant", config.data_resolution) if not set.
+    """
+    return df.attrs.get(LABEL_KEY, "instant"), df.attrs.get(RESOLUTION_KEY, config.data_resolution)
+
+
+def get_times(df: pandas.DataFrame, position="center") -> pandas.DatetimeIndex:
+    """
+    :param df: Pipeline dataframe.
+    :param position: "start", "center" or "end" of the interval of each row.
+    :return: UTC DatetimeIndex of the wanted position. Index of df itself if the position matches the index label.
+    """
+    label, resolution = get_convention(df)
+    shift = __POSITIONS[position] - __LABEL_POSITIONS[label]
+
+    index = pandas.DatetimeIndex(df.index)
+    if index.tz is None:
+        index = index.tz_localize("UTC")
+    if shift == 0:
+        return index
+    return index + pandas.Timedelta(minutes=shift * resolution)
+
+
+def get_epoch_seconds(df: pandas.DataFrame, position="center") -> numpy.ndarray:
+    """
+    :param df: Pipeline dataframe.
+    :param position: "start", "center" or "end" of the interval of each row.
+    :return: int64 numpy array of seconds since epoch.
+    """
+    return get_times(df, position).as_unit("s").asi8
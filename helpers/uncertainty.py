@@ -0,0 +1,128 @@
+"""
+Monte Carlo parameter uncertainty of forecasts. Installation parameters tilt, azimuth, albedo, reflectance_constant and
+module_elevation are often estimates, this file samples config.uncertainty_samples parameter sets around the configured
+values and computes output quantiles over the samples.
+
+All samples are evaluated with a single call of fused_pipeline.compute_output() where the sampled parameters are
+arrays which broadcast against the time axis. Solar geometry, irradiance and weather are shared by all samples, so the
+cost of K samples is K times the cost of the array arithmetic of one run, not K runs of the dataframe pipeline.
+
+Standard deviations are in config.uncertainty_std. A site in config.sites can override single values with its own
+"uncertainty_std" dict, which config.set_params_site() merges into config.uncertainty_std. Albedo is sampled as an
+offset added to the albedo column of the data, or to config.albedo if the data has no albedo column.
+"""
+
+import numpy
+import pandas
+
+import config
+from helpers import astronomical_calculations
+from helpers import daylight_mask
+from helpers import fused_pipeline
+from helpers import reflection_estimator
+
+
+# sampled parameters and the limits their values are clipped to
+PARAMETER_LIMITS = {"tilt": (0.0, 90.0), "azimuth": (None, None), "albedo": (None, None),
+                    "reflectance_constant": (0.05, 0.5), "module_elevation": (0.5, None)}
+
+
+def sample_parameters(count=None, std=None, seed=None) -> dict:
+    """
+    Samples installation parameter sets from normal distributions centered on the active config values.
+    :param count: Sample count, config.uncertainty_samples by default.
+    :param std: Dict of standard deviations by parameter name, config.uncertainty_std with the overrides of the active
+    site by default. Parameters missing from the dict are not varied.
+    :param seed: Random seed, config.uncertainty_seed by default.
+    :return: Dict {parameter name: numpy array of count values}. Albedo values are offsets to the data albedo.
+    """
+
+    if count is None:
+        count = config.uncertainty_samples
+    if std is None:
+        std = config.uncertainty_std
+    if seed is None:
+        seed = config.uncertainty_seed
+
+    centers = {"tilt": config.tilt, "azimuth": config.azimuth, "albedo": 0.0,
+               "reflectance_constant": reflection_estimator.reflectance_constant,
+               "module_elevation": config.module_elevation}
+
+    generator = numpy.random.default_rng(seed)
+    samples = {}
+    for name, center in centers.items():
+        values = generator.normal(center, std.get(name, 0.0), count)
+        lower, upper = PARAMETER_LIMITS[name]
+        samples[name] = numpy.clip(values, lower, upper)
+    samples["azimuth"] = samples["azimuth"] % 360.0
+
+    return samples
+
+
+def get_output_samples(df: pandas.DataFrame, samples: dict, geometry=None) -> numpy.ndarray:
+    """
+    Computes output of each sampled parameter set.
+    :param df: Irradiance dataframe with dni, dhi and ghi columns, albedo, T and wind columns are used if they exist.
+    :param samples: Parameter samples from sample_parameters()
+    :param geometry: Solar geometry of df index, computed if not given.
+    :return: Output in watts, numpy array with shape (sample count, row count).
+    """
+
+    if geometry is None:
+        geometry = astronomical_calculations.get_solar_geometry(df.index)
+
+    def column_or_default(name, default):
+        if name in df.columns:
+            return df[name].to_numpy(dtype=float)
+        return numpy.full(len(df.index), default, dtype=float)
+
+    albedo = numpy.clip(column_or_default("albedo", config.albedo) + samples["albedo"][:, None], 0.0, 1.0)
+
+    return fused_pipeline.compute_output(df["dni"].to_numpy(dtype=float), df["dhi"].to_numpy(dtype=float),
+                                         df["ghi"].to_numpy(dtype=float), albedo,
+                                         column_or_default("T", config.air_temp),
+                                         column_or_default("wind", config.wind_speed), geometry,
+                                         tilt=samples["tilt"], azimuth=samples["azimuth"],
+                                         module_elevation=samples["module_elevation"],
+                                         a_r=samples["reflectance_constant"])
+
+
+def add_output_quantiles_to_df(df: pandas.DataFrame, count=None, quantiles=None, std=None,
+                               seed=None) -> pandas.DataFrame:
+    """
+    Adds output quantile columns, for example output_q10, output_q50 and output_q90, to an irradiance dataframe. Only
+    rows which can receive radiation are computed, other rows get zeros.
+    :param df: Irradiance dataframe, see get_output_samples()
+    :param count: Sample count, config.uncertainty_samples by default.
+    :param quantiles: Quantiles in range [0,1], config.uncertainty_quantiles by default.
+    :param std: Standard deviations of parameters, config.uncertainty_std by default.
+    :param seed: Random seed, config.uncertainty_seed by default.
+    :return: Input df with quantile columns.
+    """
+
+    if quantiles is None:
+        quantiles = config.uncertainty_quantiles
+
+    samples = sample_parameters(count, std, seed)
+
+    geometry = astronomical_calculations.get_solar_geometry(df.index)
+    daylight = daylight_mask.get_daylight_mask(df, geometry["apparent_zenith"])
+
+    values = numpy.zeros((len(quantiles), len(df.index)))
+    if daylight.any():
+        output = get_output_samples(df[daylight], samples,
+                                    {key: geometry_values[daylight] for key, geometry_values in geometry.items()})
+        values[:, daylight] = numpy.quantile(output, quantiles, axis=0)
+
+    for quantile, quantile_values in zip(quantiles, values):
+        df[get_quantile_column(quantile)] = quantile_values
+
+    return df
+
+
+def get_quantile_column(quantile: float) -> str:
+    """
+    :param quantile: Quantile in range [0,1]
+    :return: Column name, for example "output_q10" for 0.1
+    """
+    return "output_q" + str(int(round(quantile * 100)))
@@ -1,3 +1,4 @@
+import argparse
 import datetime
 import time
 import os
@@ -9,6 +10,10 @@ from helpers import solar_irradiance_estimator, astronomical_calculations
 from helpers import reflection_estimator
 from helpers import panel_temperature_estimator
 from helpers import output_estimator
+from helpers import daylight_mask
+from helpers import scenario_pipeline
+from helpers import profiling
+from helpers import time_index
 
 import pandas as pd
 
@@ -34,6 +39,9 @@ combined_processing_of_data()
 -used get_fmi_data and get_pvlib_data to generate dataframes. Plots the data with plotter monoplot.
 plot shows power(W) and energy(kWh) values for each day.
 
+combined_processing_of_scenarios()
+-same plot as combined_processing_of_data, but fmi open and pvlib clear sky data are evaluated together in one pass
+
 Author: TimoSalola (Timo Salola).
 """
 
@@ -84,7 +92,7 @@ def full_processing_of_fmi_open_data():
     plotter.add_label_x("Time")
     plotter.add_label_y("Output(W)")
     plotter.add_title("Simulated solar PV system output")
-    plotter.plot_curve(data["time"], data["output"], label="Output(W)")
+    plotter.plot_curve(time_index.get_times(data), data["output"], label="Output(W)")
     plotter.plot_kwh_labels(data)
     plotter.show_legend()
     plotter.show_plot()
@@ -125,7 +133,7 @@ def full_processing_of_pvlib_data():
     plotter.add_label_x("Time")
     plotter.add_label_y("Output(W)")
     plotter.add_title("Simulated solar PV system output")
-    plotter.plot_curve(data["time"], data["output"], label="Output(W)")
+    plotter.plot_curve(time_index.get_times(data), data["output"], label="Output(W)")
     plotter.plot_kwh_labels(data)
     plotter.show_legend()
     plotter.show_plot()
@@ -152,20 +160,30 @@ def get_fmi_data(day_range=3):
     # step 1. simulate irradiance components dni, dhi, ghi:
     data = solar_irradiance_estimator.get_solar_irradiance(date_start, day_count=day_range, model="fmiopen")
 
+    if config.daylight_only:
+        # steps 2-6 for rows with sunlight only
+        data = daylight_mask.process_daylight_rows(data)
+        config.data_resolution = original_data_resolution
+        return data
+
     # step 2. project irradiance components to plane of array:
-    data = helpers.irradiance_transpositions.irradiance_df_to_poa_df(data)
+    with profiling.stage("transpose"):
+        data = helpers.irradiance_transpositions.irradiance_df_to_poa_df(data)
 
-    # step 3. simulate how much of irradiance components is absorbed:
-    data = helpers.reflection_estimator.add_reflection_corrected_poa_components_to_df(data)
+    with profiling.stage("reflect"):
+        # step 3. simulate how much of irradiance components is absorbed:
+        data = helpers.reflection_estimator.add_reflection_corrected_poa_components_to_df(data)
 
-    # step 4. compute sum of reflection-corrected components:
-    data = helpers.reflection_estimator.add_reflection_corrected_poa_to_df(data)
+        # step 4. compute sum of reflection-corrected components:
+        data = helpers.reflection_estimator.add_reflection_corrected_poa_to_df(data)
 
     # step 5. estimate panel temperature based on wind speed, air temperature and absorbed radiation
-    data = helpers.panel_temperature_estimator.add_estimated_panel_temperature(data)
+    with profiling.stage("temperature"):
+        data = helpers.panel_temperature_estimator.add_estimated_panel_temperature(data)
 
     # step 6. estimate power output
-    data = helpers.output_estimator.add_output_to_df(data)
+    with profiling.stage("output"):
+        data = helpers.output_estimator.add_output_to_df(data)
 
     config.data_resolution = original_data_resolution
 
@@ -186,14 +204,21 @@ def get_pvlib_data(day_range=3, data_fmi=None):
 
     data_pvlib = solar_irradiance_estimator.get_solar_irradiance(date_start, day_count=day_range, model="pvlib")
 
+    if config.daylight_only:
+        # steps 2-6 for rows with sunlight only
+        data_pvlib = daylight_mask.process_daylight_rows(data_pvlib, data_fmi)
+        return data_pvlib
+
     # step 2. project irradiance components to plane of array:
-    data_pvlib = helpers.irradiance_transpositions.irradiance_df_to_poa_df(data_pvlib)
+    with profiling.stage("transpose"):
+        data_pvlib = helpers.irradiance_transpositions.irradiance_df_to_poa_df(data_pvlib)
 
-    # step 3. simulate how much of irradiance components is absorbed:
-    data_pvlib = helpers.reflection_estimator.add_reflection_corrected_poa_components_to_df(data_pvlib)
+    with profiling.stage("reflect"):
+        # step 3. simulate how much of irradiance components is absorbed:
+        data_pvlib = helpers.reflection_estimator.add_reflection_corrected_poa_components_to_df(data_pvlib)
 
-    # step 4. compute sum of reflection-corrected components:
-    data_pvlib = helpers.reflection_estimator.add_reflection_corrected_poa_to_df(data_pvlib)
+        # step 4. compute sum of reflection-corrected components:
+        data_pvlib = helpers.reflection_estimator.add_reflection_corrected_poa_to_df(data_pvlib)
 
     # step 4.1. adding wind and air speed to dataframe
     if data_fmi is not None:
@@ -204,12 +229,12 @@ def get_pvlib_data(day_range=3, data_fmi=None):
         data_pvlib = helpers.panel_temperature_estimator.add_dummy_wind_and_temp(data_pvlib, config.wind_speed, config.air_temp)
 
     # step 5. estimate panel temperature based on wind speed, air temperature and absorbed radiation
-    data_pvlib = helpers.panel_temperature_estimator.add_estimated_panel_temperature(data_pvlib)
+    with profiling.stage("temperature"):
+        data_pvlib = helpers.panel_temperature_estimator.add_estimated_panel_temperature(data_pvlib)
 
     # step 6. estimate power output
-    data_pvlib = helpers.output_estimator.add_output_to_df(data_pvlib)
-
-    data_pvlib = data_pvlib.dropna()
+    with profiling.stage("output"):
+        data_pvlib = helpers.output_estimator.add_output_to_df(data_pvlib)
 
     return data_pvlib
 
@@ -243,8 +268,8 @@ def combined_processing_of_data():
 
         print("-----Columns explained-----")
         print(
-            "[index(Time)]: Meteorological time. In meteorology, timestamp for 13:00 represents the time 12:00-13:00.")
-        print("[time]: This is time index shifted by 30min. More useful than the meteorological time for physics.")
+            "[index(Time)]: Meteorological time. In meteorology, timestamp for 13:00 represents the time 12:00-13:00."
+            " Interval centers are computed from the index when needed, see helpers/time_index.py")
         print("[dni, dhi, ghi]: Irradiance types, these can be used for estimating radiation from direct radiation,"
               " atmosphere scattered radiation and ground reflected radiation.")
         print("[albedo]: Ground reflectivity near installation. This is retrieved from fmi open data service. Should be"
@@ -278,7 +303,46 @@ def combined_processing_of_data():
 
     plotter.plot_fmi_pvlib_mono(data_fmi, data_pvlib)
 
-os.makedirs('output', exist_ok=True)  # Luo 'output' kansion jos sitä ei ole
-config.set_params_custom()
-combined_processing_of_data()
+def combined_processing_of_scenarios(day_range=3):
+    """
+    Evaluates fmi open and pvlib clear sky irradiance as scenarios of a single pipeline run and plots both. Solar
+    geometry is computed once for both scenarios, see helpers/scenario_pipeline.py
+    :param day_range: Day count, 1 returns only this day, 3 returns this day and the 2 following days.
+    """
+
+    # fmi open data has 60 minute resolution, using the same resolution for the common time grid
+    original_data_resolution = config.data_resolution
+    config.data_resolution = 60
+
+    # date for simulation:
+    today = datetime.date.today()
+    date_start = datetime.datetime(today.year, today.month, today.day)
+
+    # step 1. irradiance components for both scenarios, fmi open data also gives weather for the clear sky scenario
+    data_fmi = solar_irradiance_estimator.get_solar_irradiance(date_start, day_count=day_range, model="fmiopen")
+    data_pvlib = solar_irradiance_estimator.get_solar_irradiance(date_start, day_count=day_range, model="pvlib")
+
+    # steps 2-6 for both scenarios on the pvlib time grid
+    results = scenario_pipeline.evaluate_scenarios({"pvlib": data_pvlib, "fmi": data_fmi}, weather=data_fmi,
+                                                   clear_sky="pvlib")
+
+    config.data_resolution = original_data_resolution
+
+    if config.console_print:
+        print_full(results)
+
+    plotter.plot_fmi_pvlib_mono(scenario_pipeline.get_scenario_df(results, "fmi"),
+                                scenario_pipeline.get_scenario_df(results, "pvlib"))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generates and plots clear sky and weather model based PV forecasts.")
+    parser.add_argument("--profile", nargs="?", const="sampling", default=None, choices=["sampling", "cprofile"],
+                        help="profile the run, results are saved into the output directory")
+    args = parser.parse_args()
+
+    os.makedirs('output', exist_ok=True)  # Luo 'output' kansion jos sitä ei ole
+    config.set_params_custom()
+    with profiling.profile("main", args.profile):
+        combined_processing_of_data()
 
@@ -0,0 +1,296 @@
+"""
+Short horizon nowcasts. Between forecast runs real production diverges from the forecast when clouds differ from the
+HARMONIE forecast. This file runs a cycle every config.nowcast_interval minutes which blends the latest measured
+production of each site into the next config.nowcast_hours hours of the cached forecast and writes the result as
+InfluxDB measurement "pv_nowcast" with a site tag.
+
+Blending is done with the clear sky index k, output divided by clear sky output:
+k_measured: Latest measured output divided by clear sky output at the time of the measurement.
+k_forecast(t): Cached forecast divided by clear sky output.
+k(t) = k_forecast(t) + (k_measured - k_forecast(t_measured)) * exp(-(t - t_measured) / config.nowcast_decay_hours)
+nowcast(t) = k(t) * clear sky output(t)
+The measured deviation from the forecast is used fully at the time of the measurement and fades towards the forecast
+with increasing horizon. Sites without a forecast use the measured index as persistence, sites without a recent
+measurement and times with low clear sky output use the forecast.
+
+Inputs, all kept in memory between cycles:
+Clear sky output of each site as a site x time matrix at config.nowcast_resolution, computed with the fused pipeline
+once per day. Matrix columns are the centers of intervals which end at multiples of config.nowcast_resolution, so the
+values at the centers stand for the interval means written with the startTime and endTime of the intervals.
+Cached forecasts are the forecast csv files of the sites written by scheduler.py, config.save_directory +
+site_name + "-forecast.csv". Files are read again only when they change.
+Latest measured output of all sites is read with one InfluxDB query, measurement and field MEASURED_MEASUREMENT and
+MEASURED_FIELD of get_forecast.py with the site name as "site" tag. config.nowcast_measurement_file can be set to a
+csv file with time, site and power (kW) columns which is used instead of InfluxDB.
+
+A cycle is a few array operations over the site x time matrices, one query and one batched write.
+
+Usage:
+python nowcast.py [--interval 5] [--once]
+"""
+
+import argparse
+import datetime
+import os
+import time
+
+import numpy
+import pandas
+
+import config
+from helpers import astronomical_calculations, fused_pipeline, solar_irradiance_estimator, time_index
+
+
+def create_nowcast_state(sites=None) -> dict:
+    """
+    :param sites: List of site dicts, config.sites by default.
+    :return: State dict used by nowcast_cycle(), clear sky and forecasts are loaded on the first cycle.
+    """
+    if sites is None:
+        sites = config.sites
+    return {"sites": sites, "times": None, "interval_starts": None, "interval_ends": None, "clear_sky": None,
+            "forecast": None, "forecast_versions": {}}
+
+
+def nowcast_cycle(state: dict, now=None, measurements=None) -> dict:
+    """
+    Computes nowcasts of all sites.
+    :param state: State dict from create_nowcast_state(), updated in place.
+    :param now: Current time, tz-aware. Current UTC time by default.
+    :param measurements: Dataframe indexed with site names with columns time and power (kW), read with
+    read_latest_measurements() if not given.
+    :return: Dict {site_name: dataframe with startTime, endTime, output (W) and clear_sky_index columns}
+    """
+    if now is None:
+        now = pandas.Timestamp.now(tz="UTC")
+    now = pandas.Timestamp(now).tz_convert("UTC")
+    horizon_end = now + pandas.Timedelta(hours=config.nowcast_hours)
+
+    if state["times"] is None or horizon_end > state["interval_ends"][-1]:
+        __update_clear_sky(state, now)
+    __update_forecasts(state)
+
+    if measurements is None:
+        measurements = read_latest_measurements(state["sites"], now)
+
+    site_names = [site["site_name"] for site in state["sites"]]
+    measured_power = numpy.full(len(site_names), numpy.nan)
+    measured_time = numpy.full(len(site_names), numpy.nan)
+    for number, site_name in enumerate(site_names):
+        if site_name in measurements.index:
+            measured_power[number] = float(measurements.loc[site_name, "power"]) * 1000.0
+            measured_time[number] = pandas.Timestamp(measurements.loc[site_name, "time"]).timestamp()
+
+    # intervals which end after now
+    steps = (state["interval_ends"] > now) & (state["interval_ends"] <= horizon_end)
+    nowcast, index = blend(state["seconds"], state["clear_sky"], state["forecast"], measured_power, measured_time,
+                           now.timestamp(), steps, state["rated_power"])
+
+    start_times = state["interval_starts"][steps]
+    end_times = state["interval_ends"][steps]
+    return {site_name: pandas.DataFrame({"startTime": start_times, "endTime": end_times,
+                                        "output": nowcast[number], "clear_sky_index": index[number]})
+            for number, site_name in enumerate(site_names)}
+
+
+def blend(seconds, clear_sky, forecast, measured_power, measured_time, now, steps, rated_power) -> (numpy.ndarray,
+                                                                                                  numpy.ndarray):
+    """
+    Blends measured clear sky indices into forecasts, see the file description.
+    :param seconds: Times of the matrix columns as seconds since epoch.
+    :param clear_sky: Clear sky output in watts, shape (site count, time count).
+    :param forecast: Forecasted output in watts with the same shape, nan where there is no forecast.
+    :param measured_power: Latest measured output of each site in watts, nan if missing.
+    :param measured_time: Time of the latest measurement as seconds since epoch, nan if missing.
+    :param now: Current time as seconds since epoch.
+    :param steps: Boolean mask of the columns to nowcast.
+    :param rated_power: Rated power of each site in kW.
+    :return: Nowcast output in watts and clear sky index, both with shape (site count, step count).
+    """
+    lower, upper = config.nowcast_index_limits
+    threshold = (config.nowcast_min_clear_sky * rated_power * 1000.0)[:, None]
+
+    # values at the time of the measurement, measurement time is replaced with now for sites without a measurement
+    fresh = numpy.isfinite(measured_power) & (now - measured_time <= config.nowcast_max_age * 60)
+    reference_time = numpy.where(fresh, measured_time, now)
+    clear_sky_measured = __interpolate_rows(seconds, clear_sky, reference_time)
+    forecast_measured = __interpolate_rows(seconds, forecast, reference_time)
+    fresh &= clear_sky_measured > threshold[:, 0]
+
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        index_measured = numpy.where(fresh, numpy.clip(measured_power / clear_sky_measured, lower, upper), numpy.nan)
+        index_forecast_measured = numpy.clip(forecast_measured / clear_sky_measured, lower, upper)
+        index_forecast = numpy.clip(forecast[:, steps] / clear_sky[:, steps], lower, upper)
+
+    # sites without a forecast persist the measured index
+    index_forecast = numpy.where(numpy.isnan(index_forecast), index_measured[:, None], index_forecast)
+    index_forecast_measured = numpy.where(numpy.isnan(index_forecast_measured), index_measured,
+                                          index_forecast_measured)
+
+    decay = numpy.exp(-(seconds[steps][None, :] - reference_time[:, None]) / (config.nowcast_decay_hours * 3600.0))
+    correction = numpy.where(fresh, index_measured - index_forecast_measured, 0.0)[:, None] * decay
+    index = numpy.clip(index_forecast + correction, lower, upper)
+
+    clear_sky_steps = clear_sky[:, steps]
+    daylight = (clear_sky_steps > threshold) & numpy.isfinite(index)
+    nowcast = numpy.where(daylight, index * clear_sky_steps, forecast[:, steps])
+    nowcast = numpy.where(numpy.isnan(nowcast), 0.0, nowcast)
+
+    return nowcast, numpy.where(daylight, index, numpy.nan)
+
+
+def read_latest_measurements(sites: list, now) -> pandas.DataFrame:
+    """
+    Reads the latest measured output of each site within config.nowcast_max_age minutes.
+    :param sites: List of site dicts.
+    :param now: Current time, tz-aware.
+    :return: Dataframe indexed with site names with columns time and power (kW). Sites without measurements are
+    missing.
+    """
+    since = now - pandas.Timedelta(minutes=config.nowcast_max_age)
+
+    if config.nowcast_measurement_file is not None:
+        if not os.path.exists(config.nowcast_measurement_file):
+            print("Measurement file " + config.nowcast_measurement_file + " not found")
+            return pandas.DataFrame(columns=["time", "power"])
+        measured = pandas.read_csv(config.nowcast_measurement_file)
+        measured["time"] = pandas.to_datetime(measured["time"], utc=True)
+        measured = measured[(measured["time"] >= since) & (measured["time"] <= now)]
+        return measured.sort_values("time").groupby("site")[["time", "power"]].last()
+
+    import get_forecast
+    measured = get_forecast.read_latest_from_influx(get_forecast.MEASURED_MEASUREMENT, get_forecast.MEASURED_FIELD,
+                                                    since)
+    site_names = {site["site_name"] for site in sites}
+    return measured[measured.index.isin(site_names)].rename(columns={"value": "power"})
+
+
+def run_nowcast(interval=None, sites=None, max_cycles=None):
+    """
+    Runs nowcast cycles and writes them to InfluxDB measurement "pv_nowcast" when InfluxDB is in use, to
+    config.save_directory + "nowcast.csv" otherwise.
+    :param interval: Minutes between cycles, config.nowcast_interval by default.
+    :param sites: List of site dicts, config.sites by default.
+    :param max_cycles: Stop after this many cycles, runs forever by default.
+    """
+    if interval is None:
+        interval = config.nowcast_interval
+
+    import get_forecast
+    state = create_nowcast_state(sites)
+
+    cycle_count = 0
+    while max_cycles is None or cycle_count < max_cycles:
+        if cycle_count > 0:
+            # cycles start at multiples of the interval
+            time.sleep(interval * 60 - time.time() % (interval * 60))
+        cycle_count += 1
+
+        started = time.time()
+        nowcasts = nowcast_cycle(state)
+        for nowcast in nowcasts.values():
+            nowcast["output"] = nowcast["output"] / 1000.0
+
+        if get_forecast.INFLUX_IN_USE:
+            get_forecast.write_sites_to_influx(nowcasts, "pv_nowcast", upsert=False)
+        else:
+            combined = pandas.concat(nowcasts, names=["site", None]).reset_index(level=0)
+            combined.to_csv(config.save_directory + "nowcast.csv", float_format="%.3f", index=False)
+        print("Nowcast of " + str(len(nowcasts)) + " sites done in " + str(round(time.time() - started, 2)) +
+              " seconds")
+
+
+def __update_clear_sky(state: dict, now: pandas.Timestamp):
+    """
+    Computes clear sky output of all sites for the day of now and the next day. Clear sky instants are the centers of
+    the nowcast intervals, see helpers/time_index.py.
+    """
+    date_start = datetime.datetime(now.year, now.month, now.day) + datetime.timedelta(
+        minutes=config.nowcast_resolution / 2)
+
+    original_resolution = config.data_resolution
+    config.data_resolution = config.nowcast_resolution
+    try:
+        irradiance = solar_irradiance_estimator.get_clear_sky_irradiance_for_sites(state["sites"], date_start, 2)
+    finally:
+        config.data_resolution = original_resolution
+
+    first = irradiance[state["sites"][0]["site_name"]]
+    times = time_index.get_times(first, "center")
+    clear_sky = numpy.empty((len(state["sites"]), len(times)))
+    rated_power = numpy.empty(len(state["sites"]))
+    try:
+        for number, site in enumerate(state["sites"]):
+            config.set_params_site(site)
+            data = irradiance[site["site_name"]]
+            geometry = astronomical_calculations.get_solar_geometry(data.index)
+            clear_sky[number] = fused_pipeline.compute_output(data["dni"].to_numpy(), data["dhi"].to_numpy(),
+                                                              data["ghi"].to_numpy(),
+                                                              numpy.full(len(times), config.albedo),
+                                                              numpy.full(len(times), config.air_temp),
+                                                              numpy.full(len(times), config.wind_speed), geometry)
+            rated_power[number] = config.rated_power
+    finally:
+        config.set_params_site({})
+
+    state["times"] = times
+    state["interval_starts"] = time_index.get_times(first, "start")
+    state["interval_ends"] = time_index.get_times(first, "end")
+    state["seconds"] = times.as_unit("s").asi8.astype(float)
+    state["clear_sky"] = clear_sky
+    state["rated_power"] = rated_power
+    # forecasts are interpolated to the new times
+    state["forecast"] = None
+    state["forecast_versions"] = {}
+
+
+def __update_forecasts(state: dict):
+    """
+    Interpolates forecast csv files which changed since the last cycle to the clear sky times.
+    """
+    if state["forecast"] is None:
+        state["forecast"] = numpy.full(state["clear_sky"].shape, numpy.nan)
+
+    for number, site in enumerate(state["sites"]):
+        path = config.save_directory + site["site_name"] + "-forecast.csv"
+        version = os.path.getmtime(path) if os.path.exists(path) else None
+        if version == state["forecast_versions"].get(site["site_name"]):
+            continue
+        state["forecast_versions"][site["site_name"]] = version
+
+        state["forecast"][number] = numpy.nan
+        if version is None:
+            continue
+        forecast = pandas.read_csv(path, usecols=["endTime", "output"])
+        # hourly means are interpolated at the centers of their intervals
+        centers = pandas.DatetimeIndex(pandas.to_datetime(forecast["endTime"], utc=True)) - pandas.Timedelta(minutes=30)
+        state["forecast"][number] = numpy.interp(state["seconds"], centers.as_unit("s").asi8.astype(float),
+                                                 forecast["output"].to_numpy(dtype=float), left=numpy.nan,
+                                                 right=numpy.nan)
+
+
+def __interpolate_rows(seconds: numpy.ndarray, matrix: numpy.ndarray, times: numpy.ndarray) -> numpy.ndarray:
+    """
+    Linear interpolation of each row of matrix at its own time, columns are at evenly spaced times.
+    :return: Array with one value per row, nan outside the times of the columns.
+    """
+    position = (times - seconds[0]) / (seconds[1] - seconds[0])
+    inside = (position >= 0) & (position <= len(seconds) - 1)
+    position = numpy.clip(position, 0, len(seconds) - 1)
+    lower = numpy.minimum(numpy.floor(position).astype(int), len(seconds) - 2)
+    fraction = position - lower
+    rows = numpy.arange(matrix.shape[0])
+    values = matrix[rows, lower] * (1 - fraction) + matrix[rows, lower + 1] * fraction
+    return numpy.where(inside, values, numpy.nan)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Blends latest measurements into cached forecasts every few minutes.")
+    parser.add_argument("--interval", type=float, default=None, help="minutes between cycles")
+    parser.add_argument("--once", action="store_true", help="run one cycle and exit")
+    args = parser.parse_args()
+
+    os.makedirs(config.save_directory, exist_ok=True)
+    config.set_params_custom()
+
+    run_nowcast(args.interval, max_cycles=1 if args.once else None)
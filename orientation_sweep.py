@@ -0,0 +1,143 @@
+"""
+Orientation and sizing sweep for installation design. Estimates annual energy yield for a grid of panel tilt and
+azimuth candidates at the location set in config.py and finds the orientation with the highest yield.
+
+All candidates are evaluated with the fused pipeline by broadcasting orientations over the time axis. Solar position
+and the orientation independent parts of the transposition models are computed only once for the whole grid.
+Candidates are processed in chunks of chunk_size orientations to limit memory use.
+
+Irradiance input is either a year of PVlib clear sky data or csv files with previously saved FMI open data, for
+example files saved by main.py when save_csv is True in config.py.
+
+Usage:
+python orientation_sweep.py [--year 2024] [--csv file1.csv ...] [--tilt-step 1] [--azimuth-step 5] [--sizes 6 10]
+"""
+
+import argparse
+import datetime
+import os
+import time
+import numpy
+import pandas
+
+import config
+from helpers import solar_irradiance_estimator, astronomical_calculations, fused_pipeline
+
+
+def sweep_orientations(data: pandas.DataFrame, tilts, azimuths, resolution=None, chunk_size=256) -> pandas.DataFrame:
+    """
+    Computes specific yield for every combination of given tilts and azimuths.
+    :param data: Irradiance dataframe with dni, dhi and ghi columns and a datetime index. Optional columns albedo, T and
+    wind are used if they exist, config values otherwise.
+    :param tilts: Candidate tilts in degrees.
+    :param azimuths: Candidate azimuths in degrees.
+    :param resolution: Minutes between rows, config.data_resolution by default.
+    :param chunk_size: Number of orientations computed at once.
+    :return: Dataframe of specific yield in kWh/kWp, tilts as index and azimuths as columns.
+    """
+
+    if resolution is None:
+        resolution = config.data_resolution
+
+    geometry = astronomical_calculations.get_solar_geometry(data.index)
+
+    # output is zero when sun is below horizon, only daylight rows are processed
+    daylight = geometry["apparent_zenith"] < 90
+    geometry = {key: values[daylight] for key, values in geometry.items()}
+    data = data[daylight]
+
+    def column_or_default(name, default):
+        if name in data.columns:
+            return data[name].to_numpy(dtype=float)
+        return numpy.full(len(data.index), default, dtype=float)
+
+    inputs = [data["dni"].to_numpy(dtype=float), data["dhi"].to_numpy(dtype=float), data["ghi"].to_numpy(dtype=float),
+              column_or_default("albedo", config.albedo), column_or_default("T", config.air_temp),
+              column_or_default("wind", config.wind_speed)]
+
+    tilt_grid, azimuth_grid = numpy.meshgrid(numpy.asarray(tilts, dtype=float), numpy.asarray(azimuths, dtype=float),
+                                             indexing="ij")
+    tilt_flat = tilt_grid.ravel()
+    azimuth_flat = azimuth_grid.ravel()
+
+    specific_yield = numpy.empty(tilt_flat.size)
+    for start in range(0, tilt_flat.size, chunk_size):
+        chunk = slice(start, start + chunk_size)
+        # rated power of 1kW gives the yield per installed kW
+        output = fused_pipeline.compute_output(*inputs, geometry, tilt=tilt_flat[chunk], azimuth=azimuth_flat[chunk],
+                                               rated_power=1.0)
+        specific_yield[chunk] = output.sum(axis=-1) * (resolution / 60.0) / 1000.0
+
+    return pandas.DataFrame(specific_yield.reshape(tilt_grid.shape), index=pandas.Index(tilts, name="tilt"),
+                            columns=pandas.Index(azimuths, name="azimuth"))
+
+
+def find_optimum(surface: pandas.DataFrame) -> (float, float, float):
+    """
+    :param surface: Yield surface from sweep_orientations()
+    :return: tilt, azimuth and yield of the best orientation
+    """
+    tilt_number, azimuth_number = numpy.unravel_index(numpy.argmax(surface.to_numpy()), surface.shape)
+    return surface.index[tilt_number], surface.columns[azimuth_number], surface.iat[tilt_number, azimuth_number]
+
+
+def get_sweep_input(year=None, csv_files=None) -> pandas.DataFrame:
+    """
+    Returns irradiance input for sweep_orientations().
+    :param year: Year of PVlib clear sky data, previous year by default.
+    :param csv_files: List of csv files with FMI open data saved by main.py. Used instead of clear sky data if given.
+    :return: Irradiance dataframe.
+    """
+
+    if csv_files:
+        data = pandas.concat([pandas.read_csv(file, index_col=0, parse_dates=True) for file in csv_files])
+        # overlapping forecasts, keeping the latest values for each timestamp
+        data = data[~data.index.duplicated(keep="last")].sort_index()
+        if data.index.tz is None:
+            data.index = data.index.tz_localize("UTC")
+        return data
+
+    if year is None:
+        year = datetime.date.today().year - 1
+    date_start = datetime.datetime(year, 1, 1)
+    day_count = (datetime.datetime(year + 1, 1, 1) - date_start).days
+
+    return solar_irradiance_estimator.get_solar_irradiance(date_start, day_count=day_count, model="pvlib")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Annual yield sweep over panel tilts and azimuths.")
+    parser.add_argument("--year", type=int, default=None, help="year of clear sky data, previous year by default")
+    parser.add_argument("--csv", nargs="+", default=None, help="FMI open data csv files used instead of clear sky")
+    parser.add_argument("--tilt-step", type=float, default=1.0, help="tilt step in degrees")
+    parser.add_argument("--azimuth-step", type=float, default=5.0, help="azimuth step in degrees")
+    parser.add_argument("--sizes", type=float, nargs="*", default=[], help="installation sizes in kW to report")
+    args = parser.parse_args()
+
+    config.set_params_custom()
+
+    time_start = time.time()
+    sweep_data = get_sweep_input(args.year, args.csv)
+    resolution = config.data_resolution if args.csv is None else 60
+
+    sweep_tilts = numpy.arange(0, 90 + args.tilt_step / 2, args.tilt_step)
+    sweep_azimuths = numpy.arange(0, 360, args.azimuth_step)
+    yield_surface = sweep_orientations(sweep_data, sweep_tilts, sweep_azimuths, resolution)
+
+    best_tilt, best_azimuth, best_yield = find_optimum(yield_surface)
+    current_yield = sweep_orientations(sweep_data, [config.tilt], [config.azimuth], resolution).iat[0, 0]
+
+    print("Evaluated " + str(yield_surface.size) + " orientations over " + str(len(sweep_data.index)) +
+          " timestamps in " + str(round(time.time() - time_start, 2)) + " seconds")
+    print("Optimum: tilt " + str(best_tilt) + ", azimuth " + str(best_azimuth) + ", " + str(round(best_yield, 1)) +
+          " kWh/kWp")
+    print("Configured: tilt " + str(config.tilt) + ", azimuth " + str(config.azimuth) + ", " +
+          str(round(current_yield, 1)) + " kWh/kWp")
+    for size in args.sizes:
+        print(str(size) + " kW: " + str(round(best_yield * size)) + " kWh at optimum, " +
+              str(round(current_yield * size)) + " kWh configured")
+
+    os.makedirs(config.save_directory, exist_ok=True)
+    filename = config.save_directory + config.site_name + "-orientation_sweep.csv"
+    yield_surface.to_csv(filename, float_format="%.2f")
+    print("Saved yield surface as: " + filename)
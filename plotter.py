@@ -3,15 +3,23 @@ Functions for generating and saving plots.
 
 Author: Timo Salola.
 """
+import concurrent.futures
+import hashlib
+import json
+import os
 import matplotlib.pyplot
 import matplotlib.dates
+import matplotlib.figure
+import matplotlib.backends.backend_agg
 import pandas
 from matplotlib import dates
 import datetime
 from datetime import datetime
 from matplotlib.dates import DateFormatter
 import config
-import pytz
+from helpers import energy_aggregation
+from helpers import time_index
+from helpers import profiling
 global fig
 global ax
 
@@ -101,19 +109,11 @@ def set_size(x, y):
 
 
 def plot_kwh_labels(df, y_offset=0):
-    df2 = df[["time", "output"]].copy()
+    daily = energy_aggregation.daily_energy(df)
 
-    df2["date"] = pandas.to_datetime(df2["time"]).dt.date
-
-    # df2 = df2.groupby(["date"])["output"]
-    df2 = df2.drop("time", axis=1)
-    df2 = df2.groupby(["date"]).sum()
-
-    df2["output_kwh"] = df2["output"] / 1000 * (60 / config.data_resolution)
-
-    for index, row in df2.iterrows():
-        x_value = datetime(index.year, index.month, index.day, 8)
-        output = round(row["output_kwh"], -1)
+    for day, output_kwh in daily.items():
+        x_value = datetime(day.year, day.month, day.day, 8)
+        output = round(output_kwh, -1)
         text = str(output) + " kWh"
         matplotlib.pyplot.text(x_value, y_offset, text)
 
@@ -126,22 +126,174 @@ def default_labels_and_title(date):
 
 def plot_fmi_pvlib_mono(data_fmi, data_pvlib):
     """
-    Generates a plot from 2 dataframes with time and output columns.
+    Generates a plot from 2 dataframes with output columns. Input dataframes are not modified.
     :param data_fmi:
     :param data_pvlib:
     :return:
     """
 
-    # Timezone of plots could be adjusted to local timezone here. Currently this does not work and thus plots are in UTC
-    finnish_time = pytz.timezone("Europe/Helsinki")
+    # plots are in UTC, matplotlib converts timezone aware times to UTC and daily energy uses config.local_timezone
+    with profiling.stage("plot"):
+        f = matplotlib.pyplot.figure(figsize=(12, 6))
+        template = __create_mono_template(f)
+
+        savepath = __render_mono_template(template, config.site_name, data_fmi, data_pvlib, config.data_resolution)
+    print("Simulation plot saved as '" + savepath + "'")
+    print("-------------------------------------------------------------------------------------------------------")
+
+    # closing figure explicitly, pyplot keeps references to all open figures otherwise
+    matplotlib.pyplot.close(f)
+
+    #matplotlib.pyplot.show()
+
+
+# BATCH PLOTTING ############################################
+# Batch plotting renders mono plots for many sites without pyplot. Figures are drawn with the non-interactive Agg
+# canvas and each process builds a single figure template, which is updated with new data for every site instead of
+# rebuilding the axes. Plots are skipped if the plotted data has not changed since the last rendering.
+
+# figure template of this process, created on first batch plot
+__batch_template = None
+
+
+def plot_fmi_pvlib_mono_batch(jobs: list, workers=1, skip_unchanged=True) -> list:
+    """
+    Renders mono plots for multiple sites.
+    :param jobs: List of (site_name, data_fmi, data_pvlib) tuples. Dataframes require output columns.
+    :param workers: Number of worker processes, 1 renders in the calling process.
+    :param skip_unchanged: Skips sites whose plotted data is identical to the previous rendering.
+    :return: List of plot file paths in job order.
+    """
+
+    cache_path = config.save_directory + "plot_cache.json"
+    cache = {}
+    if skip_unchanged and os.path.exists(cache_path):
+        with open(cache_path, "r") as file:
+            cache = json.load(file)
+
+    # splitting jobs to rendered and skipped ones
+    paths = [None] * len(jobs)
+    hashes = [__hash_plot_input(*job) for job in jobs]
+    to_render = []
+    for i, job in enumerate(jobs):
+        cached = cache.get(job[0])
+        if skip_unchanged and cached is not None and cached["hash"] == hashes[i] and os.path.exists(cached["path"]):
+            paths[i] = cached["path"]
+        else:
+            to_render.append(i)
+
+    print("Batch plotting " + str(len(to_render)) + " sites, " + str(len(jobs) - len(to_render)) + " unchanged")
+
+    render_jobs = [jobs[i] + (config.data_resolution,) for i in to_render]
+    if workers > 1 and len(render_jobs) > 1:
+        chunks = [render_jobs[i::workers] for i in range(workers)]
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(__render_batch_chunk, chunks))
+        # restoring job order from the interleaved chunks
+        rendered = [None] * len(render_jobs)
+        for chunk_number, chunk_paths in enumerate(results):
+            rendered[chunk_number::workers] = chunk_paths
+    else:
+        rendered = __render_batch_chunk(render_jobs)
+
+    for i, path in zip(to_render, rendered):
+        paths[i] = path
+        cache[jobs[i][0]] = {"hash": hashes[i], "path": path}
+
+    if skip_unchanged:
+        with open(cache_path, "w") as file:
+            json.dump(cache, file, indent=1)
+
+    return paths
+
+
+def __render_batch_chunk(render_jobs: list) -> list:
+    """
+    Renders a list of (site_name, data_fmi, data_pvlib, pvlib_resolution) jobs with the template of this process.
+    """
+    global __batch_template
 
-    data_pvlib["time"] = data_pvlib["time"].dt.tz_convert(finnish_time)
-    data_fmi["time"] = data_fmi["time"].dt.tz_convert(finnish_time)
+    if __batch_template is None:
+        __batch_template = __create_mono_template(matplotlib.figure.Figure(figsize=(12, 6)))
+        matplotlib.backends.backend_agg.FigureCanvasAgg(__batch_template["figure"])
 
-    f, (a0, a1) = matplotlib.pyplot.subplots(1, 2, gridspec_kw={'width_ratios': [3, 1]}, figsize=(12, 6))
+    return [__render_mono_template(__batch_template, *job) for job in render_jobs]
 
-    # plotting pvlib and fmi data
-    a0.plot(data_pvlib["time"], data_pvlib["output"], label="Theoretical clear sky generation", c="#6ec8fa")
+
+def __hash_plot_input(site_name, data_fmi, data_pvlib) -> str:
+    """
+    Hash of everything in the plot which depends on input data.
+    """
+    digest = hashlib.sha1(site_name.encode())
+    for data in [data_fmi, data_pvlib]:
+        digest.update(time_index.get_epoch_seconds(data).tobytes())
+        digest.update(data["output"].to_numpy(dtype=float).tobytes())
+    return digest.hexdigest()
+
+
+def __create_mono_template(f) -> dict:
+    """
+    Creates axes and artists of the mono plot. Artists are filled with data by __render_mono_template().
+    :param f: Matplotlib figure.
+    :return: Dict of figure, axes and artists.
+    """
+
+    a0, a1 = f.subplots(1, 2, gridspec_kw={'width_ratios': [3, 1]})
+
+    # pvlib, fmi and simulation runtime lines
+    pvlib_line, = a0.plot([], [], label="Theoretical clear sky generation", c="#6ec8fa")
+    fmi_line, = a0.plot([], [], label="Weather model based generation", c="#303193")
+    now_line, = a0.plot([], [], color="silver", linestyle='--')
+
+    # adding legend
+    a0.legend(loc='upper right')
+
+    a1.set_title('Energy generation')
+
+    # plot 0 labels
+    a0.set_ylabel("Power(W)")
+    a0.set_xlabel("Time(UTC)")
+
+    a1.set_xlabel("Date")
+    a1.set_ylabel("Energy(kWh)")
+
+    # formatting plot 1 date axis
+    a0.xaxis.set_major_formatter(DateFormatter("%m-%d"))
+    a0.xaxis.set_minor_locator(matplotlib.dates.HourLocator(interval=4))
+    a0.xaxis.set_minor_formatter(DateFormatter("%H"))
+
+    # moves major axis to top of plot
+    a0.tick_params(axis="x", which="major", top=True, labeltop=True, bottom=False, labelbottom=False)
+
+    # shifts markers for days from midnight to near middle of power generation peaks
+    a0.xaxis.set_major_locator(matplotlib.dates.HourLocator(byhour=10))
+
+    # formatting plot 2 date axis so that 2023-11-23 is shown as 11-23 and markers are shown only once per day
+    a1.xaxis.set_major_formatter(DateFormatter("%m-%d"))
+    a1.xaxis.set_major_locator(matplotlib.dates.DayLocator(interval=1))
+
+    return {"figure": f, "a0": a0, "a1": a1, "pvlib_line": pvlib_line, "fmi_line": fmi_line, "now_line": now_line,
+            "data_artists": [], "laid_out": False}
+
+
+def __render_mono_template(template: dict, site_name, data_fmi, data_pvlib, pvlib_resolution) -> str:
+    """
+    Fills mono plot template with data and saves it as a .png -file.
+    :return: Path of the saved plot.
+    """
+
+    a0 = template["a0"]
+    a1 = template["a1"]
+
+    # removing bar containers and texts of the previous rendering, removing a container also removes its bars and
+    # drops it from a1.containers
+    for artist in template["data_artists"]:
+        artist.remove()
+    template["data_artists"] = []
+
+    # plotting pvlib data
+    template["pvlib_line"].set_data(matplotlib.dates.date2num(time_index.get_times(data_pvlib)),
+                                    data_pvlib["output"].to_numpy())
 
     # removing leading and trailing power output is zero values from fmi open data based energy generation data
     # Find the index of the first non-zero value
@@ -153,41 +305,31 @@ def plot_fmi_pvlib_mono(data_fmi, data_pvlib):
     # Extract the section of the DataFrame without leading and trailing zeros
     data_fmi = data_fmi.loc[start_index:end_index]
 
-    a0.plot(data_fmi["time"], data_fmi["output"],
-            label="Weather model based generation", c="#303193")
-
-    # adding legend
-    a0.legend(loc='upper right')
+    template["fmi_line"].set_data(matplotlib.dates.date2num(time_index.get_times(data_fmi)),
+                                  data_fmi["output"].to_numpy())
 
     #reading date from fmi data
     date_for_simulation = data_fmi.index[0].date()
     now = datetime.utcnow()
     timestamp = str(date_for_simulation) + " " + str(now.time())[0:5]
 
-    # adding titles for both plots
-    a0.set_title('Power generation "' + config.site_name + "\" " + timestamp + "UTC")
-    a1.set_title('Energy generation')
-
-    # plot 0 labels
-    a0.set_ylabel("Power(W)")
-    a0.set_xlabel("Time(UTC)")
-
-    a1.set_xlabel("Date")
-    a1.set_ylabel("Energy(kWh)")
+    # adding title for plot 0
+    a0.set_title('Power generation "' + site_name + "\" " + timestamp + "UTC")
 
     # calculating kwh sums for pvlib
-    pvlib_x, pvlib_y = __get_dayily_power_sums(data_pvlib, config.data_resolution) # pvlib resolution can be any
+    pvlib_x, pvlib_y = __get_dayily_power_sums(data_pvlib, pvlib_resolution) # pvlib resolution can be any
 
     # calculating khw sums for fmi
     fmi_x, fmi_y = __get_dayily_power_sums(data_fmi, 60) # fmi open data only gives 60min resolution data
 
     # plotting kwh sums on second plot
-    a1.bar(pvlib_x, pvlib_y, color="#6ec8fa")
-    a1.bar(fmi_x, fmi_y, color="#303193")
+    template["data_artists"].append(a1.bar(matplotlib.dates.date2num(pvlib_x), pvlib_y, color="#6ec8fa"))
+    template["data_artists"].append(a1.bar(matplotlib.dates.date2num(fmi_x), fmi_y, color="#303193"))
 
     # adding simulation runtime as vertical line
     v_line_max = max(max(data_pvlib["output"]), max(data_fmi["output"]))
-    a0.plot([now, now], [0, v_line_max], color="silver", linestyle='--')
+    now_number = matplotlib.dates.date2num(now)
+    template["now_line"].set_data([now_number, now_number], [0, v_line_max])
 
 
     # adding xxkWh (xx%) text to second plot
@@ -200,74 +342,41 @@ def plot_fmi_pvlib_mono(data_fmi, data_pvlib):
 
         # this mess here should make sure that kwh numbers do not overlap in bar charts. This shifts
         # text in y-axis if texts are too close
-        if i == 0:
-            a1.text(fmi_x[i], fmi_y[i] / 2, txt, ha="center", backgroundcolor="#FFFFFFd5")
+        new_y_position = fmi_y[i] / 2
         if i > 0:
             last_y_position = fmi_y[i - 1] / 2
-            new_y_position = fmi_y[i] / 2
 
             if last_y_position < new_y_position < last_y_position * 1.2:
                 new_y_position = last_y_position * 1.2
             if last_y_position > new_y_position > last_y_position * 0.8:
                 new_y_position = last_y_position * 0.8
 
-            a1.text(fmi_x[i], new_y_position, txt, ha="center", backgroundcolor="#FFFFFFd5")
-
-    # formatting plot 1 date axis
-    a0.xaxis.set_major_formatter(DateFormatter("%m-%d"))
-    a0.xaxis.set_major_locator(matplotlib.dates.DayLocator(interval=1))
-    a0.xaxis.set_minor_locator(matplotlib.dates.HourLocator(interval=4))
-    a0.xaxis.set_minor_formatter(DateFormatter("%H"))
-
-    # moves major axis to top of plot
-    a0.tick_params(axis="x", which="major", top=True, labeltop=True, bottom=False, labelbottom=False)
-
-    # shifts markers for days from midnight to near middle of power generation peaks
-    shifter = matplotlib.dates.HourLocator(byhour=10)
-    a0.xaxis.set_major_locator(shifter)
-
-    # formatting plot 2 date axis so that 2023-11-23 is shown as 11-23
-    formatter = DateFormatter("%m-%d")
-    a1.xaxis.set_major_formatter(formatter)
+        template["data_artists"].append(a1.text(matplotlib.dates.date2num(fmi_x[i]), new_y_position, txt,
+                                                ha="center", backgroundcolor="#FFFFFFd5"))
 
-    # formatting plot 2 date axis so that markers are shown only once per day
-    a1.xaxis.set_major_locator(matplotlib.dates.DayLocator(interval=1))
+    # rescaling axes to new data
+    for axes in [a0, a1]:
+        axes.relim()
+        axes.autoscale_view()
 
-    # using tight graph layout to help with data density
-    f.tight_layout()
+    # using tight graph layout to help with data density, layout is computed only once per template
+    if not template["laid_out"]:
+        template["figure"].tight_layout()
+        template["laid_out"] = True
 
     # saving plot as .png -file
 
     timestamp = timestamp.replace(":", "-")
-    savepath = (config.save_directory + config.site_name + "-" + timestamp + ".png")
-    matplotlib.pyplot.savefig(savepath)
-    print("Simulation plot saved as '" + savepath + "'")
-    print("-------------------------------------------------------------------------------------------------------")
+    savepath = (config.save_directory + site_name + "-" + timestamp + ".png")
+    template["figure"].savefig(savepath)
 
-    #matplotlib.pyplot.show()
+    return savepath
 
 
 def __get_dayily_power_sums(data, resolution=config.data_resolution):
-    df = data[["time", "output"]].copy()
-
-    df["date"] = pandas.to_datetime(df["time"]).dt.date
-
-    df = df.drop("time", axis=1)
-    df = df.groupby(["date"]).sum()
-
-    df["output_kwh"] = (df["output"] / 1000) / (60 / resolution)
-
-    xvalues = []
-    yvalues = []
-
-    for index, row in df.iterrows():
-        x_value = datetime(index.year, index.month, index.day).date()
-        # x_value = data(index.year, index.month, index.day)
-        output = round(row["output_kwh"], 1)
+    daily = energy_aggregation.daily_energy(data, resolution).round(1)
 
-        # avoiding days with zero power,
-        if output > 0:
-            xvalues.append(x_value)
-            yvalues.append(output)
+    # avoiding days with zero power,
+    daily = daily[daily > 0]
 
-    return xvalues, yvalues
+    return list(daily.index), list(daily)
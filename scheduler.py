@@ -0,0 +1,228 @@
+"""
+Event driven scheduler for fleet forecasts. Instead of running at fixed times like the cron line in run_task.sh, the
+scheduler polls FMI open data for the origin time of the latest HARMONIE model run and generates forecasts only when a
+new run has been published.
+
+The poll is a single timestep, single parameter point query which returns a few kilobytes. Its om:resultTime element
+contains the origin time of the model run. A new origin time is processed once it has stayed unchanged for the
+debounce period, which gives FMI time to publish the whole run. Sites are processed in priority order, lower
+"priority" values in the site dicts of config.sites first. Sites without priority are processed last.
+
+The latest processed origin time is stored in config.save_directory + "scheduler_state.json" so that restarting the
+scheduler does not reprocess the same run.
+
+After each run the forecasts are summed to the fleet hierarchy of config.aggregation_levels, see
+helpers/fleet_aggregation.py.
+
+Base url of the polled service is config.fmi_wfs_url, __debug_scheduler_with_mock_wfs() in __testing.py runs the
+scheduler against a local mock server.
+
+Usage:
+python scheduler.py [--poll 300] [--debounce 600] [--once]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import time
+import urllib.parse
+import urllib.request
+import xml.etree.ElementTree
+
+import pandas
+
+import config
+import get_forecast
+from helpers import fleet_aggregation
+from helpers import fmi_archive
+
+
+def get_latest_origin_time(base_url=None, latlon=None, timeout=30):
+    """
+    Queries the origin time of the latest HARMONIE model run.
+    :param base_url: WFS url, config.fmi_wfs_url by default.
+    :param latlon: Point of the query, config coordinates by default.
+    :param timeout: Request timeout in seconds.
+    :return: Origin time as a UTC pandas Timestamp, None if the query failed.
+    """
+
+    if base_url is None:
+        base_url = config.fmi_wfs_url
+    if latlon is None:
+        latlon = str(config.latitude) + "," + str(config.longitude)
+
+    now = datetime.datetime.now(datetime.timezone.utc).replace(minute=0, second=0, microsecond=0)
+    timestamp = now.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    query = urllib.parse.urlencode({"service": "WFS", "version": "2.0.0", "request": "getFeature",
+                                    "storedquery_id": "fmi::forecast::harmonie::surface::point::multipointcoverage",
+                                    "latlon": latlon, "parameters": "Temperature",
+                                    "starttime": timestamp, "endtime": timestamp})
+    try:
+        with urllib.request.urlopen(base_url + "?" + query, timeout=timeout) as response:
+            root = xml.etree.ElementTree.fromstring(response.read())
+    except Exception as e:
+        print(f"Could not query latest model run from {base_url}: {e}")
+        return None
+
+    origin_time = fmi_archive.get_origin_time(root)
+    if origin_time is not None:
+        return origin_time
+
+    print(f"No model origin time in response from {base_url}")
+    return None
+
+
+def get_sites_in_priority_order(sites=None) -> list:
+    """
+    :param sites: List of site dicts, config.sites by default.
+    :return: Sites sorted by "priority", list order is kept for sites with the same priority.
+    """
+    if sites is None:
+        sites = config.sites
+    return sorted(sites, key=lambda site: site.get("priority", float("inf")))
+
+
+def process_model_run(sites: list, day_range=3):
+    """
+    Default action of the scheduler. Generates forecasts for sites in the given order and saves them as csv files.
+    :param sites: Site dicts in priority order.
+    :param day_range: Day count, same as in get_forecast.generate_forecast().
+    """
+
+    forecasts = get_forecast.generate_fleet_forecasts(sites, day_range)
+    os.makedirs(config.save_directory, exist_ok=True)
+    for site_name, forecast in forecasts.items():
+        filename = config.save_directory + site_name + "-forecast.csv"
+        forecast.to_csv(filename, float_format="%.2f", index=False)
+        print("Saved forecast of '" + site_name + "' as: " + filename)
+
+    if get_forecast.INFLUX_IN_USE:
+        # site forecasts in kilowatts tagged with site names, aggregates below use the forecasts in watts
+        all_sites = all(site["site_name"] in forecasts for site in config.sites)
+        get_forecast.write_sites_to_influx({site_name: get_forecast.convert_to_kilowatts(forecast.copy())
+                                            for site_name, forecast in forecasts.items()}, 'pv_forecast',
+                                           all_sites=all_sites)
+
+    update_fleet_aggregates(forecasts)
+
+
+def update_fleet_aggregates(forecasts: dict):
+    """
+    Updates fleet aggregates with refreshed forecasts, see helpers/fleet_aggregation.py. Partition files of the
+    changed days are rewritten and changed aggregates are written to InfluxDB in kilowatts when InfluxDB is in use.
+    :param forecasts: Dict {site_name: forecast dataframe with endTime and output (W) columns}
+    """
+    state = fleet_aggregation.load_fleet_state()
+    if state is None:
+        state = fleet_aggregation.create_fleet_state(forecasts)
+    else:
+        state = fleet_aggregation.update_fleet_state(state, forecasts)
+    fleet_aggregation.save_fleet_state(state)
+
+    paths = fleet_aggregation.write_aggregates_to_parquet(fleet_aggregation.get_changed_aggregates(state,
+                                                                                                  whole_days=True))
+    print("Saved fleet aggregates as " + str(len(paths)) + " partition files")
+
+    if get_forecast.INFLUX_IN_USE:
+        aggregates_kw = {level: aggregates / 1000.0
+                         for level, aggregates in fleet_aggregation.get_changed_aggregates(state).items()}
+        fleet_aggregation.write_aggregates_to_influx(aggregates_kw, get_forecast.write_to_influx)
+
+
+def run_scheduler(poll_interval=300, debounce=600, action=None, sites=None, base_url=None, max_polls=None,
+                  state_file=None):
+    """
+    Polls for new model runs and calls action for each new run.
+    :param poll_interval: Seconds between polls.
+    :param debounce: Seconds a new origin time has to stay unchanged before it is processed.
+    :param action: Function called with the list of sites in priority order, process_model_run() by default.
+    :param sites: List of site dicts, config.sites by default.
+    :param base_url: WFS url, config.fmi_wfs_url by default.
+    :param max_polls: Stop after this many polls, polls forever by default.
+    :param state_file: File for the latest processed origin time, config.save_directory + "scheduler_state.json"
+    by default.
+    :return: List of processed origin times.
+    """
+
+    if action is None:
+        action = process_model_run
+    if state_file is None:
+        state_file = config.save_directory + "scheduler_state.json"
+
+    ordered_sites = get_sites_in_priority_order(sites)
+    processed_origin = __load_state(state_file)
+    processed = []
+
+    # origin time waiting for the debounce period to pass and the time it was first seen
+    pending_origin = None
+    pending_since = None
+
+    poll_count = 0
+    while max_polls is None or poll_count < max_polls:
+        if poll_count > 0:
+            time.sleep(poll_interval)
+        poll_count += 1
+
+        origin = get_latest_origin_time(base_url)
+        if origin is None or (processed_origin is not None and origin <= processed_origin):
+            continue
+
+        if origin != pending_origin:
+            print("New model run " + str(origin) + " found, processing after " + str(debounce) + " seconds")
+            pending_origin = origin
+            pending_since = time.monotonic()
+
+        if time.monotonic() - pending_since < debounce:
+            continue
+
+        print("Processing model run " + str(origin) + " for " + str(len(ordered_sites)) + " sites")
+        try:
+            action(ordered_sites)
+        except Exception as e:
+            # trying again on the next poll
+            print("Processing model run " + str(origin) + " failed: " + str(e))
+            continue
+
+        processed_origin = origin
+        processed.append(origin)
+        pending_origin = None
+        __save_state(state_file, origin)
+
+    return processed
+
+
+def __load_state(state_file: str):
+    if not os.path.exists(state_file):
+        return None
+    try:
+        with open(state_file) as file:
+            return pandas.Timestamp(json.load(file)["origin_time"])
+    except (OSError, ValueError, KeyError):
+        print("Could not read scheduler state " + state_file + ", processing the next model run")
+        return None
+
+
+def __save_state(state_file: str, origin_time):
+    directory = os.path.dirname(state_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(state_file, "w") as file:
+        json.dump({"origin_time": origin_time.isoformat()}, file)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generates fleet forecasts when a new HARMONIE model run appears.")
+    parser.add_argument("--poll", type=float, default=300, help="seconds between polls")
+    parser.add_argument("--debounce", type=float, default=600, help="seconds a new model run has to stay unchanged")
+    parser.add_argument("--once", action="store_true", help="poll once without debounce and exit")
+    args = parser.parse_args()
+
+    os.makedirs('output', exist_ok=True)
+    config.set_params_custom()
+
+    if args.once:
+        run_scheduler(args.poll, 0, max_polls=1)
+    else:
+        run_scheduler(args.poll, args.debounce)